@@ -1,15 +1,28 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, g
 from flask_cors import CORS
-import mysql.connector
-from datetime import datetime
 
+import base64
 import uuid
-from datetime import datetime
 import json
 from dotenv import load_dotenv
 import os
+import time
+from collections import Counter
+from functools import partial
 from log_manager import DistributedLogManager
-from db_helpers import get_db_connection, DB_CONFIG    
+from db_helpers import get_db_connection, get_fragment_key, get_pool, node_available, pool_stats, start_pool_maintenance, DB_CONFIG, CENTRAL_KEY, FRAGMENT_KEYS, MOVIE_COLUMNS
+from metrics import METRICS
+from coordinator import TwoPhaseCoordinator, prepare_write, prepare_statements, CONSISTENCY_LEVELS
+from location_directory import LocationDirectory
+from count_cache import CountCache
+from scatter_gather import run_on_nodes, merge_sorted_rows
+from search_index import SearchIndex
+from health_monitor import HealthMonitor
+from report_aggregates import ReportAggregates
+from replication_worker import ReplicationWorker
+from load_harness import LoadHarness
+from tracing import TransactionTrace, SlowTransactionLog
+from startup import StartupSequence
 
 load_dotenv()
 try:
@@ -20,30 +33,103 @@ except Exception as e:
     print(f"Error determining local node from environment: {e}")
     LOCAL_NODE_KEY = 'node3'
     LOCAL_NODE_ID = 3
-# Initialize Log Manager for Local Node
-try:
-    LOCAL_DB_CONN = mysql.connector.connect(**DB_CONFIG[LOCAL_NODE_KEY])
-    LOG_MANAGER = DistributedLogManager(LOCAL_NODE_ID, LOCAL_DB_CONN)
-    print(f"Log Manager initialized for {LOCAL_NODE_KEY}. Recovery startup complete.")
-except Exception as e:
-    print(f"Could not initialize Log Manager or connect to {LOCAL_NODE_KEY}: {e}")
-    LOG_MANAGER = None
+# Log Manager for the local node. Nothing below connects anywhere at import time:
+# STARTUP (end of this section) does the blocking work in the background.
+LOG_MANAGER = DistributedLogManager(LOCAL_NODE_ID)
+COORDINATOR = TwoPhaseCoordinator(LOG_MANAGER)
+
+# Span-by-span traces of the slowest recent 2PC transactions, behind /transactions/slow
+SLOW_TRANSACTIONS = SlowTransactionLog(
+    threshold_ms=float(os.environ.get('SLOW_TXN_THRESHOLD_MS', 1000)),
+    capacity=int(os.environ.get('SLOW_TXN_CAPACITY', 100)))
+COORDINATOR.add_trace_listener(SLOW_TRANSACTIONS.offer)
+
+# Retries failed / abandoned replication of this node's log, per target with backoff
+REPLICATION_WORKER = ReplicationWorker(
+    LOG_MANAGER,
+    interval=float(os.environ.get('REPLICATION_RETRY_INTERVAL', 5)),
+    batch_size=int(os.environ.get('REPLICATION_BATCH_SIZE', 500)),
+    backoff_base=float(os.environ.get('REPLICATION_BACKOFF_BASE', 2)),
+    backoff_max=float(os.environ.get('REPLICATION_BACKOFF_MAX', 300)),
+    pending_grace=float(os.environ.get('REPLICATION_PENDING_GRACE', 30)))
+
+# Which fragments hold a titleId, read off Central's primary key
+LOCATION_DIRECTORY = LocationDirectory()
+
+# COUNT(*) results of /movies filters per node, invalidated by 2PC commits
+COUNT_CACHE = CountCache(
+    ttl=float(os.environ.get('COUNT_CACHE_TTL', 60)),
+    max_entries=int(os.environ.get('COUNT_CACHE_MAX_ENTRIES', 1024)))
+COORDINATOR.add_commit_listener(COUNT_CACHE.on_commit)
+
+# Background, concurrent node health probes behind /status
+HEALTH_MONITOR = HealthMonitor(
+    DB_CONFIG,
+    interval=float(os.environ.get('HEALTH_CHECK_INTERVAL', 5)),
+    probe_timeout=float(os.environ.get('HEALTH_PROBE_TIMEOUT', 3)))
+HEALTH_MONITOR.start()
+
+# Idle pooled connections are closed, and pools topped back up to their minimum, in the background
+start_pool_maintenance(float(os.environ.get('DB_POOL_MAINTENANCE_INTERVAL', 60)))
+
+# Per-node region/types counts behind the report routes, shared by this node's worker
+# processes (recounted by one of them at a time) and moved by 2PC deltas
+REPORT_AGGREGATES = ReportAggregates(
+    DB_CONFIG, LOCAL_NODE_KEY, LOG_MANAGER.exclusive,
+    rebuild_interval=float(os.environ.get('REPORT_REBUILD_INTERVAL', 900)),
+    refresh_interval=float(os.environ.get('REPORT_REFRESH_INTERVAL', 5)))
+COORDINATOR.add_prepare_hook(REPORT_AGGREGATES.tracked)
+REPORT_AGGREGATES.start()
+
+# Index-backed title/titleId search (FULLTEXT indexes are maintained by InnoDB on commit)
+SEARCH_INDEX = SearchIndex()
+
+def _check_local_node():
+    # Open the local pool's DB_POOL_MIN_SIZE connections up front (raises if the node is down)
+    get_pool(LOCAL_NODE_KEY).warm()
+    conn = get_db_connection(LOCAL_NODE_KEY)
+    if conn is None:
+        raise ConnectionError(f"No connection available for {LOCAL_NODE_KEY}")
+    conn.close()
+
+def _recover():
+    # Replay whatever this node missed while it was down before taking writes
+    if LOG_MANAGER.recover_missed_writes() is None:
+        raise RuntimeError("another process on this node is still recovering")
+
+def _start_log_background_work():
+    # Keep shipping peers' logs, archive what every node has shipped past, retry failed replication
+    LOG_MANAGER.start_log_shipping(float(os.environ.get('RECOVERY_INTERVAL', 60)))
+    LOG_MANAGER.start_log_compaction(float(os.environ.get('LOG_COMPACTION_INTERVAL', 3600)))
+    REPLICATION_WORKER.start()
+
+# Blocking startup work, in order, on a background thread; /ready reports progress.
+# A failing step (e.g. the local node is down) is retried until it succeeds.
+STARTUP = StartupSequence(retry_interval=float(os.environ.get('STARTUP_RETRY_INTERVAL', 5)))
+STARTUP.add('local_node', _check_local_node)
+STARTUP.add('log_table', LOG_MANAGER.initialize_log_table)
+STARTUP.add('recovery', _recover)
+STARTUP.add('background_work', _start_log_background_work)
+STARTUP.start()
 
 # Initialize the Flask application
 app = Flask(__name__)
 CORS(app)
 
+# /simulate-concurrency: concurrent simulated clients against this server's own routes. Off unless
+# SIMULATION_ENABLED=1: a run switches the isolation level and fakes outages for the whole process.
+SIMULATION_ENABLED = os.environ.get('SIMULATION_ENABLED', '0') == '1'
+LOAD_HARNESS = LoadHarness(
+    app, COORDINATOR, DB_CONFIG,
+    max_duration=float(os.environ.get('SIMULATION_MAX_DURATION', 20)),
+    max_clients=int(os.environ.get('SIMULATION_MAX_CLIENTS', 64)),
+    lock=LOG_MANAGER.exclusive)
+
 
 # --- HELPER FUNCTION: Connect to DB ---
-def get_db_connection(node_key):
-    try:
-        config = DB_CONFIG[node_key]
-        conn = mysql.connector.connect(**config)
-        return conn
-    except Exception as e:
-        print(f"Error connecting to {node_key}: {e}")
-        return None
-    
+# get_db_connection now comes from db_helpers and hands out pooled connections.
+# conn.close() returns the connection to its node's pool.
+
 def execute_query(node_key, query, params=None):
     conn = get_db_connection(node_key)
     if not conn:
@@ -55,85 +141,15 @@ def execute_query(node_key, query, params=None):
         conn.commit()
         rows_affected = cursor.rowcount
         cursor.close()
-        conn.close()
         return {"success": True, "rows_affected": rows_affected}
     except Exception as e:
         return {"success": False, "error": str(e), "rows_affected": 0}
-
-def get_row_count(node_key):
-    """Get the total number of rows in a node"""
-    conn = get_db_connection(node_key)
-    if not conn:
-        return 0
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM movies")
-        count = cursor.fetchone()[0]
-        cursor.close()
+    finally:
         conn.close()
-        return count
-    except Exception as e:
-        print(f"Error counting rows in {node_key}: {e}")
-        return 0
-
-def get_last_update(node_key):
-    """Get the timestamp of the last update in a node"""
-    # TODO: Implement actual last update tracking
-    # For now, return current timestamp
-    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-# --- NEW HELPER FUNCTIONS in app.py ---
 
-def _prepare_write(node_key, query, params=None):
-    """
-    Phase 1: Executes the write query but DOES NOT commit. 
-    It holds the transaction open until final_commit_or_abort is called.
-    
-    NOTE: For simplicity, we are committing the prepare log here, but the data 
-    write is left uncommitted.
-    """
-    conn = get_db_connection(node_key)
-    if not conn:
-        return {"success": False, "error": "Connection failed"}
-    
-    try:
-        # NOTE: A real system would use a distributed transaction manager to track 
-        # this connection/transaction context. Here we rely on the connection object.
-        cursor = conn.cursor()
-        cursor.execute(query, params or ())
-        
-        rows_affected = cursor.rowcount
-        cursor.close() 
-        # Crucial: DO NOT conn.commit() here
-        
-        # Return the open connection to be managed by the calling route/coordinator
-        return {"success": True, "rows_affected": rows_affected, "connection": conn}
-    
-    except Exception as e:
-        if conn: conn.close()
-        return {"success": False, "error": str(e), "rows_affected": 0}
-
-def _final_commit_or_abort(conn, commit=True):
-    """
-    Phase 2: Performs the actual database commit or rollback based on 
-    the coordinator's global decision.
-    """
-    if not conn:
-        return {"success": False, "error": "No active connection/transaction"}
-    
-    try:
-        if commit:
-            conn.commit()
-            status = "COMMIT_SUCCESS"
-        else:
-            conn.rollback()
-            status = "ABORT_SUCCESS"
-            
-        conn.close()
-        return {"success": True, "status": status}
-    except Exception as e:
-        conn.close()
-        return {"success": False, "status": "FINAL_COMMIT_ERROR", "error": str(e)}
+# --- 2PC HELPERS ---
+# prepare_write / final_commit_or_abort and the concurrent TwoPhaseCoordinator
+# live in coordinator.py.
 
 # NOTE: The original execute_query (which calls conn.commit()) is now redundant for 
 # 2PC but is retained for old functions or read queries.    
@@ -146,111 +162,416 @@ def index():
 # ROUTE: Status with detailed information
 @app.route('/status', methods=['GET'])
 def node_status():
-    status_report = {}
-    for key in DB_CONFIG:
-        conn = get_db_connection(key)
-        if conn:
-            # TODO: Implement real-time status monitoring
-            # - Check node health
-            # - Monitor active connections
-            # - Track transaction logs
-            row_count = get_row_count(key)
-            last_update = get_last_update(key)
-            status_report[key] = {
-                "status": "ONLINE",
-                "rows": row_count,
-                "lastUpdate": last_update
-            }
-            conn.close()
+    """Answers from HEALTH_MONITOR's latest snapshot (nodes are probed concurrently in the background)."""
+    return jsonify(HEALTH_MONITOR.snapshot())
+
+# ROUTE: Readiness
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """200 once startup (local node, log table, recovery) is done, 503 with its progress until then."""
+    return jsonify(STARTUP.status()), 200 if STARTUP.ready else 503
+
+def _not_ready():
+    return jsonify({"error": "Node is still starting up (see /ready).", **STARTUP.status()}), 503
+
+# --- Request Metrics (per route latency, see /metrics) ---
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.monotonic()
+    METRICS.gauge_add('http_requests_in_flight', 1)
+
+@app.after_request
+def _remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def _record_request(exc):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    METRICS.gauge_add('http_requests_in_flight', -1)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.observe('http_request_seconds', time.monotonic() - started, route=route, method=request.method)
+    status = 500 if exc is not None else g.pop('response_status', 500)
+    METRICS.inc('http_responses_total', route=route, status=f"{status // 100}xx")
+
+# ROUTE: Metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Everything recorded in-process since startup: per-route request latency,
+    2PC phase latency per participant node (checkout, prepare, ready_log,
+    global_log, commit), connect latency and failures per node, log flush / append-wait
+    latency, and in-flight transactions and requests. ?format=prometheus
+    returns the Prometheus text format instead of JSON.
+    """
+    if request.args.get('format') == 'prometheus':
+        return Response(METRICS.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify({
+        **METRICS.snapshot(),
+        "pools": pool_stats(),
+        "log_writer": LOG_MANAGER.log_writer.stats(),
+    })
+
+# ROUTE: Replication backlog per target node
+@app.route('/replication', methods=['GET'])
+def replication_status():
+    """Queue depth and lag of this node's replication rows, per target node."""
+    if not STARTUP.ready:
+        return _not_ready()
+    return jsonify(REPLICATION_WORKER.stats())
+
+# ROUTE: Slow 2PC transactions
+@app.route('/transactions/slow', methods=['GET'])
+def slow_transactions():
+    """
+    The most recent transactions that took at least SLOW_TXN_THRESHOLD_MS,
+    newest first, each with its spans (per phase and participant) and logs.
+    Optional: ?limit=N, ?min_ms=X to raise the bar further.
+    """
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        min_ms = float(request.args['min_ms']) if 'min_ms' in request.args else None
+    except ValueError:
+        return jsonify({"error": "limit must be an integer and min_ms a number."}), 400
+    return jsonify({
+        **SLOW_TRANSACTIONS.stats(),
+        "transactions": SLOW_TRANSACTIONS.recent(limit=limit, min_ms=min_ms),
+    })
+
+# --- HELPERS: /movies pagination ---
+
+def _encode_cursor(row, node_key):
+    """Opaque keyset token: the (titleId, ordering) of the last row served and the node it came from."""
+    payload = json.dumps({"k": [row['titleId'], row['ordering']], "n": node_key}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    title_id, ordering = payload['k']
+    node_key = payload['n']
+    if node_key not in DB_CONFIG and node_key != 'cluster':
+        raise ValueError("unknown node in cursor")
+    return (title_id, ordering), node_key
+
+def _estimate_count(cursor, where_clause, params):
+    """
+    Fast approximate row count from the optimizer instead of a scan: table
+    statistics when there is no filter, EXPLAIN's rows x filtered% otherwise.
+    """
+    if not params:
+        cursor.execute(
+            "SELECT TABLE_ROWS AS total FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'movies'")
+        row = cursor.fetchone()
+        return int(row['total'] or 0) if row else 0
+    cursor.execute(f"EXPLAIN SELECT * FROM movies {where_clause}", params)
+    row = cursor.fetchone() or {}
+    cursor.fetchall()
+    return int((row.get('rows') or 0) * float(row.get('filtered') or 100) / 100)
+
+def _count_rows(cursor, node_key, where_clause, params, count_mode, filter_key):
+    """Returns (total, is_estimate). Exact counts are served from COUNT_CACHE when possible."""
+    cached = COUNT_CACHE.get(node_key, filter_key)
+    if cached is not None:
+        return cached, False
+    if count_mode == 'estimate':
+        return _estimate_count(cursor, where_clause, params), True
+
+    generation = COUNT_CACHE.generation(node_key)
+    cursor.execute(f"SELECT COUNT(*) as total FROM movies {where_clause}", params)
+    total = cursor.fetchone()['total']
+    COUNT_CACHE.put(node_key, filter_key, total, generation)
+    return total, False
+
+def _fetch_page(node_key, where_clause, params, limit, offset=0, after=None, keyset=False,
+                count_mode='exact', filter_key=()):
+    """
+    Reads one page of movies from a node. Returns None if the node is unreachable.
+
+    Offset mode uses LIMIT/OFFSET. Keyset mode orders by (titleId, ordering) and
+    starts strictly after the `after` key, so the (titleId, ordering) primary key
+    index serves every page in O(limit) no matter how deep it is.
+
+    count_mode is 'exact' (cached COUNT(*)), 'estimate' (optimizer estimate) or 'none'.
+    """
+    conn = get_db_connection(node_key)
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        total, total_is_estimate = None, False
+        if count_mode != 'none':
+            total, total_is_estimate = _count_rows(cursor, node_key, where_clause, params, count_mode, filter_key)
+
+        if keyset:
+            page_where, page_params = where_clause, list(params)
+            if after is not None:
+                page_where += " AND (titleId > %s OR (titleId = %s AND ordering > %s))"
+                page_params += [after[0], after[0], after[1]]
+            # One extra row tells us whether another page exists
+            cursor.execute(
+                f"SELECT * FROM movies {page_where} ORDER BY titleId, ordering LIMIT %s",
+                page_params + [limit + 1])
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
         else:
-            status_report[key] = {
-                "status": "OFFLINE",
-                "rows": 0,
-                "lastUpdate": "N/A"
-            }
-    return jsonify(status_report)
+            cursor.execute(f"SELECT * FROM movies {where_clause} LIMIT %s OFFSET %s", list(params) + [limit, offset])
+            rows = cursor.fetchall()
+            has_more = None
+        cursor.close()
+        return {"rows": rows, "total": total, "total_is_estimate": total_is_estimate, "has_more": has_more}
+    finally:
+        conn.close()
+
+def _movie_sort_key(row):
+    return (row['titleId'], row['ordering'])
+
+def _scatter_gather_page(node_keys, where_clause, params, limit, offset=0, after=None, keyset=False,
+                         count_mode='exact', filter_key=()):
+    """
+    Sends the filtered query to every node in node_keys at the same time, then
+    merges the partial results in (titleId, ordering) order and applies the
+    global LIMIT/OFFSET (or keyset window) once. Each node only has to return
+    its first offset + limit matches, so the cost is that of the slowest node.
+
+    Returns None if any node is unreachable, since the merged page would then
+    silently miss rows.
+    """
+    window = limit if keyset else offset + limit
+    partials = run_on_nodes(node_keys, lambda node_key: _fetch_page(
+        node_key, where_clause, params, window, 0, after, True, count_mode, filter_key))
+    if any(partial is None for partial in partials.values()):
+        return None
+
+    merged = merge_sorted_rows([partial['rows'] for partial in partials.values()], _movie_sort_key)
+    rows = merged[:limit] if keyset else merged[offset:offset + limit]
+    has_more = len(merged) > window or any(partial['has_more'] for partial in partials.values())
+
+    totals = [partial['total'] for partial in partials.values()]
+    page_keys = {_movie_sort_key(row) for row in rows}
+    return {
+        "rows": rows,
+        "total": None if None in totals else sum(totals),
+        "total_is_estimate": any(partial['total_is_estimate'] for partial in partials.values()),
+        "has_more": has_more,
+        "contributing_nodes": sorted(
+            node_key for node_key, partial in partials.items()
+            if any(_movie_sort_key(row) in page_keys for row in partial['rows'])),
+    }
 
 # ROUTE: Read / Search with filters and pagination
 @app.route('/movies', methods=['GET'])
 def get_movies():
+    """
+    Two pagination modes:
+    - offset (default): ?offset=&limit=, the total is counted on every page.
+    - keyset: ?paging=keyset&limit=, then ?after=<next_after of the previous page>.
+      Each page costs O(limit). The total is only counted on the first page, and
+      the cursor remembers which node served it so later pages stay on that node.
+    title and titleId substring/prefix filters go through SEARCH_INDEX (ngram
+    FULLTEXT when the nodes have it, see search_index.py).
+
+    count=exact (default) returns a cached COUNT(*), count=estimate a fast
+    optimizer estimate, and count=none skips the total entirely.
+
+    scope=cluster searches all relevant fragments concurrently (scatter-gather)
+    instead of one node. A fragment search that finds nothing does the same
+    with the remaining fragments, falling back to Central only if one of them
+    is unreachable.
+    """
     # Get query parameters
     offset = int(request.args.get('offset', 0))
     limit = int(request.args.get('limit', 100))
+    after_token = request.args.get('after', '')
+    keyset = request.args.get('paging', 'offset') == 'keyset' or bool(after_token)
+    count_mode = request.args.get('count', 'exact')
     
     # Filter parameters
     title_id = request.args.get('titleId', '')
+    # titleIdMatch / titleMatch: contains (default), prefix; titleIdMatch=exact looks up one key
+    title_id_match = request.args.get('titleIdMatch', 'contains')
+    title_id_exact = title_id_match == 'exact'
     title = request.args.get('title', '')
+    title_match = request.args.get('titleMatch', 'contains')
     region = request.args.get('region', '')
+    searching = bool(title_id or title or region)
 
     # Node selection
     requested_node = request.args.get('node', 'node1')
     if requested_node not in DB_CONFIG:
         requested_node = 'node1'
+    scope = request.args.get('scope', 'node')
+
+    after = None
+    if after_token:
+        try:
+            after, cursor_node = _decode_cursor(after_token)
+        except Exception:
+            return jsonify({"error": "Invalid 'after' cursor."}), 400
 
     # Build Query
     where_clause = " WHERE 1=1" 
     params = []
-    if title_id:
-        where_clause += " AND titleId LIKE %s"
-        params.append(f"%{title_id}%")
+    if title_id and title_id_exact:
+        where_clause += " AND titleId = %s"
+        params.append(title_id)
+    elif title_id:
+        condition, condition_params = SEARCH_INDEX.condition('titleId', title_id, title_id_match)
+        where_clause += condition
+        params += condition_params
     if title:
-        where_clause += " AND title LIKE %s"
-        params.append(f"%{title}%")
+        condition, condition_params = SEARCH_INDEX.condition('title', title, title_match)
+        where_clause += condition
+        params += condition_params
     if region:
         where_clause += " AND region LIKE %s"
         params.append(f"%{region}%")
 
-    # 2. STRATEGY: Check Local Node First
-    target_node = requested_node
-    conn = get_db_connection(target_node)
-    
-    rows = []
-    total_count = 0
-    source = target_node
+    # Total only where it is asked for: never with count=none, only on page one in keyset mode
+    if count_mode not in ('exact', 'estimate', 'none'):
+        count_mode = 'exact'
+    page_count_mode = count_mode if after is None else 'none'
+    filter_key = COUNT_CACHE.normalize({
+        f'titleId:{title_id_match}': title_id, f'title:{title_match}': title, 'region': region})
 
-    # If connection works, try to fetch
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        # Count
-        cursor.execute(f"SELECT COUNT(*) as total FROM movies {where_clause}", params)
-        total_count = cursor.fetchone()['total']
-        
-        # If local node has data OR if no filters are applied (browsing mode), use local
-        # If local has 0 results BUT filters are applied, we might be looking for data in another node
-        if total_count > 0 or (not title_id and not title and not region):
-            cursor.execute(f"SELECT * FROM movies {where_clause} LIMIT %s OFFSET %s", params + [limit, offset])
-            rows = cursor.fetchall()
-            conn.close()
+    page = None
+    served_node = requested_node
+    source = requested_node
+    skipped_nodes = []
+
+    def candidate_fragments():
+        """Fragments that can hold a match (an exact titleId narrows it to the ones Central says hold it)."""
+        if not title_id_exact:
+            return list(FRAGMENT_KEYS)
+        owning = LOCATION_DIRECTORY.owners(title_id)
+        return [key for key in FRAGMENT_KEYS if key in owning]
+
+    def scatter(node_keys):
+        return _scatter_gather_page(node_keys, where_clause, params, limit, offset, after, keyset,
+                                    page_count_mode, filter_key)
+
+    if after is not None and cursor_node == 'cluster':
+        # 1a. Later keyset pages of a scatter-gather search scatter again
+        page = scatter(FRAGMENT_KEYS)
+        served_node, source = 'cluster', 'cluster (Scatter-Gather)'
+    elif after is not None:
+        # 1b. Later keyset pages continue on the node that served the first one
+        served_node = source = cursor_node
+        page = _fetch_page(served_node, where_clause, params, limit, offset, after, keyset, page_count_mode, filter_key)
+    elif scope == 'cluster':
+        # 2a. STRATEGY: Ask every relevant fragment at once
+        candidates = candidate_fragments()
+        skipped_nodes = [key for key in FRAGMENT_KEYS if key not in candidates]
+        down = [key for key in candidates if not node_available(key)]
+        if not down:
+            page = scatter(candidates)
+            served_node, source = 'cluster', 'cluster (Scatter-Gather)'
+        else:
+            # A fragment with an open circuit breaker would fail the scatter; Central holds its rows too
+            print(f"{', '.join(down)} unreachable (circuit open). Reading from Central instead...")
+            skipped_nodes += down
+            page = _fetch_page('node1', where_clause, params, limit, offset, after, keyset, page_count_mode, filter_key)
+            served_node, source = 'node1', 'node1 (Fallback)'
+    else:
+        # 2b. STRATEGY: Check Local Node First
+        search_elsewhere = False
+        requested_down = not node_available(requested_node)
+
+        if requested_down:
+            # Don't wait on a node whose circuit breaker is open: reroute straight away
+            print(f"{requested_node} is unreachable (circuit open). Rerouting...")
+            skipped_nodes.append(requested_node)
+            search_elsewhere = True
         else:
-            # Local returned 0 results, but we are searching. 
-            # 3. STRATEGY: Fallback to Central (Node 1) if we are on a fragment
-            conn.close()
-            if requested_node != 'node1':
-                print(f"Search on {requested_node} yielded 0 results. Checking Central...")
-                conn_central = get_db_connection('node1')
-                if conn_central:
-                    cursor_central = conn_central.cursor(dictionary=True)
-                    cursor_central.execute(f"SELECT COUNT(*) as total FROM movies {where_clause}", params)
-                    total_count = cursor_central.fetchone()['total']
-                    cursor_central.execute(f"SELECT * FROM movies {where_clause} LIMIT %s OFFSET %s", params + [limit, offset])
-                    rows = cursor_central.fetchall()
-                    conn_central.close()
-                    source = 'node1 (Fallback)'
+            page = _fetch_page(requested_node, where_clause, params, limit, offset, None, keyset, page_count_mode, filter_key)
+            if page is None:
+                # The node failed this read: serve it from where its rows also live
+                print(f"{requested_node} did not answer. Rerouting...")
+                skipped_nodes.append(requested_node)
+                requested_down = search_elsewhere = True
+            elif searching and requested_node != 'node1':
+                if page['total'] is not None and not page['total_is_estimate']:
+                    local_empty = page['total'] == 0
+                else:
+                    local_empty = not page['rows'] and offset == 0
+                # If local has 0 results BUT filters are applied, we might be looking for data in another node
+                if local_empty:
+                    print(f"Search on {requested_node} yielded 0 results. Checking the other fragments...")
+                    search_elsewhere = True
+
+        if search_elsewhere:
+            # 3. STRATEGY: Scatter-gather over the fragments not searched yet
+            others = [key for key in candidate_fragments() if key != requested_node]
+            # A down fragment's rows are all on Central, and a down fragment among others would fail the scatter
+            if (requested_down and requested_node != 'node1') or not all(node_available(key) for key in others):
+                others = []
+            gathered = scatter(others) if others else None
+            if gathered is not None:
+                page = gathered
+                served_node = 'cluster' if len(others) > 1 else others[0]
+                source = f"{'+'.join(others)} (Scatter-Gather)"
+            else:
+                # 4. STRATEGY: Fallback to Central (Node 1), which holds every row
+                central_page = _fetch_page('node1', where_clause, params, limit, offset, None, keyset, page_count_mode, filter_key)
+                if central_page is not None:
+                    page = central_page
+                    served_node, source = 'node1', 'node1 (Fallback)'
+
+    rows = page['rows'] if page else []
+    total_count = page['total'] if page else (0 if page_count_mode != 'none' else None)
+    next_after = None
+    if keyset and page and page['has_more'] and rows:
+        next_after = _encode_cursor(rows[-1], served_node)
 
     return jsonify({
         "data": rows,
         "total": total_count,
-        "source_node": source
+        "total_is_estimate": bool(page and page['total_is_estimate']),
+        "source_node": source,
+        "skipped_nodes": skipped_nodes,
+        "contributing_nodes": page.get('contributing_nodes', [served_node] if rows else []) if page else [],
+        "next_after": next_after
     })
 
+# --- Write Consistency ---
+# ALL waits for every participant, QUORUM for Central plus a majority, ASYNC only
+# for Central and the owning fragment (see TwoPhaseCoordinator).
+WRITE_CONSISTENCY = os.environ.get('WRITE_CONSISTENCY', 'ALL').upper()
+
+def _write_consistency(data):
+    """The request's ?consistency= (or body field), else the deployment default. None if unknown."""
+    level = str(request.args.get('consistency', data.get('consistency') or WRITE_CONSISTENCY)).upper()
+    return level if level in CONSISTENCY_LEVELS else None
+
+def _consistency_error():
+    return jsonify({"error": f"Unknown consistency level; use one of {', '.join(CONSISTENCY_LEVELS)}."}), 400
+
+def _synchronous_participants(consistency, owning):
+    """For ASYNC update/delete: Central plus the fragments that actually hold the row."""
+    return {CENTRAL_KEY} | owning if consistency == 'ASYNC' else None
+
+def _keyed_prepare_tasks(participants, placement, query, params):
+    """prepare_write tasks for an update/delete; Central's re-checks placement under lock (see LocationDirectory)."""
+    prepare_tasks = {p_key: partial(prepare_write, p_key, query, params) for p_key in participants}
+    prepare_tasks[CENTRAL_KEY] = partial(LOCATION_DIRECTORY.prepare_locked, placement, prepare_tasks[CENTRAL_KEY])
+    return prepare_tasks
+
 # ROUTE: Insert (Corrected 2PC Implementation)
 @app.route('/insert', methods=['POST'])
 def insert_movie():
     # ... (Initialization, data setup, query, and partition logic remains the same) ...
-    if not LOG_MANAGER:
-        return jsonify({"error": "Distributed Log Manager not initialized."}), 500
+    if not STARTUP.ready:
+        return _not_ready()
 
     data = request.json
+    consistency = _write_consistency(data)
+    if consistency is None:
+        return _consistency_error()
 
     txn_id = str(uuid.uuid4())
     record_key = data.get('titleId')
@@ -289,20 +610,7 @@ def insert_movie():
     """
 
     # Determine Correct Partition
-    target_region = data.get('region')
-    correct_fragment_key = 'node3' 
-    correct_fragment_id = 3
-    if target_region in ['US', 'JP']: 
-        correct_fragment_key = 'node2'
-        correct_fragment_id = 2
-
-    # logs for CONSOLE output
-    logs = []
-    # Determine Correct Partition
-    target_region = data.get('region')
-    correct_fragment_key = 'node3' 
-    if target_region in ['US', 'JP']: 
-        correct_fragment_key = 'node2'
+    correct_fragment_key = get_fragment_key(data.get('region'))
 
     # --- 1. IDENTIFY ALL PARTICIPANTS (REQUIRED STEP FOR 2PC) ---
     participants = set()
@@ -314,62 +622,20 @@ def insert_movie():
     participants.add(correct_fragment_key)
 
     logs = []
-    active_connections = {}
-    all_ready = True
-    
-    # ------------------------------------------------------------------
-    # PHASE 1: PREPARE AND LOG READY STATUS (THE LOOP)
-    # ------------------------------------------------------------------
-    try:
-        # Coordinator logs PREPARE START
-        LOG_MANAGER.log_prepare_start(txn_id)
-        logs.append("Coordinator: Logged PREPARE START.")
-        
-        # --- THE REQUIRED LOOP ITERATING OVER ALL PARTICIPANTS ---
-        for p_key in participants:
-            # --- 1. Perform DB Write (NO COMMIT) ---
-            # This is the request sent from the coordinator to the participant
-            res_prepare = _prepare_write(p_key, query, params) # <-- CALL HERE!
-            
-            if res_prepare['success']:
-                # 2. Log READY status (Coordinator logs success status for this participant)
-                LOG_MANAGER.log_ready_status(txn_id, 'INSERT', record_key, new_value)
-                logs.append(f"{p_key}: Prepared write & Logged READY_COMMIT (Transaction held).")
-                active_connections[p_key] = res_prepare['connection'] # Save the open connection
-            else:
-                # One participant failed to prepare. Global abort is inevitable.
-                logs.append(f"{p_key}: Failed to Prepare: {res_prepare.get('error')}. ABORTING.")
-                all_ready = False
-                # Immediately close failed connection
-                if 'connection' in res_prepare: _final_commit_or_abort(res_prepare['connection'], commit=False)
-                break
-        
-    except Exception as e:
-        all_ready = False
-        logs.append(f"CRITICAL FAILURE during PREPARE phase: {e}")
 
-    # ------------------------------------------------------------------
-    # PHASE 2: GLOBAL COMMIT/ABORT DECISION (THE SECOND LOOP)
-    # ------------------------------------------------------------------
-    final_decision = all_ready
-    
-    # 1. Coordinator logs GLOBAL_COMMIT/ABORT (The irrevocable decision)
-    log_res = LOG_MANAGER.log_global_commit(txn_id, commit=final_decision)
-    if not log_res['success']:
-        # This is a critical logging failure. Must force abort.
-        final_decision = False 
-        logs.append("CRITICAL: Global Log Failure. FORCING ABORT.")
-        
-    # 2. Coordinator sends final commit/abort signal to all open connections
-    # --- THE REQUIRED LOOP FOR FINAL EXECUTION ---
-    for node_key, conn in active_connections.items():
-        commit_res = _final_commit_or_abort(conn, commit=final_decision) # <-- CALL HERE!
-        logs.append(f"{node_key}: Final Decision - {'COMMIT' if final_decision else 'ABORT'} ({commit_res['status']})")
+    # --- 2. RUN BOTH 2PC PHASES AGAINST ALL PARTICIPANTS CONCURRENTLY ---
+    prepare_tasks = {p_key: partial(prepare_write, p_key, query, params) for p_key in participants}
+    trace = TransactionTrace(txn_id)
+    final_decision = COORDINATOR.run(txn_id, prepare_tasks, ('INSERT', record_key, new_value), logs,
+                                     consistency=consistency, synchronous={'node1', correct_fragment_key},
+                                     trace=trace)
         
     return jsonify({
         "message": "Transaction Processed via 2PC", 
         "decision": "COMMITTED" if final_decision else "ABORTED",
+        "consistency": consistency,
         "logs": logs,
+        "trace": trace.to_dict(),
         "txn_id": txn_id
     })
 
@@ -377,12 +643,14 @@ def insert_movie():
 # ROUTE: Update (Refactored for 2PC)
 @app.route('/update', methods=['POST'])
 def update_movie():
-    # Ensure the LOG_MANAGER is available (from global instantiation)
-    if not LOG_MANAGER:
-        return jsonify({"error": "Distributed Log Manager not initialized."}), 500
+    # Writes wait until startup (log table, recovery) is done
+    if not STARTUP.ready:
+        return _not_ready()
 
     data = request.json
-    current_node = request.args.get('node', data.get('node', 'node1'))
+    consistency = _write_consistency(data)
+    if consistency is None:
+        return _consistency_error()
     
     # 1. Transaction Setup & Log Data Preparation
     txn_id = str(uuid.uuid4()) 
@@ -408,68 +676,24 @@ def update_movie():
     participants = set()
     # Central node always participates (or is the entry point)
     participants.add('node1') 
-    # Both fragment nodes must participate in an UPDATE, as the location is unknown
-    participants.add('node2') 
-    participants.add('node3')
-    
-    # Add the current coordinator node if it's not already in the set (it will be)
-    participants.add(current_node)
-
-    active_connections = {}
-    all_ready = True
-    
-    # ------------------------------------------------------------------
-    # PHASE 1: PREPARE AND LOG READY STATUS (THE LOOP)
-    # ------------------------------------------------------------------
-    try:
-        # Coordinator logs PREPARE START
-        LOG_MANAGER.log_prepare_start(txn_id)
-        logs.append("Coordinator: Logged PREPARE START.")
-        
-        # --- THE REQUIRED LOOP ITERATING OVER ALL PARTICIPANTS ---
-        for p_key in participants:
-            # --- 1. Perform DB Write (NO COMMIT) ---
-            # NOTE: We use the prepare_write helper (which manages the connection)
-            res_prepare = _prepare_write(p_key, query, params)
-            
-            if res_prepare['success']:
-                # 2. Log READY status on the coordinator's log for each successful prepare
-                LOG_MANAGER.log_ready_status(txn_id, 'UPDATE', record_key, new_value)
-                logs.append(f"{p_key}: Prepared write & Logged READY_COMMIT (Transaction held).")
-                active_connections[p_key] = res_prepare['connection'] # Save the open connection
-            else:
-                # One participant failed to prepare. Global abort is inevitable.
-                logs.append(f"{p_key}: Failed to Prepare: {res_prepare.get('error')}. ABORTING.")
-                all_ready = False
-                # Immediately close failed connection
-                if 'connection' in res_prepare: _final_commit_or_abort(res_prepare['connection'], commit=False)
-                break
-        
-    except Exception as e:
-        all_ready = False
-        logs.append(f"CRITICAL FAILURE during PREPARE phase: {e}")
+    # Only the fragment(s) holding the row take part
+    placement = LOCATION_DIRECTORY.locate([title_id])
+    participants.update(placement[title_id])
 
-    # ------------------------------------------------------------------
-    # PHASE 2: GLOBAL COMMIT/ABORT DECISION (THE SECOND LOOP)
-    # ------------------------------------------------------------------
-    final_decision = all_ready
-    
-    # 1. Coordinator logs GLOBAL_COMMIT/ABORT (The irrevocable decision)
-    log_res = LOG_MANAGER.log_global_commit(txn_id, commit=final_decision)
-    if not log_res['success']:
-        # This is a critical logging failure. Must force abort.
-        final_decision = False 
-        logs.append("CRITICAL: Global Log Failure. FORCING ABORT.")
-        
-    # 2. Coordinator sends final commit/abort signal to all open connections
-    for node_key, conn in active_connections.items():
-        commit_res = _final_commit_or_abort(conn, commit=final_decision)
-        logs.append(f"{node_key}: Final Decision - {'COMMIT' if final_decision else 'ABORT'} ({commit_res['status']})")
+    # --- 2. RUN BOTH 2PC PHASES AGAINST ALL PARTICIPANTS CONCURRENTLY ---
+    prepare_tasks = _keyed_prepare_tasks(participants, placement, query, params)
+    trace = TransactionTrace(txn_id)
+    final_decision = COORDINATOR.run(txn_id, prepare_tasks, ('UPDATE', record_key, new_value), logs,
+                                     consistency=consistency,
+                                     synchronous=_synchronous_participants(consistency, placement[title_id]),
+                                     trace=trace)
         
     return jsonify({
         "message": "Update Processed via 2PC", 
         "decision": "COMMITTED" if final_decision else "ABORTED",
+        "consistency": consistency,
         "logs": logs,
+        "trace": trace.to_dict(),
         "txn_id": txn_id
     })
     
@@ -477,12 +701,14 @@ def update_movie():
 # ROUTE: Delete (Refactored for 2PC)
 @app.route('/delete', methods=['POST'])
 def delete_movie():
-    # Ensure the LOG_MANAGER is available
-    if not LOG_MANAGER:
-        return jsonify({"error": "Distributed Log Manager not initialized."}), 500
+    # Writes wait until startup (log table, recovery) is done
+    if not STARTUP.ready:
+        return _not_ready()
 
     data = request.json
-    current_node = request.args.get('node', data.get('node', 'node1'))
+    consistency = _write_consistency(data)
+    if consistency is None:
+        return _consistency_error()
     
     # 1. Transaction Setup & Log Data Preparation
     txn_id = str(uuid.uuid4())
@@ -501,184 +727,322 @@ def delete_movie():
     participants = set()
     # Central node always participates
     participants.add('node1') 
-    # Both fragment nodes must participate in a DELETE to ensure the record is removed everywhere
-    participants.add('node2') 
-    participants.add('node3')
-    
-    # The coordinating node must also be in the set
-    participants.add(current_node)
-
-    active_connections = {}
-    all_ready = True
-    
-    # ------------------------------------------------------------------
-    # PHASE 1: PREPARE AND LOG READY STATUS (THE LOOP)
-    # ------------------------------------------------------------------
-    try:
-        # Coordinator logs PREPARE START
-        LOG_MANAGER.log_prepare_start(txn_id)
-        logs.append("Coordinator: Logged PREPARE START.")
-        
-        # --- THE REQUIRED LOOP ITERATING OVER ALL PARTICIPANTS ---
-        for p_key in participants:
-            # --- 1. Perform DB Write (NO COMMIT) ---
-            # This executes the DELETE statement but holds the transaction open
-            res_prepare = _prepare_write(p_key, query, params)
-            
-            if res_prepare['success']:
-                # 2. Log READY status on the coordinator's log for each successful prepare
-                LOG_MANAGER.log_ready_status(txn_id, 'DELETE', record_key, new_value)
-                logs.append(f"{p_key}: Prepared delete & Logged READY_COMMIT (Transaction held).")
-                active_connections[p_key] = res_prepare['connection'] # Save the open connection
-            else:
-                # One participant failed to prepare. Global abort is inevitable.
-                logs.append(f"{p_key}: Failed to Prepare: {res_prepare.get('error')}. ABORTING.")
-                all_ready = False
-                # Immediately close failed connection
-                if 'connection' in res_prepare: _final_commit_or_abort(res_prepare['connection'], commit=False)
-                break
-        
-    except Exception as e:
-        all_ready = False
-        logs.append(f"CRITICAL FAILURE during PREPARE phase: {e}")
+    # Only the fragment(s) holding the row take part
+    placement = LOCATION_DIRECTORY.locate([title_id])
+    participants.update(placement[title_id])
 
-    # ------------------------------------------------------------------
-    # PHASE 2: GLOBAL COMMIT/ABORT DECISION (THE SECOND LOOP)
-    # ------------------------------------------------------------------
-    final_decision = all_ready
-    
-    # 1. Coordinator logs GLOBAL_COMMIT/ABORT (The irrevocable decision)
-    log_res = LOG_MANAGER.log_global_commit(txn_id, commit=final_decision)
-    if not log_res['success']:
-        # This is a critical logging failure. Must force abort.
-        final_decision = False 
-        logs.append("CRITICAL: Global Log Failure. FORCING ABORT.")
-        
-    # 2. Coordinator sends final commit/abort signal to all open connections
-    for node_key, conn in active_connections.items():
-        commit_res = _final_commit_or_abort(conn, commit=final_decision)
-        logs.append(f"{node_key}: Final Decision - {'COMMIT' if final_decision else 'ABORT'} ({commit_res['status']})")
+    # --- 2. RUN BOTH 2PC PHASES AGAINST ALL PARTICIPANTS CONCURRENTLY ---
+    prepare_tasks = _keyed_prepare_tasks(participants, placement, query, params)
+    trace = TransactionTrace(txn_id)
+    final_decision = COORDINATOR.run(txn_id, prepare_tasks, ('DELETE', record_key, new_value), logs, action='delete',
+                                     consistency=consistency,
+                                     synchronous=_synchronous_participants(consistency, placement[title_id]),
+                                     trace=trace)
         
     return jsonify({
         "message": "Delete Processed via 2PC", 
         "decision": "COMMITTED" if final_decision else "ABORTED",
+        "consistency": consistency,
         "logs": logs,
+        "trace": trace.to_dict(),
         "txn_id": txn_id
     })
     
+# ROUTE: Batch (many INSERT/UPDATE/DELETE operations in ONE 2PC transaction)
+BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 1000))
+
+BATCH_SQL = {
+    'INSERT': """
+        INSERT INTO movies 
+        (titleId, ordering, title, region, language, types, attributes, isOriginalTitle) 
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    'UPDATE': "UPDATE movies SET title = %s, ordering = %s WHERE titleId = %s",
+    'DELETE': "DELETE FROM movies WHERE titleId = %s",
+}
+
+def _batch_row(op):
+    """Statement parameters for one batch operation (same shape as the single-row routes)."""
+    if op['op'] == 'INSERT':
+        return tuple(op.get(col) for col in MOVIE_COLUMNS)
+    if op['op'] == 'UPDATE':
+        return (op.get('title'), op.get('ordering'), op['titleId'])
+    return (op['titleId'],)
+
+def _batch_after_image(op):
+    """The REDO payload logged for one batch operation."""
+    if op['op'] == 'INSERT':
+        return {col: op.get(col) for col in MOVIE_COLUMNS}
+    if op['op'] == 'UPDATE':
+        return {'titleId': op['titleId'], 'ordering': op.get('ordering'), 'title': op.get('title')}
+    return {"action": "DELETE", "titleId": op['titleId']}
+
+def _batch_statements(ops):
+    """
+    Turns an ordered list of operations into (query, rows) pairs for executemany().
+    Consecutive operations of the same type share one statement; the order of the
+    runs is kept so e.g. an INSERT followed by a DELETE of the same row still works.
+    """
+    statements = []
+    for op in ops:
+        if statements and statements[-1][0] == op['op']:
+            statements[-1][1].append(_batch_row(op))
+        else:
+            statements.append((op['op'], [_batch_row(op)]))
+    return [(BATCH_SQL[op_type], rows) for op_type, rows in statements]
+
+@app.route('/batch', methods=['POST'])
+def batch_movies():
+    """
+    Applies a list of operations as a single 2PC transaction:
+        {"operations": [{"op": "INSERT", "titleId": ..., ...},
+                        {"op": "UPDATE", "titleId": ..., "title": ..., "ordering": ...},
+                        {"op": "DELETE", "titleId": ...}]}
+    Every operation goes to Central (node1). INSERTs also go to the fragment that
+    owns their region; UPDATEs and DELETEs go to the fragment(s) holding the
+    titleId (see LocationDirectory).
+    Each participant runs its share with executemany() and gets ONE READY record.
+    """
+    if not STARTUP.ready:
+        return _not_ready()
+
+    data = request.json or {}
+    operations = data.get('operations') or []
+
+    if not operations:
+        return jsonify({"error": "No operations given."}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({"error": f"A batch may hold at most {BATCH_MAX_OPERATIONS} operations."}), 400
+
+    ops = []
+    for i, raw_op in enumerate(operations):
+        op = dict(raw_op)
+        op['op'] = str(op.get('op', '')).upper()
+        if op['op'] not in BATCH_SQL or not op.get('titleId'):
+            return jsonify({"error": f"Operation #{i} needs an op of INSERT/UPDATE/DELETE and a titleId."}), 400
+        ops.append(op)
+
+    txn_id = str(uuid.uuid4())
+    logs = []
+
+    # --- 1. GROUP OPERATIONS BY PARTICIPANT (same partition rule as /insert) ---
+    ops_by_node = {'node1': list(ops)}
+    placement = LOCATION_DIRECTORY.locate([op['titleId'] for op in ops if op['op'] != 'INSERT'])
+    located = {title_id: set(fragments) for title_id, fragments in placement.items()}
+    for op in ops:
+        if op['op'] == 'INSERT':
+            targets = [get_fragment_key(op.get('region'))]
+            # Later operations on the key in this batch reach the row it just inserted
+            located.setdefault(op['titleId'], set()).update(targets)
+        else:
+            targets = sorted(located[op['titleId']])
+        for node_key in targets:
+            ops_by_node.setdefault(node_key, []).append(op)
+
+    prepare_tasks = {}
+    ready_records = {}
+    for node_key, node_ops in ops_by_node.items():
+        prepare_tasks[node_key] = partial(prepare_statements, node_key, _batch_statements(node_ops))
+        if node_key == CENTRAL_KEY and placement:
+            prepare_tasks[node_key] = partial(LOCATION_DIRECTORY.prepare_locked,
+                                              {title_id: located[title_id] for title_id in placement},
+                                              prepare_tasks[node_key])
+        ready_records[node_key] = ('BATCH', None, {
+            "operations": [
+                {"operation_type": op['op'], "record_key": op['titleId'], "new_value": _batch_after_image(op)}
+                for op in node_ops
+            ]
+        })
+        logs.append(f"{node_key}: {len(node_ops)} operation(s) assigned.")
+
+    # --- 2. RUN BOTH 2PC PHASES AGAINST ALL PARTICIPANTS CONCURRENTLY ---
+    trace = TransactionTrace(txn_id)
+    final_decision = COORDINATOR.run(txn_id, prepare_tasks, ready_records, logs, trace=trace)
+
+    return jsonify({
+        "message": "Batch Processed via 2PC",
+        "decision": "COMMITTED" if final_decision else "ABORTED",
+        "operations": len(ops),
+        "logs": logs,
+        "trace": trace.to_dict(),
+        "txn_id": txn_id
+    })
+
 # ROUTE: Simulate Concurrency
 @app.route('/simulate-concurrency', methods=['POST'])
 def simulate_concurrency():
     """
-    TODO: Implement concurrency simulation
-    
-    This endpoint should:
-    1. Create multiple concurrent transactions
-    2. Test different isolation levels
-    3. Simulate race conditions
-    4. Test deadlock scenarios
-    5. Monitor transaction conflicts
-    6. Return detailed logs of concurrent operations
-    
-    Example implementation:
-    - Spawn multiple threads/processes
-    - Execute simultaneous reads/writes
-    - Track transaction timing and conflicts
-    - Return results showing concurrency behavior
+    Runs a load test against this server's routes and returns the measurements
+    (see LoadHarness). Every body field is optional:
+        {"duration": 5, "readers": 4, "writers": 4,
+         "read_mix": {"movies": 80, "report": 20},
+         "write_mix": {"insert": 30, "update": 60, "delete": 10},
+         "hot_keys": 5, "hot_fraction": 0.5,
+         "isolation_levels": ["READ COMMITTED", "REPEATABLE READ", "SERIALIZABLE"],
+         "consistency": "ALL", "node": "node1",
+         "fail_node": "node3", "fail_after": 1, "fail_for": 2}
+    Disabled (403) unless SIMULATION_ENABLED=1.
     """
-    
-    return jsonify({
-        "message": "Concurrency simulation not yet implemented",
-        "status": "TODO"
-    })
+    if not SIMULATION_ENABLED:
+        return jsonify({"error": "Concurrency simulation is disabled on this server (set SIMULATION_ENABLED=1)."}), 403
+    try:
+        result = LOAD_HARNESS.run(request.get_json(silent=True) or {})
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Invalid simulation settings: {e}"}), 400
+    if result is None:
+        return jsonify({"error": "A simulation is already running."}), 409
+
+    summary = [
+        f"{s['isolation_level']}: {s['throughput_rps']} req/s, {s['committed']} committed, "
+        f"{s['aborted']} aborted ({s['deadlocks']} deadlocks), {s['errors']} errors"
+        for s in result['scenarios']
+    ]
+    return jsonify({"message": "\n".join(summary), **result})
+
+# --- REPORT HELPERS ---
+
+def _report_counts(target_node, dimension):
+    """
+    [(value, count), ...] for one report dimension, largest first, plus where it came from.
+    Answers from REPORT_AGGREGATES; scans movies only while that node's counts are being built.
+    """
+    counts = REPORT_AGGREGATES.counts(target_node, dimension)
+    if counts is not None:
+        return counts, "aggregates"
 
-# ROUTE: Report #1 - Regional Distribution
-@app.route('/report/distribution', methods=['GET'])
-def report_distribution():
-    """Generates Report 1: Count of movies per region"""
-    target_node = request.args.get('node', 'node1')
-    
-    # We query the target node directly to see what IT sees
     conn = get_db_connection(target_node)
     if not conn:
-        return jsonify({"error": "Could not connect to node"}), 500
-
+        return None, None
     try:
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor()
         # Simple aggregation query
-        query = """
-            SELECT region, COUNT(*) as count 
+        cursor.execute(f"""
+            SELECT {dimension}, COUNT(*) as count 
             FROM movies 
-            GROUP BY region 
+            GROUP BY {dimension} 
             ORDER BY count DESC
-        """
-        cursor.execute(query)
+        """)
         results = cursor.fetchall()
+        cursor.close()
+        return [(value, count) for value, count in results], "scan"
+    finally:
+        conn.close()
+
+def _cluster_report_counts(dimension):
+    """
+    scope=cluster: each fragment computes its own partial counts in parallel
+    (from its aggregates, or with its own GROUP BY) and they are added up here.
+    Central's counts are fetched alongside and used only to cross-check the sum.
+    """
+    partials = run_on_nodes(('node1',) + FRAGMENT_KEYS, partial(_report_counts, dimension=dimension))
+
+    merged = Counter()
+    computed_from = {}
+    missing_nodes = []
+    for node_key in FRAGMENT_KEYS:
+        counts, source = partials.get(node_key) or (None, None)
+        if counts is None:
+            missing_nodes.append(node_key)
+            continue
+        computed_from[node_key] = source
+        for value, count in counts:
+            merged[value] += count
+
+    central, central_source = partials.get('node1') or (None, None)
+    cross_check = None
+    if central is not None:
+        central = dict(central)
+        mismatches = [
+            {"value": value, "central": central.get(value, 0), "fragments": merged.get(value, 0)}
+            for value in set(central) | set(merged)
+            if central.get(value, 0) != merged.get(value, 0)
+        ]
+        cross_check = {
+            "central_total": sum(central.values()),
+            "fragments_total": sum(merged.values()),
+            # Only meaningful when every fragment answered
+            "consistent": not mismatches and not missing_nodes,
+            "mismatches": sorted(mismatches, key=lambda m: str(m['value'])),
+        }
+        computed_from['node1'] = central_source
+
+    return merged.most_common(), {
+        "computed_from": computed_from,
+        "missing_nodes": missing_nodes,
+        "cross_check": cross_check,
+    }
+
+def _report_source(dimension):
+    """(results, source label, extra response fields) for the report routes' node / scope params."""
+    if request.args.get('scope') == 'cluster':
+        results, extra = _cluster_report_counts(dimension)
+        if len(extra['missing_nodes']) == len(FRAGMENT_KEYS):
+            return None, None, extra
+        answered = [key for key in FRAGMENT_KEYS if key not in extra['missing_nodes']]
+        return results, f"cluster: {' + '.join(answered)}", extra
+
+    target_node = request.args.get('node', 'node1')
+    # What the target node holds, as counted for IT
+    results, computed_from = _report_counts(target_node, dimension)
+    return results, target_node, {"computed_from": computed_from}
+
+# ROUTE: Report #1 - Regional Distribution
+@app.route('/report/distribution', methods=['GET'])
+def report_distribution():
+    """Generates Report 1: Count of movies per region (?node=... or ?scope=cluster)"""
+    try:
+        results, source, extra = _report_source('region')
+        if results is None:
+            return jsonify({"error": "Could not connect to node"}), 500
         
         # Format as text report
-        report_lines = [f"REPORT: Regional Distribution (Source: {target_node})", "="*50]
+        report_lines = [f"REPORT: Regional Distribution (Source: {source})", "="*50]
         report_lines.append(f"{'REGION':<15} | {'COUNT':<10}")
         report_lines.append("-" * 30)
         
         total = 0
-        for row in results:
-            r = row['region'] if row['region'] else 'Unknown'
-            c = row['count']
+        for region, c in results:
+            r = region if region else 'Unknown'
             report_lines.append(f"{r:<15} | {c:<10}")
             total += c
             
         report_lines.append("-" * 30)
         report_lines.append(f"{'TOTAL':<15} | {total:<10}")
         
-        return jsonify({"report": "\n".join(report_lines)})
+        return jsonify({"report": "\n".join(report_lines), **extra})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 # ROUTE: Report #2 - Content Type Breakdown
 @app.route('/report/types', methods=['GET'])
 def report_types():
-    """Generates Report 2: Count of movies per content type"""
-    target_node = request.args.get('node', 'node1')
-    conn = get_db_connection(target_node)
-    if not conn:
-        return jsonify({"error": "Could not connect to node"}), 500
-
+    """Generates Report 2: Count of movies per content type (?node=... or ?scope=cluster)"""
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = """
-            SELECT types, COUNT(*) as count 
-            FROM movies 
-            GROUP BY types 
-            ORDER BY count DESC
-        """
-        cursor.execute(query)
-        results = cursor.fetchall()
+        results, source, extra = _report_source('types')
+        if results is None:
+            return jsonify({"error": "Could not connect to node"}), 500
         
-        report_lines = [f"REPORT: Content Type Breakdown (Source: {target_node})", "="*50]
+        report_lines = [f"REPORT: Content Type Breakdown (Source: {source})", "="*50]
         report_lines.append(f"{'TYPE':<20} | {'COUNT':<10}")
         report_lines.append("-" * 35)
         
         total = 0
-        for row in results:
-            t = row['types'] if row['types'] else 'Unknown'
+        for types, c in results:
+            t = types if types else 'Unknown'
             # Truncate long types for text display
             t_display = (t[:17] + '..') if len(t) > 17 else t
-            c = row['count']
             report_lines.append(f"{t_display:<20} | {c:<10}")
             total += c
             
         report_lines.append("-" * 35)
         report_lines.append(f"{'TOTAL':<20} | {total:<10}")
         
-        return jsonify({"report": "\n".join(report_lines)})
+        return jsonify({"report": "\n".join(report_lines), **extra})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=80)
\ No newline at end of file
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=80, threaded=True)
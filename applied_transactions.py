@@ -0,0 +1,72 @@
+"""
+Which transactions a node has already applied.
+
+Every 2PC participant records its transaction id in its own applied_transactions
+table inside the same local transaction as the write, and log shipping / the
+replication worker record the ones they replay. Replays skip the transactions
+a node already holds, so re-reading the log never rolls a row back to an older
+committed value.
+"""
+import threading
+from datetime import datetime, timedelta
+
+APPLIED_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS applied_transactions (
+        transaction_id BINARY(16) PRIMARY KEY,
+        applied_at DATETIME NOT NULL,
+        KEY idx_applied_at (applied_at)
+    )
+    """
+
+_READY_NODES = set()
+_READY_LOCK = threading.Lock()
+
+def ensure_table(conn, node_key):
+    """Creates the table on node_key once per process. DDL commits implicitly: call it outside a transaction."""
+    if node_key in _READY_NODES:
+        return
+    with _READY_LOCK:
+        if node_key in _READY_NODES:
+            return
+        cursor = conn.cursor()
+        cursor.execute(APPLIED_TABLE_DDL)
+        cursor.close()
+        conn.commit()
+        _READY_NODES.add(node_key)
+
+def mark_applied(conn, txn_ids):
+    """Records txn_ids (binary) in the connection's current transaction; the caller commits."""
+    if not txn_ids:
+        return
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO applied_transactions (transaction_id, applied_at) VALUES "
+        + ", ".join(["(%s, %s)"] * len(txn_ids))
+        + " ON DUPLICATE KEY UPDATE applied_at = VALUES(applied_at)",
+        [value for txn_id in txn_ids for value in (txn_id, datetime.now())])
+    cursor.close()
+
+def applied_among(conn, txn_ids, chunk=1000):
+    """The subset of txn_ids (binary) the node has already applied."""
+    txn_ids = list(txn_ids)
+    found = set()
+    cursor = conn.cursor()
+    for i in range(0, len(txn_ids), chunk):
+        part = txn_ids[i:i + chunk]
+        cursor.execute(
+            f"SELECT transaction_id FROM applied_transactions WHERE transaction_id IN ({', '.join(['%s'] * len(part))})",
+            part)
+        found.update(bytes(row[0]) for row in cursor.fetchall())
+    cursor.close()
+    conn.commit()
+    return found
+
+def prune(conn, retention_hours):
+    """Forgets markers older than retention_hours. Returns how many went."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM applied_transactions WHERE applied_at < %s",
+                   (datetime.now() - timedelta(hours=retention_hours),))
+    deleted = cursor.rowcount
+    cursor.close()
+    conn.commit()
+    return deleted
@@ -0,0 +1,288 @@
+"""
+Offline benchmarks for the read paths, the report routes, the 2PC write routes
+and REDO recovery, run against local_cluster (SQLite stand-ins for the three
+nodes, no lab network needed).
+
+    python3 benchmark.py --rows 20000 --iterations 200 --latency node1=0.5,node2=2,node3=2 --out after.json
+    python3 benchmark.py --compare before.json after.json
+
+Every case is timed per request (p50/p95/p99, mean, max, throughput, errors).
+The JSON file also records the git commit and the settings used, so two runs
+with the same settings can be compared across commits.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import local_cluster
+
+GROUPS = ('reads', 'reports', 'writes', 'recovery')
+
+# Background maintenance would compete with the measured requests
+QUIET_ENV = {
+    'LOCAL_NODE_KEY': 'node1',
+    'RECOVERY_INTERVAL': '0',
+    'LOG_COMPACTION_INTERVAL': '0',
+    'HEALTH_CHECK_INTERVAL': '3600',
+    'REPORT_REBUILD_INTERVAL': '3600',
+    'REPLICATION_RETRY_INTERVAL': '3600',
+}
+
+
+# --- Cases ---
+
+class Bench:
+    """The app under test plus the bookkeeping shared by all cases."""
+
+    def __init__(self, app_module, title_ids, iterations, quiet=True):
+        self.app = app_module
+        self.client = app_module.app.test_client()
+        self.title_ids = title_ids
+        self.iterations = iterations
+        self.quiet = quiet
+        self.rng = random.Random(7)
+        self.results = {}
+
+    def measure(self, name, request, iterations=None):
+        """Runs request(i) iterations times; a response counts as an error on HTTP >= 400 or an ABORTED decision."""
+        from load_harness import LatencyRecorder
+        recorder = LatencyRecorder()
+        errors = 0
+        iterations = iterations or self.iterations
+        with self._output():
+            started = time.monotonic()
+            for i in range(iterations):
+                begun = time.monotonic()
+                response = request(i)
+                recorder.add(time.monotonic() - begun)
+                body = response.get_json(silent=True) or {}
+                if response.status_code >= 400 or body.get('decision') == 'ABORTED':
+                    errors += 1
+            elapsed = time.monotonic() - started
+        summary = recorder.summary()
+        summary.pop('histogram', None)
+        self.results[name] = dict(summary, ops_per_s=round(iterations / elapsed, 1), errors=errors)
+        print(f"  {name:<32} p50 {summary['p50_ms']:>9.2f} ms   p95 {summary['p95_ms']:>9.2f} ms   "
+              f"{self.results[name]['ops_per_s']:>8.1f}/s" + (f"   {errors} errors" if errors else ""))
+
+    def _output(self):
+        # The app prints a line per log record; keep that out of the timings and the report
+        if not self.quiet:
+            return contextlib.nullcontext()
+        return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+    def get(self, url):
+        return lambda i: self.client.get(url(i) if callable(url) else url)
+
+    def post(self, url, body):
+        return lambda i: self.client.post(url(i) if callable(url) else url, json=body(i))
+
+
+def bench_reads(bench):
+    rng = bench.rng
+    ids = bench.title_ids
+    words = local_cluster.SEED_WORDS
+    bench.measure('movies_offset_node1', bench.get(lambda i: f"/movies?node=node1&limit=50&offset={rng.randrange(0, 2000, 50)}"))
+    bench.measure('movies_offset_node2', bench.get(lambda i: f"/movies?node=node2&limit=50&offset={rng.randrange(0, 2000, 50)}"))
+    bench.measure('movies_count_estimate', bench.get(lambda i: f"/movies?node=node1&limit=50&count=estimate&region={rng.choice(local_cluster.SEED_REGIONS)}"))
+
+    cursor = {'after': ''}
+    def keyset(i):
+        response = bench.client.get(f"/movies?node=node1&paging=keyset&limit=50&after={cursor['after']}")
+        cursor['after'] = (response.get_json(silent=True) or {}).get('next_after') or ''
+        return response
+    bench.measure('movies_keyset_node1', keyset)
+
+    bench.measure('movies_title_search', bench.get(lambda i: f"/movies?node=node1&limit=50&title={rng.choice(words)}"))
+    bench.measure('movies_titleid_exact', bench.get(lambda i: f"/movies?node=node1&titleId={rng.choice(ids)}&titleIdMatch=exact"))
+    bench.measure('movies_cluster_region', bench.get(lambda i: f"/movies?scope=cluster&limit=50&region={rng.choice(local_cluster.SEED_REGIONS)}"))
+
+
+def bench_reports(bench):
+    bench.measure('report_distribution_node1', bench.get("/report/distribution?node=node1"))
+    bench.measure('report_types_node2', bench.get("/report/types?node=node2"))
+    bench.measure('report_distribution_cluster', bench.get("/report/distribution?scope=cluster"))
+
+
+def bench_writes(bench):
+    rng = bench.rng
+    for consistency in ('ALL', 'QUORUM', 'ASYNC'):
+        prefix = f"bench-{consistency.lower()}-{int(time.time())}"
+        tag = consistency.lower()
+        bench.measure(f'insert_{tag}', bench.post(lambda i: f"/insert?node={rng.choice(['node1', 'node2', 'node3'])}", lambda i: {
+            "titleId": f"{prefix}-{i}", "ordering": 1, "title": f"Bench {i}",
+            "region": rng.choice(local_cluster.SEED_REGIONS), "language": 'en', "types": 'bench',
+            "attributes": '', "isOriginalTitle": 0, "consistency": consistency}))
+        bench.measure(f'update_{tag}', bench.post("/update", lambda i: {
+            "titleId": f"{prefix}-{i}", "ordering": 1, "title": f"Bench {i} v2", "consistency": consistency}))
+        bench.measure(f'delete_{tag}', bench.post("/delete", lambda i: {
+            "titleId": f"{prefix}-{i}", "consistency": consistency}))
+
+    prefix = f"bench-batch-{int(time.time())}"
+    bench.measure('batch_insert_100', bench.post("/batch", lambda i: {"operations": [
+        {"op": "INSERT", "titleId": f"{prefix}-{i}-{j}", "ordering": 1, "title": f"Batch {j}",
+         "region": local_cluster.SEED_REGIONS[j % len(local_cluster.SEED_REGIONS)], "language": 'en',
+         "types": 'bench', "attributes": '', "isOriginalTitle": 0}
+        for j in range(100)
+    ]}), iterations=max(bench.iterations // 10, 1))
+
+
+def bench_recovery(bench, records, runs):
+    """
+    Logs `records` inserts on node1 (Central's coordinator log), then times
+    node3 catching up on them from a zero checkpoint, `runs` times.
+    """
+    import applied_transactions
+    from db_helpers import get_db_connection
+    from load_harness import LatencyRecorder
+    from log_manager import DistributedLogManager
+
+    prefix = f"bench-recovery-{int(time.time())}"
+    with bench._output():
+        for start in range(0, records, 500):
+            bench.client.post("/batch", json={"operations": [
+                {"op": "INSERT", "titleId": f"{prefix}-{j}", "ordering": 1, "title": f"Recovery {j}",
+                 "region": local_cluster.SEED_REGIONS[j % len(local_cluster.SEED_REGIONS)], "language": 'en',
+                 "types": 'bench', "attributes": '', "isOriginalTitle": 0}
+                for j in range(start, min(start + 500, records))
+            ]})
+        manager = DistributedLogManager(3)
+
+    recorder = LatencyRecorder()
+    applied = 0
+    for _ in range(runs):
+        conn = get_db_connection('node3')
+        manager._ensure_checkpoint_table(conn)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM recovery_checkpoints WHERE peer_node = %s", ('node1',))
+        # node3 took part in those writes; forget that so every run replays them all
+        applied_transactions.ensure_table(conn, 'node3')
+        cursor.execute("DELETE FROM applied_transactions")
+        conn.commit()
+        conn.close()
+        with bench._output():
+            started = time.monotonic()
+            stats = manager.catch_up_from('node1')
+            recorder.add(time.monotonic() - started)
+        applied = stats['applied']
+
+    summary = recorder.summary()
+    summary.pop('histogram', None)
+    seconds = summary['mean_ms'] / 1000
+    bench.results['recovery_catch_up'] = dict(summary, records=applied,
+                                              records_per_s=round(applied / seconds, 1) if seconds else None)
+    print(f"  {'recovery_catch_up':<32} mean {summary['mean_ms']:>8.1f} ms   {applied} records   "
+          f"{bench.results['recovery_catch_up']['records_per_s']}/s")
+
+
+# --- Results ---
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, timeout=10,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def compare(before_path, after_path):
+    """Prints p50 / p95 / throughput of every case present in both files, and the change."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('commit')}   after: {after['meta'].get('commit')}")
+    if before['meta'].get('settings') != after['meta'].get('settings'):
+        print("WARNING: the two runs used different settings.")
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"{'case':<32} {'p50 ms':>19} {'p95 ms':>19} {'throughput':>19}")
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if not old:
+            continue
+        rate = 'records_per_s' if 'records_per_s' in new else 'ops_per_s'
+        print(f"{name:<32} {new['p50_ms']:>10.2f} {change(old['p50_ms'], new['p50_ms']):>8} "
+              f"{new['p95_ms']:>10.2f} {change(old['p95_ms'], new['p95_ms']):>8} "
+              f"{new[rate] or 0:>10.1f} {change(old[rate] or 0, new[rate] or 0):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local stand-in for the three nodes.")
+    parser.add_argument('--rows', type=int, default=20000, help="movie rows seeded on Central (default 20000)")
+    parser.add_argument('--iterations', type=int, default=100, help="requests per case (default 100)")
+    parser.add_argument('--latency', default='0', help="ms per round trip: '1' or 'node1=0.5,node2=2,node3=2'")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random +/- fraction on each delay")
+    parser.add_argument('--only', default=','.join(GROUPS), help=f"comma list of {', '.join(GROUPS)}")
+    parser.add_argument('--recovery-records', type=int, default=5000, help="log records replayed by recovery")
+    parser.add_argument('--recovery-runs', type=int, default=3)
+    parser.add_argument('--data-dir', default=None, help="where the node databases go (default: a temp dir)")
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own output")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    groups = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    for key, value in QUIET_ENV.items():
+        os.environ.setdefault(key, value)
+    data_dir = local_cluster.install(args.data_dir, local_cluster.parse_latency(args.latency), args.jitter)
+    local_cluster.reset()
+    title_ids = local_cluster.seed(args.rows)
+    print(f"Local cluster in {data_dir}: {args.rows} rows, latency {args.latency} ms.")
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, 'w')))
+        import app as app_module
+        # Writes wait for startup; reports need the aggregates built first
+        deadline = time.monotonic() + 60
+        app_module.STARTUP.wait(60)
+        while time.monotonic() < deadline and not \
+                all(node['ready'] for node in app_module.REPORT_AGGREGATES.stats().values()):
+            time.sleep(0.1)
+
+    bench = Bench(app_module, title_ids, args.iterations, quiet=not args.verbose)
+    for group in groups:
+        print(f"[{group}]")
+        if group == 'recovery':
+            bench_recovery(bench, args.recovery_records, args.recovery_runs)
+        else:
+            globals()[f'bench_{group}'](bench)
+
+    output = {
+        "meta": {
+            "commit": _git('rev-parse', '--short', 'HEAD'),
+            "dirty": bool(_git('status', '--porcelain', '--untracked-files=no')),
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "settings": {
+                "rows": args.rows, "iterations": args.iterations, "latency": args.latency, "jitter": args.jitter,
+                "groups": groups, "recovery_records": args.recovery_records, "recovery_runs": args.recovery_runs,
+            },
+        },
+        "results": bench.results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
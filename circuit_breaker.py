@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of connecting while a node's breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Remembers whether ONE node is reachable, so callers stop waiting out
+    connect timeouts against a node that is down.
+
+    - closed: calls go through; failure_threshold consecutive failures open it.
+    - open: calls fail immediately (CircuitOpenError) for reset_timeout seconds.
+    - half_open: after that, ONE call is let through as a probe. Success closes
+      the breaker; failure opens it for another reset_timeout. Other calls keep
+      failing fast while the probe is in flight.
+
+    The health monitor's periodic probes are usually the ones that find a node
+    back up, since reads and 2PC route around a node whose breaker is open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, node_key, failure_threshold=3, reset_timeout=10):
+        self.node_key = node_key
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._last_error = None
+        self._stats = {"opened": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def _state_locked(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state_locked()
+
+    def available(self):
+        """True while the breaker is closed, i.e. the node is worth routing work to."""
+        return self.state == self.CLOSED
+
+    def admit(self):
+        """
+        Called before connecting. Raises CircuitOpenError if the call must fail
+        fast; returns True if it is the half-open probe (finish it with
+        record_success / record_failure, or end_probe if it never connected).
+        """
+        with self._lock:
+            state = self._state_locked()
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+        raise CircuitOpenError(f"{self.node_key} is unreachable (circuit {state}; last error: {self._last_error})")
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"Circuit breaker: {self.node_key} reachable again, closing.")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            probe_failed = self._probing
+            self._probing = False
+            if probe_failed or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                if self._state == self.CLOSED:
+                    print(f"Circuit breaker: {self.node_key} failed {self._failures} times in a row, opening "
+                          f"for {self.reset_timeout}s ({error}).")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats["opened"] += 1
+
+    def end_probe(self):
+        """The probe ended without reaching the node either way (e.g. pool exhausted)."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state_locked(),
+                "consecutive_failures": self._failures,
+                "last_error": self._last_error,
+                **self._stats,
+            }
@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+from circuit_breaker import CircuitBreaker
+from metrics import METRICS
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection could be checked out before the checkout timeout."""
+
+
+class PooledConnection:
+    """
+    Proxy around a raw mysql.connector connection that was checked out of a
+    NodeConnectionPool. Everything is delegated to the real connection except
+    close(), which hands the connection back to the pool instead of tearing
+    down the TCP socket.
+    """
+
+    def __init__(self, pool, raw_conn, pinned=False):
+        self._pool = pool
+        self._raw = raw_conn
+        self._released = False
+        self.node_key = pool.node_key
+        self.pinned = pinned
+        self.checked_out_at = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        """Returns the connection to its pool (any open transaction is rolled back)."""
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw, pinned=self.pinned)
+
+    def discard(self):
+        """Closes the underlying socket for good, e.g. after a fatal driver error."""
+        if self._released:
+            return
+        self._released = True
+        self._pool.discard(self._raw, pinned=self.pinned)
+
+
+class NodeConnectionPool:
+    """
+    A bounded pool of connections to ONE node (node1, node2 or node3).
+
+    - min_size connections are kept open even when idle (warm() opens them;
+      the app runs it at startup and from db_helpers' pool maintenance).
+    - At most max_size connections exist at once (idle + checked out).
+    - Connections idle for longer than validate_after seconds are pinged on
+      checkout; dead ones are dropped and replaced transparently.
+    - Connections idle for longer than idle_timeout seconds are closed, as long
+      as that does not take the pool below min_size: on every checkout and
+      return, and by evict_idle() for a pool that sees neither.
+    - Pinned checkouts hold a connection (and its open transaction) across the
+      2PC phases. They are capped at max_pinned so that reads on the same node
+      always have a slot left.
+    - Every connect attempt is reported to the node's CircuitBreaker. While it
+      is open, acquire() fails immediately instead of waiting out a connect
+      timeout; a half-open probe always pings or opens a fresh connection.
+    """
+
+    def __init__(self, node_key, config, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=5, validate_after=5, max_pinned=None, breaker=None):
+        self.node_key = node_key
+        self.config = dict(config)
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+        self.max_pinned = max_pinned if max_pinned is not None else max(self.max_size - 1, 1)
+        self.breaker = breaker or CircuitBreaker(node_key)
+
+        self._idle = deque()   # (raw_conn, last_used_monotonic); right end is the warmest
+        self._size = 0         # idle + checked out
+        self._pinned = 0
+        self._cond = threading.Condition()
+        self._stats = {"created": 0, "reused": 0, "validation_failures": 0, "evicted": 0, "timeouts": 0}
+
+    # --- Checkout / Return ---
+
+    def acquire(self, pinned=False, timeout=None):
+        """
+        Checks out a validated connection, opening a new one if the pool has room.
+        Raises CircuitOpenError right away while the node's breaker is open.
+        """
+        probe = self.breaker.admit()
+        try:
+            return self._acquire(pinned, timeout, probe)
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    def _acquire(self, pinned, timeout, probe):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            raw, last_used = None, None
+            with self._cond:
+                while True:
+                    self._evict_idle_locked()
+                    pin_ok = not pinned or self._pinned < self.max_pinned
+                    if pin_ok and self._idle:
+                        raw, last_used = self._idle.pop()
+                        break
+                    if pin_ok and self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolExhaustedError(
+                            f"No connection available for {self.node_key} after {timeout}s "
+                            f"(size={self._size}, pinned={self._pinned})")
+                    self._cond.wait(remaining)
+                if pinned:
+                    self._pinned += 1
+
+            if raw is None:
+                try:
+                    raw = self._connect()
+                except Exception as e:
+                    self.breaker.record_failure(e)
+                    with self._cond:
+                        self._size -= 1
+                        if pinned:
+                            self._pinned -= 1
+                        self._cond.notify()
+                    raise
+                self.breaker.record_success()
+            elif not self._validate(raw, last_used, force=probe):
+                # Stale socket (server restart, wait_timeout, ...): drop it and try again
+                self._drop(raw, pinned)
+                continue
+            else:
+                if probe:
+                    self.breaker.record_success()
+                self._stats["reused"] += 1
+
+            return PooledConnection(self, raw, pinned=pinned)
+
+    def release(self, raw, pinned=False):
+        """Takes a connection back. Uncommitted work is rolled back before it is reused."""
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            self._drop(raw, pinned)
+            return
+
+        with self._cond:
+            if pinned:
+                self._pinned -= 1
+            self._idle.append((raw, time.monotonic()))
+            self._evict_idle_locked()
+            self._cond.notify()
+
+    def discard(self, raw, pinned=False):
+        self._drop(raw, pinned)
+
+    # --- Maintenance ---
+
+    def warm(self):
+        """Opens connections until min_size are available. Errors are left to the caller."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+
+    def evict_idle(self):
+        with self._cond:
+            self._evict_idle_locked()
+
+    def close_all(self):
+        """Closes every idle connection. Checked-out connections are closed when released."""
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.popleft()
+                self._size -= 1
+                self._close_quietly(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "pinned": self._pinned,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._stats,
+                "breaker": self.breaker.stats(),
+            }
+
+    # --- Internals ---
+
+    def _connect(self):
+        started = time.monotonic()
+        try:
+            raw = mysql.connector.connect(**self.config)
+        except Exception:
+            METRICS.inc('db_connect_failures_total', node=self.node_key)
+            raise
+        METRICS.observe('db_connect_seconds', time.monotonic() - started, node=self.node_key)
+        self._stats["created"] += 1
+        return raw
+
+    def _validate(self, raw, last_used, force=False):
+        if not force and time.monotonic() - last_used < self.validate_after:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            self._stats["validation_failures"] += 1
+            return False
+
+    def _evict_idle_locked(self):
+        # Oldest connections sit on the left end of the deque
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            raw, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats["evicted"] += 1
+            self._close_quietly(raw)
+
+    def _drop(self, raw, pinned):
+        self._close_quietly(raw)
+        with self._cond:
+            self._size -= 1
+            if pinned:
+                self._pinned -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
@@ -0,0 +1,521 @@
+import os
+import threading
+import time
+import uuid
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import applied_transactions
+from db_helpers import get_db_connection, node_available, CENTRAL_KEY
+from metrics import METRICS
+from tracing import TransactionTrace
+
+
+# --- Participant Helpers (Phase 1 / Phase 2 on a single node) ---
+
+def prepare_write(node_key, query, params=None, conn=None):
+    """
+    Phase 1: Executes the write query but DOES NOT commit.
+    It holds the transaction open until final_commit_or_abort is called.
+
+    NOTE: For simplicity, we are committing the prepare log here, but the data
+    write is left uncommitted.
+    """
+    # Pinned: the connection stays checked out of the pool until Phase 2 releases it
+    if conn is None:
+        conn = get_db_connection(node_key, pinned=True)
+    if not conn:
+        return {"success": False, "error": "Connection failed"}
+
+    try:
+        # NOTE: A real system would use a distributed transaction manager to track
+        # this connection/transaction context. Here we rely on the connection object.
+        cursor = conn.cursor()
+        cursor.execute(query, params or ())
+
+        rows_affected = cursor.rowcount
+        cursor.close()
+        # Crucial: DO NOT conn.commit() here
+
+        # Return the open connection to be managed by the calling route/coordinator
+        return {"success": True, "rows_affected": rows_affected, "connection": conn}
+
+    except Exception as e:
+        if conn: conn.close()
+        return {"success": False, "error": str(e), "rows_affected": 0}
+
+def prepare_statements(node_key, statements, conn=None):
+    """
+    Phase 1 for a multi-operation transaction: runs each (query, rows) pair
+    with executemany() on one connection, in order, without committing.
+    """
+    if conn is None:
+        conn = get_db_connection(node_key, pinned=True)
+    if not conn:
+        return {"success": False, "error": "Connection failed"}
+
+    try:
+        cursor = conn.cursor()
+        rows_affected = 0
+        for query, rows in statements:
+            cursor.executemany(query, rows)
+            rows_affected += max(cursor.rowcount, 0)
+        cursor.close()
+        return {"success": True, "rows_affected": rows_affected, "connection": conn}
+
+    except Exception as e:
+        conn.close()
+        return {"success": False, "error": str(e), "rows_affected": 0}
+
+def prepare_marked(txn_id, node_key, task, conn):
+    """
+    Runs a prepare task, then records txn_id in the participant's
+    applied_transactions within the same (still uncommitted) transaction, so
+    log shipping and the replication worker know the node already has it.
+    """
+    try:
+        applied_transactions.ensure_table(conn, node_key)
+    except Exception as e:
+        conn.close()
+        return {"success": False, "error": f"applied_transactions unavailable: {e}", "rows_affected": 0}
+    res = task(conn=conn)
+    if res['success']:
+        try:
+            applied_transactions.mark_applied(res['connection'], [uuid.UUID(txn_id).bytes])
+        except Exception as e:
+            res['connection'].close()    # rolls the prepared write back
+            return {"success": False, "error": f"Could not mark {txn_id} applied: {e}", "rows_affected": 0}
+    return res
+
+def final_commit_or_abort(conn, commit=True):
+    """
+    Phase 2: Performs the actual database commit or rollback based on
+    the coordinator's global decision. Closing the connection releases the
+    pinned connection back to its pool.
+    """
+    if not conn:
+        return {"success": False, "error": "No active connection/transaction"}
+
+    try:
+        if commit:
+            conn.commit()
+            status = "COMMIT_SUCCESS"
+        else:
+            conn.rollback()
+            status = "ABORT_SUCCESS"
+
+        conn.close()
+        return {"success": True, "status": status}
+    except Exception as e:
+        conn.close()
+        return {"success": False, "status": "FINAL_COMMIT_ERROR", "error": str(e)}
+
+
+# --- Concurrent 2PC Coordinator ---
+
+# Write consistency levels accepted by TwoPhaseCoordinator.run()
+CONSISTENCY_LEVELS = ('ALL', 'QUORUM', 'ASYNC')
+
+# Timed stretches of one run(): voting, logging the decision, committing/aborting
+PHASES = ('prepare', 'decision', 'commit')
+
+_EXECUTORS = {}
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor(kind='prepare'):
+    """
+    Shared worker pool for participant round trips of one kind, created on
+    first use. Phase 2 ('commit') has its own: commits release the row locks
+    that queued prepares are waiting on, so they must never wait behind them.
+    """
+    if kind not in _EXECUTORS:
+        with _EXECUTOR_LOCK:
+            if kind not in _EXECUTORS:
+                workers = os.environ.get('TWO_PC_COMMIT_WORKERS') if kind == 'commit' else None
+                _EXECUTORS[kind] = ThreadPoolExecutor(
+                    max_workers=int(workers or os.environ.get('TWO_PC_MAX_WORKERS', 16)),
+                    thread_name_prefix=f'2pc-{kind}')
+    return _EXECUTORS[kind]
+
+
+def _timed(trace, phase, node_key, fn, *args, **kwargs):
+    """
+    Runs one participant round trip, records it in the twopc_phase_seconds
+    histogram and adds it to the transaction's trace as a span.
+    """
+    started = time.monotonic()
+    error = None
+    try:
+        res = fn(*args, **kwargs)
+        if isinstance(res, dict) and not res.get('success', True):
+            error = res.get('error') or res.get('status')
+        return res
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        ended = time.monotonic()
+        METRICS.observe('twopc_phase_seconds', ended - started, phase=phase, node=node_key)
+        trace.add(phase, node_key, started, ended, error)
+
+
+def _release_late_prepare(future):
+    """A participant answered after the coordinator gave up on it: roll its work back."""
+    if future.cancelled():
+        return
+    try:
+        res = future.result()
+    except Exception:
+        return
+    if res.get('connection'):
+        final_commit_or_abort(res['connection'], commit=False)
+
+
+def record_changes(op_type, record_key, new_value):
+    """Expands a READY record into its (op_type, record_key, new_value) row changes."""
+    if op_type == 'BATCH':
+        return [(op['operation_type'], op['record_key'], op['new_value']) for op in new_value['operations']]
+    return [(op_type, record_key, new_value)]
+
+
+class TwoPhaseCoordinator:
+    """
+    Runs both 2PC phases against all participants at the same time.
+
+    Pinned connections are checked out in node order before any PREPARE is
+    sent. Concurrent transactions therefore never hold one node's last free
+    connection while waiting for another's, which would deadlock the pools.
+
+    Phase 1 sends every PREPARE concurrently and logs READY_COMMIT for each
+    participant as soon as its vote arrives. The first NO vote (error, failed
+    connection or a participant exceeding prepare_timeout) aborts the round
+    immediately; participants still in flight are rolled back whenever they
+    answer. A participant whose circuit breaker is open votes NO before any
+    connection is checked out, so a down node aborts the round (or, under
+    QUORUM / ASYNC, is left to replication) without waiting for a timeout. Phase 2 logs the global decision and then commits/aborts all held
+    transactions concurrently on a worker pool of their own (never behind
+    prepares waiting on row locks), waiting at most commit_timeout for each.
+
+    Each participant also records the transaction in its applied_transactions
+    table inside the prepared transaction (prepare_marked), so replays from the
+    log never re-apply it there.
+
+    One coordinator serves every request thread of the process: per-run state
+    lives in run()'s locals, and the log manager is thread-safe.
+
+    Commit listeners (add_commit_listener) are how caches and indexes built on
+    top of the fragments stay current: each one is called as
+    listener(node_key, changes) once a participant has committed, where changes
+    is a list of (op_type, record_key, new_value) tuples.
+
+    Prepare hooks (add_prepare_hook) are for state that has to be read inside
+    the participant's transaction: hook(node_key, prepare_task, changes) returns
+    a replacement prepare task. A prepare result may carry an 'on_commit'
+    callable, which is run once that participant has committed.
+
+    Phase listeners (add_phase_listener) are called as
+    listener(txn_id, phase, seconds) for each of PHASES once the run is over.
+    Trace listeners (add_trace_listener) get the run's finished
+    TransactionTrace: one span per pinned checkout, prepare, READY log write,
+    global log write and commit/abort, per participant.
+
+    Consistency levels trade how many participants the client waits for:
+    - ALL: every participant votes YES before the commit (the default).
+    - QUORUM: the decision is taken once Central and a majority of the
+      participants have voted YES. Stragglers are committed when they answer.
+    - ASYNC: only the synchronous participants (Central and the owning
+      fragment) go through 2PC; the others are applied after the commit.
+    A participant the decision did not wait for is committed in the background
+    and gets a REPLICATION_SUCCESS/FAILED row in the log; failed ones are then
+    retried by the ReplicationWorker and caught up by log shipping. Until then
+    that node serves the row as it was before the write.
+    """
+
+    def __init__(self, log_manager, prepare_timeout=None, commit_timeout=None):
+        self.log_manager = log_manager
+        self.commit_listeners = []
+        self.prepare_hooks = []
+        self.phase_listeners = []
+        self.trace_listeners = []
+        self._lanes = {}
+        self._lanes_lock = threading.Lock()
+        self.prepare_timeout = prepare_timeout if prepare_timeout is not None else \
+            float(os.environ.get('TWO_PC_PREPARE_TIMEOUT', 10))
+        self.commit_timeout = commit_timeout if commit_timeout is not None else \
+            float(os.environ.get('TWO_PC_COMMIT_TIMEOUT', 10))
+
+    def add_commit_listener(self, listener):
+        self.commit_listeners.append(listener)
+
+    def add_prepare_hook(self, hook):
+        self.prepare_hooks.append(hook)
+
+    def add_phase_listener(self, listener):
+        self.phase_listeners.append(listener)
+
+    def add_trace_listener(self, listener):
+        self.trace_listeners.append(listener)
+
+    def _notify_trace(self, trace):
+        for listener in self.trace_listeners:
+            try:
+                listener(trace)
+            except Exception as e:
+                print(f"Trace listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+    def _notify_phases(self, txn_id, timings):
+        for listener in self.phase_listeners:
+            for phase in PHASES:
+                try:
+                    listener(txn_id, phase, timings[phase])
+                except Exception as e:
+                    print(f"Phase listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+    @staticmethod
+    def _record_for(ready_record, node_key):
+        return ready_record[node_key] if isinstance(ready_record, dict) else ready_record
+
+    def _notify_commit(self, node_key, record, on_commit, commit_future):
+        if commit_future.result()['success']:
+            self._committed(node_key, record, on_commit)
+
+    def _committed(self, node_key, record, on_commit):
+        if on_commit is not None:
+            try:
+                on_commit()
+            except Exception as e:
+                print(f"Commit hook failed for {node_key}: {e}")
+        changes = record_changes(*record)
+        for listener in self.commit_listeners:
+            try:
+                listener(node_key, changes)
+            except Exception as e:
+                print(f"Commit listener {getattr(listener, '__name__', listener)} failed for {node_key}: {e}")
+
+    # --- Participants the decision did not wait for (QUORUM / ASYNC) ---
+
+    def _lane(self, node_key):
+        """One thread per node, so background applies reach a node in the order they were decided."""
+        with self._lanes_lock:
+            if node_key not in self._lanes:
+                self._lanes[node_key] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'2pc-{node_key}')
+            return self._lanes[node_key]
+
+    def _apply_deferred(self, txn_id, node_key, prepare_task, record):
+        conn = get_db_connection(node_key, pinned=True)
+        res = prepare_task(conn=conn) if conn else {"success": False, "error": "Connection failed"}
+        self._finish_deferred(txn_id, node_key, record, res)
+
+    def _finish_late(self, txn_id, node_key, record, prepare_future):
+        try:
+            res = prepare_future.result()
+        except Exception as e:
+            res = {"success": False, "error": str(e)}
+        self._finish_deferred(txn_id, node_key, record, res)
+
+    def _finish_deferred(self, txn_id, node_key, record, res):
+        """Commits a prepared straggler and logs the outcome as a replication row for node_key."""
+        error = res.get('error')
+        if res['success']:
+            error = final_commit_or_abort(res['connection'], commit=True).get('error')
+        if error is None:
+            self._committed(node_key, record, res.get('on_commit'))
+        else:
+            print(f"2PC {txn_id}: background apply on {node_key} failed ({error}); left to replication.")
+        try:
+            self.log_manager.log_replication_result(txn_id, int(node_key.replace('node', '')), success=error is None)
+        except Exception as e:
+            print(f"2PC {txn_id}: could not log replication to {node_key}: {e}")
+
+    def run(self, txn_id, prepare_tasks, ready_record, logs, action='write', consistency='ALL', synchronous=None,
+            trace=None):
+        """
+        Args:
+            txn_id (str): Transaction id used in every log record.
+            prepare_tasks (dict): node_key -> callable taking the participant's
+                pinned connection (conn=...) and returning a prepare_write()-style
+                result dict.
+            ready_record (tuple or dict): (op_type, record_key, new_value) written
+                with each participant's READY_COMMIT record, or a dict of such
+                tuples keyed by node_key when participants do different work.
+            logs (list): Console log lines, appended to in place.
+            consistency (str): One of CONSISTENCY_LEVELS (see the class docstring).
+            synchronous (iterable): For ASYNC, the participants to run 2PC with;
+                None runs every participant synchronously.
+            trace (TransactionTrace): Filled in with the run's spans; pass one
+                to get them back (a fresh one is used otherwise).
+
+        Returns:
+            bool: The global decision (True = committed).
+        """
+        if trace is None:
+            trace = TransactionTrace(txn_id)
+        trace.action, trace.consistency, trace.logs = action, consistency, logs
+        METRICS.gauge_add('twopc_in_flight', 1)
+        try:
+            decision = self._run(txn_id, prepare_tasks, ready_record, logs, action, consistency, synchronous, trace)
+        finally:
+            METRICS.gauge_add('twopc_in_flight', -1)
+        METRICS.inc('twopc_transactions_total', decision='COMMITTED' if decision else 'ABORTED', consistency=consistency)
+        trace.finish(decision)
+        self._notify_trace(trace)
+        return decision
+
+    def _run(self, txn_id, prepare_tasks, ready_record, logs, action, consistency, synchronous, trace):
+        started = time.monotonic()
+        executor = _get_executor()
+        for hook in self.prepare_hooks:
+            prepare_tasks = {
+                p_key: hook(p_key, task, record_changes(*self._record_for(ready_record, p_key)))
+                for p_key, task in prepare_tasks.items()
+            }
+        prepare_tasks = {p_key: partial(prepare_marked, txn_id, p_key, task) for p_key, task in prepare_tasks.items()}
+        deferred = {}
+        if consistency == 'ASYNC' and synchronous is not None:
+            deferred = {p_key: task for p_key, task in prepare_tasks.items() if p_key not in synchronous}
+            prepare_tasks = {p_key: task for p_key, task in prepare_tasks.items() if p_key in synchronous}
+        if consistency == 'QUORUM':
+            quorum = len(prepare_tasks) // 2 + 1
+            must_vote = {CENTRAL_KEY} & set(prepare_tasks)
+        else:
+            quorum = len(prepare_tasks)
+            must_vote = set(prepare_tasks)
+        active_connections = {}
+        commit_hooks = {}
+        outvoted = {}
+        all_ready = True
+
+        def vote_no(p_key, error):
+            """Records a NO vote; returns False once it makes the commit impossible."""
+            outvoted[p_key] = prepare_tasks[p_key]
+            if p_key in must_vote or len(prepare_tasks) - len(outvoted) < quorum:
+                logs.append(f"{p_key}: Failed to Prepare: {error}. ABORTING.")
+                return False
+            logs.append(f"{p_key}: Failed to Prepare: {error}. Quorum still reachable, applied later.")
+            return True
+
+        # ------------------------------------------------------------------
+        # PHASE 1: PREPARE (ALL PARTICIPANTS AT ONCE) AND LOG READY STATUS
+        # ------------------------------------------------------------------
+        pending = {}
+        held = {}
+        try:
+            # Coordinator logs PREPARE START
+            self.log_manager.log_prepare_start(txn_id)
+            logs.append("Coordinator: Logged PREPARE START.")
+
+            # Known-down participants vote NO without being contacted
+            for p_key in sorted(prepare_tasks):
+                if not node_available(p_key):
+                    all_ready = vote_no(p_key, "Node unreachable (circuit open)")
+                    if not all_ready:
+                        break
+
+            deadline = time.monotonic() + self.prepare_timeout
+            for p_key in sorted(set(prepare_tasks) - set(outvoted)) if all_ready else ():
+                conn = _timed(trace, 'checkout', p_key, get_db_connection, p_key, pinned=True)
+                if conn is None:
+                    all_ready = vote_no(p_key, "Connection failed")
+                    if not all_ready:
+                        break
+                    continue
+                future = executor.submit(_timed, trace, 'prepare', p_key, prepare_tasks[p_key], conn=conn)
+                pending[future] = p_key
+                held[future] = conn
+
+            while pending and all_ready:
+                if len(active_connections) >= quorum and must_vote <= active_connections.keys():
+                    break    # QUORUM reached: the rest are committed whenever they answer
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    for p_key in pending.values():
+                        logs.append(f"{p_key}: Failed to Prepare: no vote within {self.prepare_timeout}s. ABORTING.")
+                    all_ready = False
+                    break
+
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    p_key = pending.pop(future)
+                    try:
+                        res_prepare = future.result()
+                    except Exception as e:
+                        res_prepare = {"success": False, "error": str(e)}
+
+                    if res_prepare['success']:
+                        active_connections[p_key] = res_prepare['connection']
+                        commit_hooks[p_key] = res_prepare.get('on_commit')
+                        if not all_ready:
+                            continue
+                        # Log READY status on the coordinator's log for each successful prepare
+                        op_type, record_key, new_value = self._record_for(ready_record, p_key)
+                        _timed(trace, 'ready_log', p_key, self.log_manager.log_ready_status, txn_id, op_type, record_key, new_value)
+                        logs.append(f"{p_key}: Prepared {action} & Logged READY_COMMIT (Transaction held).")
+                    elif all_ready:
+                        # Under ALL (or for Central) one failed participant makes global abort inevitable
+                        all_ready = vote_no(p_key, res_prepare.get('error'))
+                    else:
+                        logs.append(f"{p_key}: Failed to Prepare: {res_prepare.get('error')}.")
+
+        except Exception as e:
+            all_ready = False
+            logs.append(f"CRITICAL FAILURE during PREPARE phase: {e}")
+
+        # ------------------------------------------------------------------
+        # PHASE 2: GLOBAL COMMIT/ABORT DECISION (ALL PARTICIPANTS AT ONCE)
+        # ------------------------------------------------------------------
+        final_decision = all_ready
+        prepared = time.monotonic()
+
+        # 1. Coordinator logs GLOBAL_COMMIT/ABORT (The irrevocable decision)
+        log_res = _timed(trace, 'global_log', self.log_manager.node_key, self.log_manager.log_global_commit,
+                         txn_id, commit=final_decision)
+        if not log_res['success']:
+            # This is a critical logging failure. Must force abort.
+            final_decision = False
+            logs.append("CRITICAL: Global Log Failure. FORCING ABORT.")
+        decided = time.monotonic()
+
+        if final_decision:
+            # Committed without them: stragglers commit when they answer, the rest are applied in the background
+            for future, p_key in pending.items():
+                future.add_done_callback(partial(
+                    self._finish_late, txn_id, p_key, self._record_for(ready_record, p_key)))
+                logs.append(f"{p_key}: Not waited for ({consistency}) - commits when it answers.")
+            for p_key, task in sorted({**outvoted, **deferred}.items()):
+                self._lane(p_key).submit(
+                    self._apply_deferred, txn_id, p_key, task, self._record_for(ready_record, p_key))
+                logs.append(f"{p_key}: Deferred ({consistency}) - applied in the background.")
+        else:
+            # Participants we stopped waiting for are rolled back whenever they answer
+            for future in pending:
+                if future.cancel():
+                    held[future].close()
+                else:
+                    future.add_done_callback(_release_late_prepare)
+
+        # 2. Coordinator sends final commit/abort signal to all open connections
+        finals = {
+            _get_executor('commit').submit(
+                _timed, trace, 'commit', node_key, final_commit_or_abort, conn, final_decision): node_key
+            for node_key, conn in active_connections.items()
+        }
+        if final_decision:
+            for future, node_key in finals.items():
+                future.add_done_callback(partial(
+                    self._notify_commit, node_key, self._record_for(ready_record, node_key), commit_hooks.get(node_key)))
+
+        done, not_done = wait(finals, timeout=self.commit_timeout)
+        verb = 'COMMIT' if final_decision else 'ABORT'
+        for future in done:
+            commit_res = future.result()
+            logs.append(f"{finals[future]}: Final Decision - {verb} ({commit_res['status']})")
+        for future in not_done:
+            # The decision is already durable; the participant finishes in the background
+            logs.append(f"{finals[future]}: Final Decision - {verb} (PENDING after {self.commit_timeout}s)")
+
+        self._notify_phases(txn_id, {
+            'prepare': prepared - started,
+            'decision': decided - prepared,
+            'commit': time.monotonic() - decided,
+        })
+        return final_decision
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CountCache:
+    """
+    Remembers COUNT(*) results of filtered /movies queries.
+
+    Entries are keyed by (node_key, normalized filter set) and expire after ttl
+    seconds. The 2PC commit path drops every entry of a node as soon as a write
+    commits there (on_commit), so the TTL only bounds staleness from writes that
+    bypass the coordinator (e.g. REDO recovery or manual SQL).
+
+    A per-node generation number guards against a count computed before a
+    commit being stored after the invalidation for that commit.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (node_key, filters) -> (count, stored_at)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(filters):
+        """Turns a {name: value} filter dict into a hashable key, ignoring empty filters."""
+        return tuple(sorted((name, str(value).strip()) for name, value in filters.items()
+                            if value not in (None, '') and str(value).strip()))
+
+    def generation(self, node_key):
+        with self._lock:
+            return self._generations.get(node_key, 0)
+
+    def get(self, node_key, filters):
+        key = (node_key, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, node_key, filters, count, generation):
+        """Stores a count computed while the node was at `generation`; stale results are dropped."""
+        with self._lock:
+            if self._generations.get(node_key, 0) != generation:
+                return
+            self._entries[(node_key, filters)] = (count, time.monotonic())
+            self._entries.move_to_end((node_key, filters))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, node_key):
+        with self._lock:
+            self._generations[node_key] = self._generations.get(node_key, 0) + 1
+            for key in [key for key in self._entries if key[0] == node_key]:
+                del self._entries[key]
+
+    def on_commit(self, node_key, changes):
+        """Commit listener: any committed write may change any count on that node."""
+        self.invalidate(node_key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
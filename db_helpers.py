@@ -1,4 +1,12 @@
-import mysql.connector
+import os
+import threading
+import time
+
+from mysql.connector.constants import DEFAULT_CONFIGURATION
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from connection_pool import NodeConnectionPool
+from metrics import METRICS
 # Note: You may need to load_dotenv() and define DB_CONFIG here
 DB_CONFIG = {
     'node1': {
@@ -21,11 +29,144 @@ DB_CONFIG = {
     }
 }
 
-def get_db_connection(node_key):
+# Columns of the movies table, in the order every INSERT / after-image uses
+MOVIE_COLUMNS = ['titleId', 'ordering', 'title', 'region', 'language', 'types', 'attributes', 'isOriginalTitle']
+
+# --- Fragmentation Rule ---
+# node1 (Central) holds every row; node2 and node3 split the rows by region.
+CENTRAL_KEY = 'node1'
+FRAGMENT_KEYS = ('node2', 'node3')
+NODE2_REGIONS = ('US', 'JP')
+
+def get_fragment_key(region):
+    """Returns the fragment node that owns rows of the given region."""
+    return 'node2' if region in NODE2_REGIONS else 'node3'
+
+# --- Connection Pools (one per node, created on first use) ---
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def _pool_settings():
+    """Pool sizing is read from the environment so each node server can be tuned from its .env."""
+    return {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'idle_timeout': float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+        'checkout_timeout': float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', 5)),
+        'validate_after': float(os.environ.get('DB_POOL_VALIDATE_AFTER', 5)),
+    }
+
+def _connect_config(node_key):
+    """DB_CONFIG plus explicit timeouts, so a dead or hung node costs seconds, not the OS TCP timeout."""
+    config = {**DB_CONFIG[node_key], 'connection_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 3))}
+    # Socket read/write timeouts only exist in recent connector releases; older ones reject unknown options
+    for option, env_var in (('read_timeout', 'DB_READ_TIMEOUT'), ('write_timeout', 'DB_WRITE_TIMEOUT')):
+        if option in DEFAULT_CONFIGURATION:
+            config[option] = int(os.environ.get(env_var, 30))
+    return config
+
+def get_pool(node_key):
+    pool = _POOLS.get(node_key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(node_key)
+            if pool is None:
+                breaker = CircuitBreaker(
+                    node_key,
+                    failure_threshold=int(os.environ.get('DB_BREAKER_FAILURES', 3)),
+                    reset_timeout=float(os.environ.get('DB_BREAKER_RESET_TIMEOUT', 10)))
+                pool = NodeConnectionPool(node_key, _connect_config(node_key), breaker=breaker, **_pool_settings())
+                _POOLS[node_key] = pool
+    return pool
+
+def node_available(node_key):
+    """False while node_key's circuit breaker is open: callers should reroute or abort instead of connecting."""
+    return get_pool(node_key).breaker.available()
+
+def pool_stats():
+    return {key: pool.stats() for key, pool in _POOLS.items()}
+
+_MAINTENANCE_THREAD = None
+
+def start_pool_maintenance(interval):
+    """
+    Every interval seconds, closes pooled connections idle for longer than
+    DB_POOL_IDLE_TIMEOUT (otherwise only checkouts and returns evict, so a pool
+    nobody uses keeps them forever) and tops the pool of every node whose
+    breaker is closed back up to DB_POOL_MIN_SIZE.
+    """
+    global _MAINTENANCE_THREAD
+    if _MAINTENANCE_THREAD is not None or interval <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            for node_key in DB_CONFIG:
+                pool = get_pool(node_key)
+                pool.evict_idle()
+                if not pool.breaker.available():
+                    continue
+                try:
+                    pool.warm()
+                except Exception as e:
+                    pool.breaker.record_failure(e)
+                    print(f"Connection pool: could not warm {node_key}: {e}")
+
+    _MAINTENANCE_THREAD = threading.Thread(target=run, name='pool-maintenance', daemon=True)
+    _MAINTENANCE_THREAD.start()
+
+# --- Load Simulation Switches (used by /simulate-concurrency) ---
+ISOLATION_LEVELS = ('READ UNCOMMITTED', 'READ COMMITTED', 'REPEATABLE READ', 'SERIALIZABLE')
+_ISOLATION_LEVEL = None         # None = the server default (REPEATABLE READ on InnoDB)
+_SIMULATED_OUTAGES = set()
+
+def set_isolation_level(level):
+    """Runs the next transaction of every connection handed out at this level (None resets)."""
+    global _ISOLATION_LEVEL
+    if level is not None and level not in ISOLATION_LEVELS:
+        raise ValueError(f"Unknown isolation level {level!r}")
+    _ISOLATION_LEVEL = level
+
+def simulate_outage(node_key, down=True):
+    """While a node is 'down', no new connections to it are handed out."""
+    if down:
+        _SIMULATED_OUTAGES.add(node_key)
+    else:
+        _SIMULATED_OUTAGES.discard(node_key)
+
+def get_db_connection(node_key, pinned=False):
+    """
+    Checks a connection to node_key out of its pool. Calling close() on the
+    returned connection gives it back to the pool.
+
+    pinned=True is for 2PC participants: the connection (and its uncommitted
+    transaction) stays checked out until _final_commit_or_abort releases it.
+
+    Returns None if the node can't be reached, immediately while its circuit
+    breaker is open.
+    """
     try:
-        config = DB_CONFIG[node_key]
-        conn = mysql.connector.connect(**config)
-        return conn
+        if node_key in _SIMULATED_OUTAGES:
+            raise ConnectionError("simulated outage")
+        conn = get_pool(node_key).acquire(pinned=pinned)
+    except CircuitOpenError:
+        # Counted in the breaker's stats; printing every fast failure would flood the console
+        METRICS.inc('db_checkout_failures_total', node=node_key)
+        return None
     except Exception as e:
+        METRICS.inc('db_checkout_failures_total', node=node_key)
         print(f"Error connecting to {node_key}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+    level = _ISOLATION_LEVEL
+    if level is not None:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SET TRANSACTION ISOLATION LEVEL {level}")
+            cursor.close()
+        except Exception as e:
+            print(f"Error setting isolation level on {node_key}: {e}")
+            conn.close()
+            return None
+    return conn
@@ -0,0 +1,33 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+#
+# Pre-forked worker processes, each serving requests on a pool of threads.
+# Every worker imports app.py itself (no preload): connection pools, the log
+# manager and background threads don't survive a fork, so each process builds
+# its own. Background passes (log shipping, compaction, replication retries,
+# report recounts) take a per-node lock, so only one worker runs each at a time.
+#
+# What each worker still keeps for itself, and how stale it can get:
+# - report aggregates: a copy of the node's shared counts, reloaded every
+#   REPORT_REFRESH_INTERVAL; the shared counts miss writes this node didn't
+#   coordinate for up to REPORT_REBUILD_INTERVAL.
+# - /movies totals (COUNT_CACHE): invalidated only by that worker's own 2PC
+#   commits, so up to COUNT_CACHE_TTL behind writes made through other workers.
+# - /status (HEALTH_MONITOR): its own probes every HEALTH_CHECK_INTERVAL, which
+#   also close its circuit breakers again; the values themselves come from the nodes.
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = False
+
+# A 2PC write may wait TWO_PC_PREPARE_TIMEOUT + TWO_PC_COMMIT_TIMEOUT, and /simulate-concurrency
+# SIMULATION_MAX_DURATION on top of that; don't kill the worker first
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
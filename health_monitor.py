@@ -0,0 +1,151 @@
+import threading
+import time
+from datetime import datetime
+
+from db_helpers import get_db_connection, get_pool
+from scatter_gather import run_on_nodes
+
+
+class HealthMonitor:
+    """
+    Probes every node concurrently in the background and keeps the latest
+    result as a snapshot, so /status answers without touching the databases.
+
+    Per node the probe reads:
+    - rows: InnoDB's table statistics for movies (an estimate kept current by
+      the engine, no COUNT(*) scan),
+    - lastUpdate: the newest commit/apply record in that node's transaction_logs,
+      or the newest transaction the node applied (its applied_transactions, which
+      2PC prepares, log shipping and replication all fill in), whichever is later.
+      Both are read off the node, so every worker process reports the same.
+
+    A node that does not answer within probe_timeout is reported OFFLINE; it
+    never holds up the other probes or the /status response. Each entry also
+    carries the node's circuit breaker state: while it is open the probe fails
+    immediately, and once it turns half-open these probes are what close it.
+    Breakers are per process, so every worker runs its own probes; a probe is
+    two index lookups per node, never a scan.
+    """
+
+    # Log records that mean "data on this node changed"
+    UPDATE_STATUSES = ('GLOBAL_COMMIT', 'LOCAL_COMMIT', 'REPLICATION_SUCCESS')
+
+    def __init__(self, node_keys, interval=5, probe_timeout=3):
+        self.node_keys = list(node_keys)
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self._snapshot = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- Snapshot ---
+
+    def snapshot(self):
+        """Latest status per node; probes synchronously once if nothing has been collected yet."""
+        with self._lock:
+            snapshot = dict(self._snapshot)
+        if not snapshot:
+            snapshot = self.probe_all()
+        return snapshot
+
+    # --- Probing ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_all()
+            except Exception as e:
+                print(f"Health monitor: probe round failed: {e}")
+            time.sleep(self.interval)
+
+    def probe_all(self):
+        # A node whose previous probe is still hanging is not probed again (and stays OFFLINE),
+        # so a dead node can never pile up blocked probe threads
+        with self._lock:
+            to_probe = [key for key in self.node_keys if key not in self._in_flight]
+            self._in_flight.update(to_probe)
+        results = run_on_nodes(to_probe, self._probe_once, timeout=self.probe_timeout)
+        checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        snapshot = {}
+        with self._lock:
+            for node_key in self.node_keys:
+                probe = results.get(node_key)
+                if probe is None:
+                    snapshot[node_key] = {
+                        "status": "OFFLINE",
+                        "rows": 0,
+                        "lastUpdate": "N/A",
+                        "circuit": get_pool(node_key).breaker.state,
+                        "checkedAt": checked_at
+                    }
+                    continue
+                last_update = probe['last_update']
+                snapshot[node_key] = {
+                    "status": "ONLINE",
+                    "rows": probe['rows'],
+                    "rowsEstimated": True,
+                    "lastUpdate": last_update.strftime('%Y-%m-%d %H:%M:%S') if last_update else "N/A",
+                    "latencyMs": probe['latency_ms'],
+                    "circuit": get_pool(node_key).breaker.state,
+                    "checkedAt": checked_at
+                }
+            self._snapshot = snapshot
+        return snapshot
+
+    def _probe_once(self, node_key):
+        try:
+            return self._probe(node_key)
+        finally:
+            with self._lock:
+                self._in_flight.discard(node_key)
+
+    def _probe(self, node_key):
+        started = time.monotonic()
+        conn = get_db_connection(node_key)
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            try:
+                # MySQL 8 caches table statistics for a day by default; ask the engine directly
+                cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+            except Exception:
+                pass
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'movies'")
+            row = cursor.fetchone()
+            rows = int(row[0] or 0) if row else 0
+
+            last_update = None
+            try:
+                # Newest matching record, found by walking the primary key backwards
+                placeholders = ', '.join(['%s'] * len(self.UPDATE_STATUSES))
+                cursor.execute(
+                    f"SELECT log_timestamp FROM transaction_logs WHERE status IN ({placeholders}) "
+                    f"ORDER BY log_id DESC LIMIT 1", self.UPDATE_STATUSES)
+                row = cursor.fetchone()
+                last_update = row[0] if row else None
+            except Exception as e:
+                print(f"Health monitor: no transaction log on {node_key}: {e}")
+            try:
+                cursor.execute("SELECT applied_at FROM applied_transactions ORDER BY applied_at DESC LIMIT 1")
+                row = cursor.fetchone()
+                if row and row[0] and (last_update is None or row[0] > last_update):
+                    last_update = row[0]
+            except Exception as e:
+                print(f"Health monitor: no applied_transactions on {node_key}: {e}")
+            cursor.close()
+
+            return {"rows": rows, "last_update": last_update,
+                    "latency_ms": round((time.monotonic() - started) * 1000, 1)}
+        finally:
+            conn.close()
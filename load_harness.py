@@ -0,0 +1,417 @@
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import partial
+
+from db_helpers import get_db_connection, ISOLATION_LEVELS, CENTRAL_KEY, set_isolation_level, simulate_outage
+
+# Requests the simulated clients issue, with their default weights
+READ_MIX = {'movies': 80, 'report': 20}
+WRITE_MIX = {'insert': 30, 'update': 60, 'delete': 10}
+
+# Upper bounds (ms) of the latency histogram buckets; anything slower lands in the last, open one
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+SIM_REGIONS = ('US', 'JP', 'FR', 'DE', 'GB')
+CLEANUP_CHUNK = 500
+# Seconds a scenario waits for requests still in flight when it ends; the rest finish on
+# their own, and rows they leave behind are swept by the next run
+DRAIN_TIMEOUT = 2
+
+
+def _percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(int(math.ceil(pct / 100 * len(samples))) - 1, 0)
+    return round(samples[rank], 2)
+
+
+class LatencyRecorder:
+    """Every sample of one operation (or 2PC phase), for exact percentiles."""
+
+    def __init__(self):
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        buckets = Counter()
+        for ms in samples:
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound), len(LATENCY_BUCKETS_MS))
+            buckets[labels[index]] += 1
+        return {
+            "count": len(samples),
+            "mean_ms": round(sum(samples) / len(samples), 2),
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "p99_ms": _percentile(samples, 99),
+            "max_ms": round(samples[-1], 2),
+            "histogram": {label: buckets[label] for label in labels if buckets[label]},
+        }
+
+
+class _OperationStats:
+    __slots__ = ('count', 'errors', 'committed', 'aborted', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0         # HTTP errors and exceptions
+        self.committed = 0
+        self.aborted = 0
+        self.latency = LatencyRecorder()
+
+
+class _Scenario:
+    """Keys and counters of one scenario run, shared by its client threads."""
+
+    def __init__(self, cfg, isolation_level):
+        self.cfg = cfg
+        self.isolation_level = isolation_level
+        self.run_id = uuid.uuid4().hex[:8]
+        self.hot_keys = []
+        self.cold_keys = []     # rows this scenario inserted and has not deleted yet
+        self.operations = {op: _OperationStats() for op in list(cfg['read_mix']) + list(cfg['write_mix'])}
+        self.phases = {}
+        self.deadlocks = 0
+        self.lock_wait_timeouts = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def new_key(self, kind='cold'):
+        with self._lock:
+            self._seq += 1
+            return f"sim-{self.run_id}-{kind}-{self._seq}"
+
+    def take_cold_key(self, rng):
+        with self._lock:
+            if not self.cold_keys:
+                return None
+            return self.cold_keys.pop(rng.randrange(len(self.cold_keys)))
+
+    def pick_update_key(self, rng):
+        with self._lock:
+            if self.hot_keys and (rng.random() < self.cfg['hot_fraction'] or not self.cold_keys):
+                return rng.choice(self.hot_keys)
+            return rng.choice(self.cold_keys) if self.cold_keys else None
+
+    def settle(self, op, key, committed):
+        """Keeps cold_keys in line with what actually got committed."""
+        if (op == 'insert' and committed) or (op == 'delete' and not committed):
+            with self._lock:
+                self.cold_keys.append(key)
+
+    def record(self, op, seconds, ok, body, phases):
+        stats = self.operations[op]
+        stats.latency.add(seconds)
+        decision = body.get('decision')
+        failures = ' '.join(body.get('logs') or [])
+        with self._lock:
+            stats.count += 1
+            if not ok:
+                stats.errors += 1
+            elif decision == 'COMMITTED':
+                stats.committed += 1
+            elif decision == 'ABORTED':
+                stats.aborted += 1
+            if 'Deadlock' in failures or '1213' in failures:
+                self.deadlocks += 1
+            if 'Lock wait timeout' in failures or '1205' in failures:
+                self.lock_wait_timeouts += 1
+            for phase, phase_seconds in (phases or {}).items():
+                self.phases.setdefault(phase, LatencyRecorder()).add(phase_seconds)
+
+
+class LoadHarness:
+    """
+    Load generator behind /simulate-concurrency. Concurrent simulated clients
+    call this server's own routes through Flask's test client, so every request
+    takes the same path as a real one, and the harness measures the results.
+
+    One scenario runs per requested isolation level, each for `duration`
+    seconds (plus up to DRAIN_TIMEOUT for requests in flight at the end); all
+    of them together get at most max_duration seconds, so the request
+    finishes well inside the server's worker timeout:
+    - hot_keys rows are seeded and a hot_fraction of updates and reads go to
+      them (lock contention);
+    - `readers` threads issue READ_MIX requests and `writers` threads issue
+      WRITE_MIX requests for `duration` seconds;
+    - optionally fail_node is taken down (no new connections) fail_after
+      seconds in, for fail_for seconds;
+    - requests still in flight DRAIN_TIMEOUT seconds after the end are not
+      waited for.
+    Once the last scenario is over, every simulated row (titleId sim-*) is
+    deleted again; rows a killed run never got to delete are swept the same
+    way before the next run starts.
+
+    Reported per scenario: throughput, p50/p95/p99 latency with a histogram per
+    operation and per 2PC phase (from the coordinator's phase listeners), and
+    commit / abort / deadlock / lock wait timeout counts.
+
+    The isolation level and the simulated outage apply to the whole server while
+    a scenario runs, so simulations belong on a lab deployment.
+    """
+
+    def __init__(self, app, coordinator, node_keys, max_duration=20, max_clients=64, lock=None):
+        self.app = app
+        self.node_keys = list(node_keys)
+        self.max_duration = max_duration
+        self.max_clients = max_clients
+        self.lock = lock            # named lock shared by the node's processes, e.g. the log manager's exclusive()
+        self._run_lock = threading.Lock()
+        self._phases = None         # txn_id -> {phase: seconds}, only while a scenario runs
+        self._phases_lock = threading.Lock()
+        if coordinator:
+            coordinator.add_phase_listener(self._on_phase)
+
+    def _on_phase(self, txn_id, phase, seconds):
+        with self._phases_lock:
+            if self._phases is not None:
+                self._phases.setdefault(txn_id, {})[phase] = seconds
+
+    def _take_phases(self, txn_id):
+        with self._phases_lock:
+            return self._phases.pop(txn_id, None) if self._phases is not None and txn_id else None
+
+    # --- Configuration ---
+
+    def configure(self, data):
+        """Turns a request body into a scenario config. Raises ValueError on bad input."""
+        levels = [str(level).upper() for level in data.get('isolation_levels') or ['REPEATABLE READ']]
+        levels = list(dict.fromkeys(levels))
+        cfg = {
+            'duration': min(float(data.get('duration', 5)), self.max_duration / len(levels) - DRAIN_TIMEOUT),
+            'readers': int(data.get('readers', 4)),
+            'writers': int(data.get('writers', 4)),
+            'read_mix': {op: float(w) for op, w in (data.get('read_mix') or READ_MIX).items()},
+            'write_mix': {op: float(w) for op, w in (data.get('write_mix') or WRITE_MIX).items()},
+            'hot_keys': int(data.get('hot_keys', 5)),
+            'hot_fraction': float(data.get('hot_fraction', 0.5)),
+            'isolation_levels': levels,
+            'consistency': data.get('consistency'),
+            'node': data.get('node', 'node1'),
+            'fail_node': data.get('fail_node'),
+            'fail_after': float(data.get('fail_after', 1)),
+            'fail_for': float(data.get('fail_for', 2)),
+        }
+        if cfg['duration'] <= 0:
+            raise ValueError(f"duration must be positive; all isolation levels together get {self.max_duration}s, "
+                             f"{DRAIN_TIMEOUT}s of it per level to finish in-flight requests.")
+        if cfg['readers'] < 0 or cfg['writers'] < 0 or not 0 < cfg['readers'] + cfg['writers'] <= self.max_clients:
+            raise ValueError(f"readers + writers must be between 1 and {self.max_clients}.")
+        if not set(cfg['read_mix']) <= set(READ_MIX) or not set(cfg['write_mix']) <= set(WRITE_MIX):
+            raise ValueError(f"read_mix takes {', '.join(READ_MIX)}; write_mix takes {', '.join(WRITE_MIX)}.")
+        if (cfg['readers'] and not any(cfg['read_mix'].values())) or \
+                (cfg['writers'] and not any(cfg['write_mix'].values())):
+            raise ValueError("A mix needs at least one positive weight.")
+        for level in cfg['isolation_levels']:
+            if level not in ISOLATION_LEVELS:
+                raise ValueError(f"Unknown isolation level {level!r}; use one of {', '.join(ISOLATION_LEVELS)}.")
+        if cfg['node'] not in self.node_keys or (cfg['fail_node'] and cfg['fail_node'] not in self.node_keys):
+            raise ValueError(f"node / fail_node must be one of {', '.join(self.node_keys)}.")
+        return cfg
+
+    # --- Running ---
+
+    def run(self, data):
+        """All scenarios of one simulation; None if another simulation is still running."""
+        cfg = self.configure(data)
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            if self.lock is None:
+                return self._run(cfg)
+            with self.lock('load_harness') as acquired:
+                # Another worker process of this node is simulating
+                return self._run(cfg) if acquired else None
+        finally:
+            self._run_lock.release()
+
+    def _run(self, cfg):
+        client = self.app.test_client()
+        swept = self._cleanup(client)
+        if swept["deleted"] or swept["failed"]:
+            print(f"Simulation: swept {swept['deleted']} row(s) an earlier run left behind.")
+        scenarios = [self._scenario(cfg, level) for level in cfg['isolation_levels']]
+        return {"config": cfg, "swept": swept, "scenarios": scenarios, "cleanup": self._cleanup(client)}
+
+    def _scenario(self, cfg, isolation_level):
+        scenario = _Scenario(cfg, isolation_level)
+        outage = {}
+        client = self.app.test_client()
+        print(f"Simulation {scenario.run_id}: {cfg['readers']} reader(s), {cfg['writers']} writer(s), "
+              f"{isolation_level}, {cfg['duration']}s.")
+
+        set_isolation_level(isolation_level)
+        with self._phases_lock:
+            self._phases = {}
+        try:
+            self._seed(client, scenario)
+            stop = threading.Event()
+            threads = [threading.Thread(target=self._client, args=(scenario, cfg['read_mix'], stop), daemon=True)
+                       for _ in range(cfg['readers'])]
+            threads += [threading.Thread(target=self._client, args=(scenario, cfg['write_mix'], stop), daemon=True)
+                        for _ in range(cfg['writers'])]
+            if cfg['fail_node']:
+                threads.append(threading.Thread(target=self._inject_failure, args=(cfg, stop, outage), daemon=True))
+
+            started = time.monotonic()
+            for thread in threads:
+                thread.start()
+            stop.wait(cfg['duration'])
+            stop.set()
+            drain_deadline = time.monotonic() + DRAIN_TIMEOUT
+            for thread in threads:
+                thread.join(max(drain_deadline - time.monotonic(), 0))
+            stragglers = sum(thread.is_alive() for thread in threads)
+            elapsed = time.monotonic() - started
+        finally:
+            if cfg['fail_node']:
+                simulate_outage(cfg['fail_node'], down=False)
+            set_isolation_level(None)
+            with self._phases_lock:
+                self._phases = None
+
+        operations = {op: {
+            "count": stats.count,
+            "errors": stats.errors,
+            "committed": stats.committed,
+            "aborted": stats.aborted,
+            "latency": stats.latency.summary(),
+        } for op, stats in scenario.operations.items()}
+        requests = sum(stats.count for stats in scenario.operations.values())
+        return {
+            "run_id": scenario.run_id,
+            "isolation_level": isolation_level,
+            "duration_s": round(elapsed, 2),
+            "requests": requests,
+            "throughput_rps": round(requests / elapsed, 1) if elapsed else 0,
+            "committed": sum(stats.committed for stats in scenario.operations.values()),
+            "aborted": sum(stats.aborted for stats in scenario.operations.values()),
+            "errors": sum(stats.errors for stats in scenario.operations.values()),
+            "deadlocks": scenario.deadlocks,
+            "lock_wait_timeouts": scenario.lock_wait_timeouts,
+            "operations": operations,
+            "phases": {phase: recorder.summary() for phase, recorder in sorted(scenario.phases.items())},
+            "failure_injection": outage or None,
+            "stragglers": stragglers,
+        }
+
+    def _client(self, scenario, mix, stop):
+        client = self.app.test_client()
+        rng = random.Random()
+        ops, weights = zip(*mix.items())
+        while not stop.is_set():
+            self._issue(client, scenario, rng.choices(ops, weights)[0], rng)
+
+    def _inject_failure(self, cfg, stop, outage):
+        if stop.wait(cfg['fail_after']):
+            return
+        simulate_outage(cfg['fail_node'], down=True)
+        print(f"Simulation: {cfg['fail_node']} is DOWN.")
+        outage.update({"node": cfg['fail_node'], "down_after_s": cfg['fail_after']})
+        began = time.monotonic()
+        stop.wait(cfg['fail_for'])
+        simulate_outage(cfg['fail_node'], down=False)
+        print(f"Simulation: {cfg['fail_node']} is back UP.")
+        outage["down_for_s"] = round(time.monotonic() - began, 2)
+
+    # --- Requests ---
+
+    def _issue(self, client, scenario, op, rng):
+        cfg = scenario.cfg
+        write = {} if not cfg['consistency'] else {'consistency': cfg['consistency']}
+        key = None
+
+        if op == 'movies':
+            if scenario.hot_keys and rng.random() < cfg['hot_fraction']:
+                url = f"/movies?node={cfg['node']}&titleId={rng.choice(scenario.hot_keys)}&titleIdMatch=exact"
+            else:
+                url = f"/movies?node={cfg['node']}&limit=20&offset={rng.randrange(0, 1000, 20)}"
+            call = partial(client.get, url)
+        elif op == 'report':
+            call = partial(client.get, f"/report/{rng.choice(('distribution', 'types'))}?node={cfg['node']}")
+        elif op == 'insert':
+            key = scenario.new_key()
+            # No ?node=: a coordinating node outside the region's fragment would keep a copy /batch deletes can't find
+            call = partial(client.post, "/insert", json=dict(
+                write, titleId=key, ordering=1, title=f"Simulated {key}", region=rng.choice(SIM_REGIONS),
+                language='en', types='simulation', attributes='', isOriginalTitle=0))
+        elif op == 'update':
+            key = scenario.pick_update_key(rng)
+            if key is None:
+                return self._issue(client, scenario, 'insert', rng)
+            call = partial(client.post, "/update", json=dict(write, titleId=key, ordering=1, title=f"Updated {time.time()}"))
+        else:
+            key = scenario.take_cold_key(rng)
+            if key is None:
+                return self._issue(client, scenario, 'insert', rng)
+            call = partial(client.post, "/delete", json=dict(write, titleId=key))
+
+        started = time.monotonic()
+        try:
+            response = call()
+            ok = response.status_code < 400
+            body = response.get_json(silent=True) or {}
+        except Exception as e:
+            print(f"Simulation: {op} failed: {e}")
+            ok, body = False, {}
+        scenario.record(op, time.monotonic() - started, ok, body, self._take_phases(body.get('txn_id')))
+        scenario.settle(op, key, ok and body.get('decision') == 'COMMITTED')
+
+    def _seed(self, client, scenario):
+        keys = [scenario.new_key('hot') for _ in range(scenario.cfg['hot_keys'])]
+        if not keys:
+            return
+        response = client.post('/batch', json={"operations": [
+            {"op": "INSERT", "titleId": key, "ordering": 1, "title": f"Hot {key}", "region": SIM_REGIONS[i % len(SIM_REGIONS)],
+             "language": 'en', "types": 'simulation', "attributes": '', "isOriginalTitle": 0}
+            for i, key in enumerate(keys)
+        ]})
+        if response.status_code < 400 and (response.get_json(silent=True) or {}).get('decision') == 'COMMITTED':
+            scenario.hot_keys = keys
+        else:
+            print(f"Simulation {scenario.run_id}: could not seed hot keys; running without contention.")
+
+    def _cleanup(self, client):
+        """Deletes every simulated row, found on Central (which holds every row), CLEANUP_CHUNK per /batch transaction."""
+        result = {"deleted": 0, "failed": 0}
+        keys = self._simulated_keys()
+        for i in range(0, len(keys), CLEANUP_CHUNK):
+            chunk = keys[i:i + CLEANUP_CHUNK]
+            response = client.post('/batch', json={"operations": [{"op": "DELETE", "titleId": key} for key in chunk]})
+            if response.status_code < 400 and (response.get_json(silent=True) or {}).get('decision') == 'COMMITTED':
+                result["deleted"] += len(chunk)
+            else:
+                result["failed"] += len(chunk)
+        if result["failed"]:
+            print(f"Simulation: {result['failed']} row(s) left behind (titleId sim-*), swept by the next run.")
+        return result
+
+    @staticmethod
+    def _simulated_keys():
+        conn = get_db_connection(CENTRAL_KEY)
+        if not conn:
+            return []
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT titleId FROM movies WHERE titleId LIKE %s", ('sim-%',))
+            keys = [title_id for title_id, in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+            return keys
+        except Exception as e:
+            print(f"Simulation: could not look for leftover rows: {e}")
+            return []
+        finally:
+            conn.close()
@@ -0,0 +1,289 @@
+"""
+A local stand-in for the three MySQL nodes, for benchmarking and profiling
+without the lab network.
+
+install() swaps mysql.connector.connect for a driver backed by one SQLite
+database per node (plus an attached database holding that node's
+transaction_logs, so log writes never queue behind a participant's open
+write). Connections keep the hosts in DB_CONFIG, so the pools, coordinator,
+log manager and read paths run unmodified. Every round trip (connect, execute,
+commit, rollback, ping) sleeps for the node's configured latency, so network
+cost can be put back in:
+
+    import local_cluster
+    local_cluster.install(latency_ms={'node1': 0.5, 'node2': 2, 'node3': 2}, jitter=0.2)
+    local_cluster.reset()
+    local_cluster.seed(20000)
+    import app
+
+MySQL-only statements the app issues (information_schema lookups, EXPLAIN,
+GET_LOCK, FOR UPDATE, ON DUPLICATE KEY UPDATE, ...) are translated or answered
+with what a freshly set up MySQL node would say. SQLite locks a whole database
+per writer, so concurrent writes to the same node serialize much harder than
+under InnoDB; compare write numbers with each other, not with the lab.
+"""
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+
+import mysql.connector
+
+from db_helpers import DB_CONFIG, get_fragment_key
+
+MOVIES_DDL = """
+CREATE TABLE IF NOT EXISTS movies (
+    titleId VARCHAR(20), ordering INTEGER, title TEXT, region VARCHAR(10), language VARCHAR(10),
+    types VARCHAR(50), attributes VARCHAR(100), isOriginalTitle INTEGER,
+    PRIMARY KEY (titleId, ordering)
+);
+CREATE INDEX IF NOT EXISTS idx_movies_region ON movies (region);
+CREATE TABLE IF NOT EXISTS applied_transactions (transaction_id BLOB PRIMARY KEY, applied_at TIMESTAMP NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_applied_at ON applied_transactions (applied_at);
+CREATE TABLE IF NOT EXISTS report_aggregates (
+    node_key VARCHAR(10), region VARCHAR(50), types VARCHAR(50), row_count INTEGER NOT NULL,
+    PRIMARY KEY (node_key, region, types)
+);
+CREATE TABLE IF NOT EXISTS report_aggregate_builds (node_key VARCHAR(10) PRIMARY KEY, built_at TIMESTAMP NOT NULL);
+"""
+LOGS_DDL = """
+CREATE TABLE IF NOT EXISTS logs.transaction_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id BLOB NOT NULL, log_timestamp TIMESTAMP NOT NULL,
+    operation_type TEXT, record_key TEXT, new_value TEXT, replication_target INTEGER, status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs.idx_logs_txn_target_status ON transaction_logs (transaction_id, replication_target, status);
+CREATE INDEX IF NOT EXISTS logs.idx_logs_status_target ON transaction_logs (status, replication_target, log_id);
+"""
+
+SEED_REGIONS = ('US', 'JP', 'FR', 'DE', 'GB', 'IN', 'BR', 'KR', 'ES', 'IT')
+SEED_TYPES = ('imdbDisplay', 'original', 'alternative', 'working', 'festival', 'dvd', 'tv', 'video')
+SEED_WORDS = ('night', 'river', 'last', 'city', 'love', 'dark', 'summer', 'king', 'blue', 'house',
+              'war', 'secret', 'road', 'dream', 'star', 'winter', 'stone', 'island', 'fire', 'song')
+
+_settings = {'dir': None, 'latency': {}, 'jitter': 0.0}
+_HOSTS = {}
+
+# --- Setup ---
+
+def install(data_dir=None, latency_ms=None, jitter=0.0):
+    """
+    Routes every mysql.connector.connect() to the local nodes.
+
+    Args:
+        data_dir (str): Where the node databases live, created if missing (default: a new temp dir).
+        latency_ms (float or dict): Per round trip delay, for all nodes or per node_key.
+        jitter (float): Random +/- fraction applied to each delay.
+    """
+    _settings['dir'] = data_dir or _settings['dir'] or tempfile.mkdtemp(prefix='local_cluster_')
+    os.makedirs(_settings['dir'], exist_ok=True)
+    if not isinstance(latency_ms, dict):
+        latency_ms = {node_key: latency_ms or 0 for node_key in DB_CONFIG}
+    _settings['latency'] = {node_key: float(latency_ms.get(node_key, 0)) / 1000 for node_key in DB_CONFIG}
+    _settings['jitter'] = jitter
+    _HOSTS.update({(cfg['host'], cfg.get('port', 3306)): node_key for node_key, cfg in DB_CONFIG.items()})
+    mysql.connector.connect = LocalConnection
+    return _settings['dir']
+
+def parse_latency(spec):
+    """'2' -> 2.0 for every node; 'node1=0.5,node2=3' -> per node (missing nodes get 0)."""
+    if not spec:
+        return 0.0
+    if '=' not in spec:
+        return float(spec)
+    return {key.strip(): float(value) for key, value in (part.split('=') for part in spec.split(','))}
+
+def _paths(node_key):
+    return os.path.join(_settings['dir'], f'{node_key}.db'), os.path.join(_settings['dir'], f'{node_key}_logs.db')
+
+def reset():
+    """Recreates empty movies / transaction_logs tables on every node."""
+    for node_key in DB_CONFIG:
+        for path in _paths(node_key):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        db = _open(node_key)
+        db.executescript(MOVIES_DDL + LOGS_DDL)
+        db.commit()
+        db.close()
+
+def seed(rows, seed_value=42):
+    """
+    Loads `rows` deterministic movie rows: all of them on Central, each one also
+    on the fragment owning its region. Returns the generated titleIds.
+    """
+    rng = random.Random(seed_value)
+    data, title_ids = [], []
+    i = 0
+    while len(data) < rows:
+        i += 1
+        title_id = f"tt{i:07d}"
+        title_ids.append(title_id)
+        title = ' '.join(rng.choice(SEED_WORDS) for _ in range(rng.randint(1, 4))).title()
+        for ordering in range(1, rng.randint(1, 4) + 1):
+            data.append((title_id, ordering, title, rng.choice(SEED_REGIONS), 'en', rng.choice(SEED_TYPES), '',
+                         int(ordering == 1)))
+    data = data[:rows]
+
+    insert = "INSERT INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    for node_key in DB_CONFIG:
+        db = _open(node_key)
+        if node_key == 'node1':
+            db.executemany(insert, data)
+        else:
+            db.executemany(insert, [row for row in data if get_fragment_key(row[3]) == node_key])
+        db.commit()
+        db.close()
+    return title_ids
+
+def _open(node_key):
+    movies_path, logs_path = _paths(node_key)
+    db = sqlite3.connect(movies_path, timeout=30, check_same_thread=False, isolation_level='DEFERRED',
+                         detect_types=sqlite3.PARSE_DECLTYPES)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('ATTACH DATABASE ? AS logs', (logs_path,))
+    db.execute('PRAGMA logs.journal_mode=WAL')
+    return db
+
+def _round_trip(node_key):
+    delay = _settings['latency'].get(node_key, 0)
+    if delay:
+        jitter = _settings['jitter']
+        time.sleep(delay * random.uniform(1 - jitter, 1 + jitter) if jitter else delay)
+
+# --- MySQL to SQLite ---
+
+_VALUES_FN = re.compile(r'VALUES\((\w+)\)')
+
+def translate(query):
+    query = query.replace('%s', '?')
+    query = re.sub(r'\s+FOR UPDATE\b', '', query)
+    query = re.sub(r'\s+LOCK IN SHARE MODE\b', '', query)
+    if 'ON DUPLICATE KEY UPDATE' in query:
+        head, tail = query.split('ON DUPLICATE KEY UPDATE', 1)
+        query = head + 'ON CONFLICT DO UPDATE SET' + _VALUES_FN.sub(r'excluded.\1', tail)
+    return query
+
+
+class LocalCursor:
+    """The slice of the mysql.connector cursor API the app uses."""
+
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._dictionary = dictionary
+        self._cursor = conn._db.cursor()
+        self._canned = None         # rows answered without running SQL
+        self._columns = ()
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        self._conn._round_trip()
+        self._canned = None
+        canned = self._answer(query.strip())
+        if canned is not None:
+            self._columns, rows = canned
+            self._canned = list(rows)
+            self.rowcount = len(self._canned)
+            return
+        self._cursor.execute(translate(query.strip()), tuple(params or ()))
+        self._columns = tuple(col[0] for col in self._cursor.description or ())
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, query, rows):
+        self._conn._round_trip()
+        self._canned = None
+        self._cursor.executemany(translate(query.strip()), [tuple(row) for row in rows])
+        self.rowcount = self._cursor.rowcount
+
+    def _answer(self, query):
+        """(columns, rows) for statements SQLite has no equivalent of, else None."""
+        upper = query.upper()
+        if upper.startswith('SET ') or upper.startswith('EXPLAIN'):
+            return (), []
+        if 'GET_LOCK' in upper or 'RELEASE_LOCK' in upper:
+            return ('lock',), [(1,)]
+        if re.match(r'CREATE TABLE IF NOT EXISTS (TRANSACTION_LOGS|APPLIED_TRANSACTIONS|REPORT_AGGREGATE)', upper):
+            return (), []
+        if 'TABLE_COMMENT' in upper:
+            from log_manager import LOG_TABLE_COMMENT
+            return ('TABLE_COMMENT',), [(LOG_TABLE_COMMENT,)]
+        if 'INFORMATION_SCHEMA.TABLES' in upper and 'TABLE_ROWS' in upper:
+            count = self._conn._db.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+            return ('total' if ' AS TOTAL' in upper else 'TABLE_ROWS',), [(count,)]
+        if 'INFORMATION_SCHEMA' in upper:
+            return (), []
+        return None
+
+    def _shape(self, rows):
+        if not self._dictionary:
+            return [tuple(row) for row in rows]
+        return [dict(zip(self._columns, row)) for row in rows]
+
+    def fetchall(self):
+        if self._canned is not None:
+            rows, self._canned = self._canned, []
+            return self._shape(rows)
+        return self._shape(self._cursor.fetchall())
+
+    def fetchone(self):
+        if self._canned is not None:
+            return self._shape([self._canned.pop(0)])[0] if self._canned else None
+        row = self._cursor.fetchone()
+        return self._shape([row])[0] if row is not None else None
+
+    def fetchmany(self, size=1):
+        if self._canned is not None:
+            rows, self._canned = self._canned[:size], self._canned[size:]
+            return self._shape(rows)
+        return self._shape(self._cursor.fetchmany(size))
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class LocalConnection:
+    """Stands in for mysql.connector's connection to the node DB_CONFIG maps this host to."""
+
+    def __init__(self, **config):
+        key = (config.get('host'), config.get('port', 3306))
+        if key not in _HOSTS:
+            raise mysql.connector.Error(msg=f"local_cluster: no node at {key[0]}:{key[1]}")
+        self.node_key = _HOSTS[key]
+        self._round_trip()
+        self._db = _open(self.node_key)
+
+    def _round_trip(self):
+        _round_trip(self.node_key)
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def cursor(self, dictionary=False, **kwargs):
+        return LocalCursor(self, dictionary)
+
+    def commit(self):
+        self._round_trip()
+        self._db.commit()
+
+    def rollback(self):
+        self._round_trip()
+        self._db.rollback()
+
+    def start_transaction(self, **kwargs):
+        pass
+
+    def ping(self, reconnect=False, **kwargs):
+        self._round_trip()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,82 @@
+from db_helpers import get_db_connection, get_fragment_key, CENTRAL_KEY, FRAGMENT_KEYS
+
+
+class LocationDirectory:
+    """
+    Tells the coordinator which fragments (node2/node3) hold a titleId.
+
+    Central holds every row with its region, and the region decides the
+    fragment, so Central's (titleId, ordering) primary key is the directory:
+    one index range read per lookup, current whichever process, REDO pass or
+    replication retry wrote the row. A titleId whose rows span regions is
+    owned by more than one fragment.
+
+    A lookup made before a 2PC can be overtaken by a concurrent INSERT of the
+    same titleId, so writes also run Central's prepare through prepare_locked():
+    it re-reads the owners with FOR UPDATE, which (under InnoDB's default
+    REPEATABLE READ) locks the titleIds' key ranges against new rows until the
+    transaction ends, and votes NO if a fragment the write skipped holds one
+    of them by then.
+    """
+
+    def __init__(self, central_key=CENTRAL_KEY, fragment_keys=FRAGMENT_KEYS):
+        self.central_key = central_key
+        self.fragment_keys = tuple(fragment_keys)
+
+    def locate(self, title_ids):
+        """
+        {titleId: set of fragments holding its rows} for title_ids (an empty set
+        for a titleId with no rows). If Central can't tell, every titleId maps
+        to every fragment.
+        """
+        conn = get_db_connection(self.central_key)
+        if conn:
+            try:
+                cursor = conn.cursor()
+                located = self._locate(cursor, title_ids)
+                cursor.close()
+                conn.commit()
+                return located
+            except Exception as e:
+                print(f"Location directory: could not look up {len(title_ids)} titleId(s) on Central: {e}")
+            finally:
+                conn.close()
+        return {title_id: set(self.fragment_keys) for title_id in title_ids}
+
+    def owners(self, title_id):
+        return self.locate([title_id])[title_id]
+
+    def prepare_locked(self, placement, task, conn):
+        """
+        Central's prepare task for a write sent to the fragments in placement
+        ({titleId: fragments}, from locate()): locks those titleIds' rows, checks
+        no other fragment has rows of them, then runs task in the same transaction.
+        """
+        try:
+            cursor = conn.cursor()
+            located = self._locate(cursor, placement, lock=True)
+            cursor.close()
+        except Exception as e:
+            conn.close()
+            return {"success": False, "error": f"Could not lock the rows' owners: {e}", "rows_affected": 0}
+        moved = {title_id for title_id, fragments in located.items() if fragments - set(placement[title_id])}
+        if moved:
+            conn.close()
+            return {"success": False, "rows_affected": 0,
+                    "error": f"Rows of {', '.join(sorted(moved)[:5])} were written to another fragment meanwhile; "
+                             f"retry the write."}
+        return task(conn=conn)
+
+    def _locate(self, cursor, title_ids, lock=False, chunk=1000):
+        title_ids = sorted(set(title_ids))
+        located = {title_id: set() for title_id in title_ids}
+        for i in range(0, len(title_ids), chunk):
+            part = title_ids[i:i + chunk]
+            cursor.execute(
+                f"SELECT DISTINCT titleId, region FROM movies WHERE titleId IN ({', '.join(['%s'] * len(part))})"
+                + (" FOR UPDATE" if lock else ""), part)
+            for title_id, region in cursor.fetchall():
+                fragment = get_fragment_key(region)
+                if title_id in located and fragment in self.fragment_keys:
+                    located[title_id].add(fragment)
+        return located
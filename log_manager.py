@@ -1,51 +1,444 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+import gzip
 import json
-from db_helpers import get_db_connection
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import applied_transactions
+from db_helpers import get_db_connection, get_fragment_key, DB_CONFIG, FRAGMENT_KEYS
+from metrics import METRICS
+from redo_replay import RedoReplayEngine
+
+# --- Log Record Format ---
+# v1: VARCHAR(36) transaction ids, free-text status, full JSON after-images, no secondary index.
+# v2: BINARY(16) transaction ids, ENUM status / operation codes (1 byte each, still compared
+#     as strings in SQL), column-delta images and indexes for every status lookup.
+LOG_FORMAT_VERSION = 2
+LOG_TABLE_COMMENT = f'log format v{LOG_FORMAT_VERSION}'
+
+LOG_STATUSES = ('PREPARE_SENT', 'READY_COMMIT', 'GLOBAL_COMMIT', 'GLOBAL_ABORT', 'LOCAL_COMMIT',
+                'REPLICATION_PENDING', 'REPLICATION_SUCCESS', 'REPLICATION_FAILED')
+LOG_OPERATION_TYPES = ('INSERT', 'UPDATE', 'DELETE', 'BATCH', 'REPLICATE')
+
+LOG_TABLE_DDL = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            log_id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+            transaction_id BINARY(16) NOT NULL,
+            log_timestamp DATETIME NOT NULL,
+            operation_type ENUM({operation_types}),
+            record_key VARCHAR(50),
+            new_value JSON,
+            replication_target TINYINT UNSIGNED,
+            status ENUM({statuses}) NOT NULL,
+            -- update_replication_status: one index seek
+            KEY idx_logs_txn_target_status (transaction_id, replication_target, status),
+            -- per-target replication backlog, newest-record-by-status lookups
+            KEY idx_logs_status_target (status, replication_target, log_id)
+        ) COMMENT = '{comment}'
+        """.format(
+            table='{table}',
+            operation_types=', '.join(f"'{op}'" for op in LOG_OPERATION_TYPES),
+            statuses=', '.join(f"'{status}'" for status in LOG_STATUSES),
+            comment=LOG_TABLE_COMMENT)
+
+def txn_id_to_bin(txn_id):
+    """'8c83ed8d-...' -> the 16 bytes stored in transaction_logs.transaction_id."""
+    return uuid.UUID(str(txn_id)).bytes
+
+def txn_id_from_bin(raw):
+    if isinstance(raw, (bytes, bytearray)) and len(raw) == 16:
+        return str(uuid.UUID(bytes=bytes(raw)))
+    return raw
+
+def compact_image(op_type, record_key, new_data):
+    """
+    The after-image as stored in the log. INSERT keeps the full row; UPDATE keeps
+    only the columns it sets (the key is already in record_key); DELETE needs none.
+    """
+    if op_type == 'BATCH':
+        return {"operations": [
+            {"operation_type": op['operation_type'], "record_key": op['record_key'],
+             "new_value": compact_image(op['operation_type'], op['record_key'], op['new_value'])}
+            for op in new_data['operations']
+        ]}
+    if op_type == 'DELETE':
+        return None
+    if op_type == 'UPDATE' and isinstance(new_data, dict):
+        return {col: value for col, value in new_data.items() if col != 'titleId'}
+    return new_data
+
+# --- REDO Entries ---
+
+def redo_entries(record):
+    """The single-row REDO entries of a READY/LOCAL_COMMIT record (BATCH records are expanded)."""
+    if record['operation_type'] != 'BATCH':
+        return [record]
+    return [
+        {'transaction_id': record['transaction_id'], 'operation_type': op['operation_type'],
+         'record_key': op['record_key'], 'new_value': json.dumps(op['new_value'])}
+        for op in json.loads(record['new_value'])['operations']
+    ]
+
+def entry_belongs_on(node_key, entry):
+    """Partition rule: Central takes everything, a fragment only INSERTs of its regions.
+    UPDATE/DELETE are keyed by titleId and are a no-op where the row does not exist."""
+    if node_key not in FRAGMENT_KEYS or entry['operation_type'] != 'INSERT':
+        return True
+    region = json.loads(entry['new_value'] or '{}').get('region')
+    return get_fragment_key(region) == node_key
+
+# --- Group Commit Log Writer ---
+
+class _LogTicket:
+    """One buffered log record and the event its writer waits on."""
+    __slots__ = ('row', 'event', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.event = threading.Event()
+        self.error = None
+
+
+class GroupCommitLogWriter:
+    """
+    Buffers transaction_logs records from concurrent transactions and flushes
+    them as ONE multi-row INSERT followed by ONE commit.
+
+    While a flush is in progress, new records pile up in the buffer and go out
+    together in the next flush, so under concurrency the number of log commits
+    grows with the number of flushes, not with the number of records. Records
+    are flushed in arrival order, so once a record is durable every record
+    appended before it is durable too.
+
+    max_delay (seconds) optionally holds a flush back to collect more records;
+    the default of 0 relies purely on records accumulating during the previous
+    flush and adds no latency to a lone writer.
+    """
+
+    INSERT_SQL = """
+        INSERT INTO transaction_logs
+        (transaction_id, log_timestamp, operation_type, record_key, new_value, replication_target, status)
+        VALUES """
+    ROW_PLACEHOLDER = "(%s, %s, %s, %s, %s, %s, %s)"
+
+    def __init__(self, connection_factory, max_batch=256, max_delay=0.0):
+        self.connection_factory = connection_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._conn = None
+        self._tracked = {}       # transaction_id (as stored) -> tickets of its unawaited records
+        self._stats = {"records": 0, "flushes": 0, "failed_flushes": 0}
+
+    def append(self, row, wait=True, track=False):
+        """
+        Queues a (transaction_id, log_timestamp, operation_type, record_key,
+        new_value, replication_target, status) row. With wait=True, blocks until
+        the batch holding it is committed and raises if that flush failed.
+        With track=True, the record is remembered until txn_failed() is asked
+        about its transaction.
+        """
+        ticket = _LogTicket(row)
+        started = time.monotonic()
+        with self._cond:
+            self._queue.append(ticket)
+            if track:
+                self._tracked.setdefault(row[0], []).append(ticket)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-group-commit', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        if wait:
+            ticket.event.wait()
+            METRICS.observe('log_append_wait_seconds', time.monotonic() - started)
+            if ticket.error is not None:
+                raise ticket.error
+        return ticket
+
+    def txn_failed(self, txn_id):
+        """
+        Waits until every tracked record of txn_id (as stored in the row) has
+        been flushed; True if any of them failed. Forgets them either way.
+        """
+        with self._cond:
+            tickets = self._tracked.pop(txn_id, [])
+        for ticket in tickets:
+            ticket.event.wait()
+        return any(ticket.error is not None for ticket in tickets)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats, queued=len(self._queue))
+        stats["avg_batch"] = round(stats["records"] / stats["flushes"], 2) if stats["flushes"] else 0
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                if self.max_delay and len(self._queue) < self.max_batch:
+                    self._cond.wait(self.max_delay)
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        sql = self.INSERT_SQL + ", ".join([self.ROW_PLACEHOLDER] * len(batch))
+        params = [value for ticket in batch for value in ticket.row]
+
+        error = None
+        started = time.monotonic()
+        # One retry on a fresh connection covers a socket that went stale between flushes
+        for _ in range(2):
+            try:
+                if self._conn is None:
+                    self._conn = self.connection_factory()
+                    if self._conn is None:
+                        raise ConnectionError("No connection available for the log writer")
+                cursor = self._conn.cursor()
+                cursor.execute(sql, params)
+                self._conn.commit()
+                cursor.close()
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if self._conn is not None:
+                    try:
+                        self._conn.discard()
+                    except Exception:
+                        pass
+                    self._conn = None
+
+        METRICS.observe('log_flush_seconds', time.monotonic() - started)
+        METRICS.inc('log_records_total', len(batch))
+        with self._cond:
+            self._stats["flushes"] += 1
+            self._stats["records"] += len(batch)
+            if error is not None:
+                self._stats["failed_flushes"] += 1
+        if error is not None:
+            print(f"FATAL LOGGING ERROR (GROUP COMMIT of {len(batch)} records): {error}")
+        for ticket in batch:
+            ticket.error = error
+            ticket.event.set()
+
+
+class _PeerLogStream:
+    """One peer's transaction_logs read page by page for catch_up(), yielding its committed records."""
+
+    def __init__(self, manager, peer_key, conn, checkpoint):
+        self.manager = manager
+        self.peer_key = peer_key
+        self.conn = conn
+        self.checkpoint = checkpoint
+        self.position = checkpoint
+        self.undecided = {}       # txn_id -> (first READY log_id, its timestamp, richest READY record)
+        self.pending = deque()    # (decided at, decision log_id, first log_id, committed record), in log order
+        self.settled_upto = checkpoint
+        self.reached_young = False
+        self.exhausted = False
+        self.last_seen = None     # timestamp of the last record read
+
+    def fetch(self):
+        rows = self.manager._fetch_log_page(self.conn, self.position)
+        settle = timedelta(seconds=self.manager.recovery_settle)
+        settle_horizon = datetime.now() - settle
+        for row in rows:
+            self.position = row['log_id']
+            txn_id = row['transaction_id']
+            status = row['status']
+
+            if status == 'READY_COMMIT':
+                first_id, first_ts, best = self.undecided.get(txn_id, (row['log_id'], row['log_timestamp'], None))
+                # One READY per participant; Central's (the most operations) covers them all
+                if best is None or len(redo_entries(row)) > len(redo_entries(best)):
+                    best = row
+                self.undecided[txn_id] = (first_id, first_ts, best)
+            elif status == 'GLOBAL_COMMIT':
+                ready = self.undecided.pop(txn_id, None)
+                if ready is not None:
+                    self.pending.append((row['log_timestamp'], row['log_id'], ready[0], ready[2]))
+            elif status == 'GLOBAL_ABORT':
+                self.undecided.pop(txn_id, None)
+            elif status == 'LOCAL_COMMIT':
+                self.pending.append((row['log_timestamp'], row['log_id'], row['log_id'], row))
+
+            # Presumed abort: the log moved on long past this READY without a decision
+            for stale in [t for t, (_, ts, _) in self.undecided.items() if row['log_timestamp'] - ts > settle]:
+                self.undecided.pop(stale)
+            if row['log_timestamp'] > settle_horizon:
+                self.reached_young = True
+            if not self.reached_young:
+                self.settled_upto = self.position
+            self.last_seen = row['log_timestamp']
+        self.exhausted = len(rows) < self.manager.recovery_page_size
+
+    def safe_checkpoint(self):
+        """The furthest log_id the checkpoint can move to without skipping anything next time."""
+        safe = self.settled_upto
+        if self.undecided:
+            safe = min(safe, min(first_id for first_id, _, _ in self.undecided.values()) - 1)
+        if self.pending:
+            safe = min(safe, min(first_id for _, _, first_id, _ in self.pending) - 1)
+        return safe
+
 
 class DistributedLogManager:
-    def __init__(self, node_id, db_connection):
+    """
+    Safe to share between threads and to run in several processes per node:
+    log records go through the group-commit writer, and every other statement
+    checks its own connection out of the node's pool. Background passes
+    (log shipping, compaction, replication retries) take a named lock on the
+    node (exclusive()), so only one process runs each pass at a time.
+
+    Creating one does no I/O; call initialize_log_table() before logging.
+    """
+
+    def __init__(self, node_id):
         self.node_id = node_id  # 1 (Central), 2, or 3
-        self.db_conn = db_connection
-        self._initialize_log_table()
+        self.node_key = f'node{node_id}'
+        # Log records go through the group-commit writer on its own pooled connection
+        self.log_writer = GroupCommitLogWriter(
+            lambda: get_db_connection(self.node_key, pinned=True),
+            max_batch=int(os.environ.get('LOG_GROUP_COMMIT_MAX_BATCH', 256)),
+            max_delay=float(os.environ.get('LOG_GROUP_COMMIT_MAX_DELAY_MS', 0)) / 1000)
 
-    def _initialize_log_table(self):
-        sql = """
-        CREATE TABLE IF NOT EXISTS transaction_logs (
-            log_id INT AUTO_INCREMENT PRIMARY KEY,
-            transaction_id VARCHAR(36) NOT NULL,
-            log_timestamp DATETIME NOT NULL,
-            operation_type VARCHAR(20), 
-            record_key VARCHAR(50), 
-            new_value JSON, 
-            replication_target INT, 
-            status VARCHAR(30) 
-            -- Note: 'old_value' omitted here for true Deferred (NO-UNDO), 
-            -- but recommended for validation (as discussed previously).
-        );
+        # Log-shipping recovery (catch_up)
+        self.recovery_page_size = int(os.environ.get('RECOVERY_PAGE_SIZE', 1000))
+        self.recovery_settle = float(os.environ.get('RECOVERY_SETTLE_SECONDS', 60))
+        self._recovery_lock = threading.Lock()
+        self.redo_engine = RedoReplayEngine(self.node_key, batch_size=int(os.environ.get('REDO_BATCH_SIZE', 500)))
+        self._shipping_thread = None
+
+        # Compaction / archival of acknowledged log records (compact_log)
+        self.archive_dir = os.environ.get('LOG_ARCHIVE_DIR', 'log_archive')
+        self.archive_segment_records = int(os.environ.get('LOG_ARCHIVE_SEGMENT_RECORDS', 10000))
+        # applied_transactions markers only need to outlive the logs they could be replayed from
+        self.applied_retention_hours = float(os.environ.get('APPLIED_TXN_RETENTION_HOURS', 168))
+        self._compaction_thread = None
+
+    @contextmanager
+    def exclusive(self, name):
+        """
+        Holds the MySQL named lock `name` on this node for the duration of the
+        block; yields False (without waiting) if another process holds it.
         """
-       
+        conn = get_db_connection(self.node_key, pinned=True)
+        if not conn:
+            yield False
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+            acquired = cursor.fetchone()[0] == 1
+            cursor.close()
+        except Exception as e:
+            print(f"Could not take lock {name} on Node {self.node_id}: {e}")
+            conn.close()
+            yield False
+            return
+        try:
+            yield acquired
+        finally:
+            try:
+                if acquired:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                    cursor.fetchone()
+                    cursor.close()
+            finally:
+                conn.close()
 
-    def log_local_commit(self, txn_id, op_type, key, new_data):
-        sql = """
-        INSERT INTO transaction_logs 
-        (transaction_id, log_timestamp, operation_type, record_key, new_value, replication_target, status)
-        VALUES (%s, %s, %s, %s, %s, NULL, 'LOCAL_COMMIT');
+    def initialize_log_table(self):
+        """Creates transaction_logs in the current format, migrating a v1 table first. Raises on failure."""
+        conn = get_db_connection(self.node_key)
+        if not conn:
+            raise ConnectionError(f"No connection available for {self.node_key}")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT TABLE_COMMENT FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transaction_logs'")
+            row = cursor.fetchone()
+            if row is not None and row[0] != LOG_TABLE_COMMENT:
+                self._migrate_log_table(conn, cursor)
+            cursor.execute(LOG_TABLE_DDL.format(table='transaction_logs'))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _migrate_log_table(self, conn, cursor, chunk=10000):
+        """
+        v1 -> v2: copies the old table into a v2 table in log_id order (keeping
+        log_ids, so recovery checkpoints stay valid) and swaps the two with one
+        atomic RENAME. The old table is kept as transaction_logs_v1 until an
+        operator drops it. Runs under a named lock so only one process migrates;
+        raises if the lock can't be had (the startup step is retried).
         """
-        params = (
-            txn_id,
+        cursor.execute("SELECT GET_LOCK('transaction_logs_migration', 300)")
+        row = cursor.fetchone()
+        # 0: another process held it for the whole 300s, NULL: error taking it
+        if row is None or row[0] != 1:
+            raise RuntimeError(f"Could not take the transaction_logs migration lock on Node {self.node_id} ({row and row[0]})")
+        try:
+            cursor.execute(
+                "SELECT TABLE_COMMENT FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'transaction_logs'")
+            row = cursor.fetchone()
+            if row is None or row[0] == LOG_TABLE_COMMENT:
+                return    # another process finished it meanwhile
+
+            print(f"Log: migrating transaction_logs on Node {self.node_id} to {LOG_TABLE_COMMENT}...")
+            cursor.execute(LOG_TABLE_DDL.format(table='transaction_logs_v2'))
+            copied = 0
+            while True:
+                cursor.execute("SELECT COALESCE(MAX(log_id), 0) FROM transaction_logs_v2")
+                last_id = cursor.fetchone()[0]
+                cursor.execute("""
+                    INSERT INTO transaction_logs_v2
+                    (log_id, transaction_id, log_timestamp, operation_type, record_key, new_value, replication_target, status)
+                    SELECT log_id,
+                           IF(IS_UUID(transaction_id), UUID_TO_BIN(transaction_id), UNHEX(MD5(transaction_id))),
+                           log_timestamp, operation_type, record_key, new_value, replication_target, status
+                    FROM transaction_logs WHERE log_id > %s ORDER BY log_id LIMIT %s
+                """, (last_id, chunk))
+                moved = cursor.rowcount
+                conn.commit()
+                copied += moved
+                if moved < chunk:
+                    break
+            cursor.execute("RENAME TABLE transaction_logs TO transaction_logs_v1, transaction_logs_v2 TO transaction_logs")
+            print(f"Log: migrated {copied} records; the old table is kept as transaction_logs_v1.")
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('transaction_logs_migration')")
+            cursor.fetchone()
+
+    def _log_row(self, txn_id, status, op_type=None, key=None, new_data=None, target=None):
+        """One transaction_logs row in the current format."""
+        image = compact_image(op_type, key, new_data) if op_type else new_data
+        return (
+            txn_id_to_bin(txn_id),
             datetime.now(),
             op_type,
             key,
-            json.dumps(new_data)
+            json.dumps(image, separators=(',', ':')) if image is not None else None,
+            target,
+            status
         )
+
+    def log_local_commit(self, txn_id, op_type, key, new_data):
+        row = self._log_row(txn_id, 'LOCAL_COMMIT', op_type, key, new_data)
         
-        # Cursor is for tracking the log transactions
         try:
-            cursor = self.db_conn.cursor()
-            cursor.execute(sql, params)
-            self.db_conn.commit() 
-            cursor.close()
+            self.log_writer.append(row)
             print(f"Log: Transaction {txn_id} committed successfully on Node {self.node_id} (LOG SAVED).")
         except Exception as e:
             print(f"FATAL LOGGING ERROR for {txn_id}: {e}")
@@ -54,20 +447,18 @@ class DistributedLogManager:
 
     def log_replication_attempt(self, txn_id, target_node):
         """Logs the start of a replication attempt to a remote node."""
-        sql = """
-        INSERT INTO transaction_logs 
-        (transaction_id, log_timestamp, operation_type, record_key, new_value, replication_target, status)
-        VALUES (%s, %s, 'REPLICATE', NULL, NULL, %s, 'REPLICATION_PENDING');
-        """
         # Fetch the original new_value if needed, but here we just log the intent.
-        
-        params = (txn_id, datetime.now(), target_node)
-        cursor = self.db_conn.cursor()
-        cursor.execute(sql, params)
-        self.db_conn.commit()
-        cursor.close()
+        row = self._log_row(txn_id, 'REPLICATION_PENDING', 'REPLICATE', target=target_node)
+        self.log_writer.append(row)
         print(f"Log: Transaction {txn_id} replication PENDING to Node {target_node}.")
     
+    def log_replication_result(self, txn_id, target_node, success=True):
+        """Logs a replication that was carried out in the background (no PENDING record first). Thread-safe."""
+        status = 'REPLICATION_SUCCESS' if success else 'REPLICATION_FAILED'
+        row = self._log_row(txn_id, status, 'REPLICATE', target=target_node)
+        self.log_writer.append(row, wait=False)
+        print(f"Log: Transaction {txn_id} replication to Node {target_node}: {status}.")
+
     def update_replication_status(self, txn_id, target_node, success=True):
         """Updates the status after a replication attempt (success or failure)."""
         new_status = 'REPLICATION_SUCCESS' if success else 'REPLICATION_FAILED'
@@ -76,170 +467,458 @@ class DistributedLogManager:
         SET status = %s 
         WHERE transaction_id = %s AND replication_target = %s AND status = 'REPLICATION_PENDING';
         """
-        params = (new_status, txn_id, target_node)
-        cursor = self.db_conn.cursor()
-        cursor.execute(sql, params)
-        self.db_conn.commit()
-        cursor.close()
+        params = (new_status, txn_id_to_bin(txn_id), target_node)
+        conn = get_db_connection(self.node_key)
+        if not conn:
+            raise ConnectionError(f"No connection available for {self.node_key}")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
         print(f"Log: Transaction {txn_id} replication status updated to {new_status} for Node {target_node}.")
 
     # --- Step 3: Global Failure Recovery Logic (Handles Case #2 and #4) ---
 
-    def recover_missed_writes(self, last_known_commit_time):
-        missed_logs = self._simulate_fetch_missed_logs(last_known_commit_time)
-
-        for log in missed_logs:
-            print(f"   -> REDO: Applying missed {log['operation_type']} for record {log['record_key']}...")
-            
-            # --- CALLING THE NEW REDO HELPER ---
-            if self._apply_redo_to_main_db(log):
-                print("      -> Successfully applied. Must acknowledge back to Node 1.")
-            
+    def recover_missed_writes(self, peers=None):
+        """
+        Catches this node up on writes it missed, by shipping the committed log
+        records of every peer (and of its own coordinator log) since the last
+        checkpoint. See catch_up(). Skipped (returns None) while another
+        process on this node is already catching up.
+        """
+        with self._recovery_lock, self.exclusive('transaction_logs_recovery') as acquired:
+            if not acquired:
+                print(f"Recovery for Node {self.node_id}: another process is catching up, skipped.")
+                return None
+            results = self.catch_up(peers or list(DB_CONFIG))
         print(f"--- Recovery for Node {self.node_id} Complete ---")
+        return results
+
+    def start_log_shipping(self, interval):
+        """Repeats recover_missed_writes() every `interval` seconds, so checkpoints stay close to the log head."""
+        if interval <= 0 or self._shipping_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.recover_missed_writes()
+                except Exception as e:
+                    print(f"Log shipping pass failed on Node {self.node_id}: {e}")
+
+        self._shipping_thread = threading.Thread(target=run, name='log-shipping', daemon=True)
+        self._shipping_thread.start()
+
+    def catch_up_from(self, peer_key):
+        """catch_up() from a single peer; returns that peer's stats."""
+        return self.catch_up([peer_key])[peer_key]
+
+    def catch_up(self, peer_keys):
+        """
+        Streams the peers' transaction_logs after this node's checkpoint for each,
+        one page (RECOVERY_PAGE_SIZE records, a primary-key range scan) per peer at
+        a time, and REDOes every committed write that belongs on this node.
+
+        A 2PC transaction is committed when its GLOBAL_COMMIT record is reached,
+        with its READY_COMMIT image; a LOCAL_COMMIT record when it is read. The
+        peers' committed records are merged into ONE replay in decision-time
+        order (a record is replayed once no peer can still deliver an earlier
+        decision), so a write decided on one peer never lands after a newer one
+        decided on another. Transactions this node already applied (see
+        applied_transactions) are skipped: the node either took part in them or
+        replayed them before, and applying their image again could undo a newer
+        write.
+
+        A peer's checkpoint is saved after every replay but never moves past:
+        - a record read but not replayed yet,
+        - a READY_COMMIT whose decision has not been logged yet (unless the log has
+          moved on for RECOVERY_SETTLE_SECONDS without one: presumed abort), or
+        - records younger than RECOVERY_SETTLE_SECONDS, since concurrent writers
+          may still commit lower log_ids.
+
+        Returns:
+            dict: peer_key -> {checkpoint, committed, applied, skipped,
+            already_applied, failed}. 'failed' counts the records that could
+            not be applied in the replays that peer's writes were part of.
+        """
+        results = {peer_key: {"checkpoint": None, "committed": 0, "applied": 0, "skipped": 0,
+                              "already_applied": 0, "failed": 0} for peer_key in peer_keys}
+        local_conn = get_db_connection(self.node_key)
+        if not local_conn:
+            print(f"Recovery: {self.node_key} unreachable, cannot replay.")
+            return results
+
+        streams = []
+        try:
+            applied_transactions.ensure_table(local_conn, self.node_key)
+            for peer_key in peer_keys:
+                peer_conn = get_db_connection(peer_key)
+                if not peer_conn:
+                    print(f"Recovery: {peer_key} unreachable, keeping its checkpoint.")
+                    continue
+                streams.append(_PeerLogStream(self, peer_key, peer_conn, self._load_checkpoint(local_conn, peer_key)))
+
+            while True:
+                for stream in streams:
+                    if not stream.exhausted and len(stream.pending) < self.recovery_page_size:
+                        stream.fetch()
+                # A peer still being read may yet deliver decisions up to the last timestamp it returned
+                horizon = min((stream.last_seen for stream in streams if not stream.exhausted), default=None)
+                batch = []
+                for stream in streams:
+                    while stream.pending and (horizon is None or stream.pending[0][0] <= horizon):
+                        decided_at, decision_id, _, record = stream.pending.popleft()
+                        batch.append((decided_at, stream.peer_key, decision_id, record))
+                batch.sort(key=lambda item: item[:3])
+
+                # The batch's writes are durable before any checkpoint moves past them
+                if not self._replay([(peer_key, record) for _, peer_key, _, record in batch], local_conn, results):
+                    return results
+                for stream in streams:
+                    safe = stream.safe_checkpoint()
+                    if safe > stream.checkpoint:
+                        self._save_checkpoint(local_conn, stream.peer_key, safe)
+                        stream.checkpoint = safe
+
+                if all(stream.exhausted and not stream.pending for stream in streams):
+                    break
+
+            for stream in streams:
+                stats = results[stream.peer_key]
+                stats["checkpoint"] = stream.checkpoint
+                print(f"Recovery from {stream.peer_key}: {stats['committed']} committed, {stats['applied']} applied, "
+                      f"{stats['already_applied']} already here, {stats['skipped']} not for {self.node_key}, "
+                      f"{stats['failed']} failed; checkpoint at log_id {stream.checkpoint}.")
+            return results
+        except Exception as e:
+            print(f"Recovery on {self.node_key} interrupted: {e}")
+            return results
+        finally:
+            for stream in streams:
+                stream.conn.close()
+            local_conn.close()
+
+    def _fetch_log_page(self, peer_conn, after_log_id):
+        cursor = peer_conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT log_id, transaction_id, log_timestamp, operation_type, record_key, new_value, status "
+            "FROM transaction_logs "
+            "WHERE log_id > %s AND status IN ('READY_COMMIT', 'GLOBAL_COMMIT', 'GLOBAL_ABORT', 'LOCAL_COMMIT') "
+            "ORDER BY log_id LIMIT %s", (after_log_id, self.recovery_page_size))
+        rows = cursor.fetchall()
+        cursor.close()
+        for row in rows:
+            row['transaction_id'] = txn_id_from_bin(row['transaction_id'])
+            if isinstance(row['new_value'], (bytes, bytearray)):
+                row['new_value'] = row['new_value'].decode('utf-8')
+        return rows
+
+    def _replay(self, records, local_conn, results):
+        """
+        REDOes (peer_key, committed record) pairs, in order, on this node, skipping
+        transactions it already applied, then marks the rest applied. Returns
+        False if the local node went away.
+        """
+        if not records:
+            return True
+        done = applied_transactions.applied_among(
+            local_conn, {txn_id_to_bin(record['transaction_id']) for _, record in records})
+        entries, replayed, contributors = [], set(), set()
+        for peer_key, record in records:
+            stats = results[peer_key]
+            stats["committed"] += 1
+            txn_bin = txn_id_to_bin(record['transaction_id'])
+            if txn_bin in done:
+                stats["already_applied"] += 1
+                continue
+            replayed.add(txn_bin)
+            for entry in redo_entries(record):
+                if entry['record_key'] and entry_belongs_on(self.node_key, entry):
+                    entries.append(entry)
+                    contributors.add(peer_key)
+                    stats["applied"] += 1
+                else:
+                    stats["skipped"] += 1
+
+        if entries:
+            result = self.redo_engine.apply(entries)
+            print(f"   -> REDO: {result['entries']} missed write(s) on {result['keys']} record(s) "
+                  f"applied in {result['batches']} batch(es).")
+            # A record that cannot be applied (e.g. a malformed image) would block recovery forever
+            for peer_key in contributors:
+                results[peer_key]["failed"] += result['failed']
+            if not result['success']:
+                return False
+        # Marked after the writes: a crash in between only replays the same images again
+        applied_transactions.mark_applied(local_conn, sorted(replayed))
+        local_conn.commit()
+        return True
+
+    def _ensure_checkpoint_table(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recovery_checkpoints (
+            peer_node VARCHAR(10) PRIMARY KEY,
+            last_log_id BIGINT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+        """)
+        conn.commit()
+        cursor.close()
+
+    def _load_checkpoint(self, conn, peer_key):
+        self._ensure_checkpoint_table(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_log_id FROM recovery_checkpoints WHERE peer_node = %s", (peer_key,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.commit()
+        return int(row[0]) if row else 0
+
+    def _save_checkpoint(self, conn, peer_key, log_id):
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO recovery_checkpoints (peer_node, last_log_id, updated_at) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE last_log_id = VALUES(last_log_id), updated_at = VALUES(updated_at)
+        """, (peer_key, log_id, datetime.now()))
+        conn.commit()
+        cursor.close()
 
     def log_prepare_start(self, txn_id):
-        """Logs the coordinator's initiation of the 2PC protocol (Phase 1)."""
-        sql = "INSERT INTO transaction_logs (transaction_id, log_timestamp, status) VALUES (%s, %s, 'PREPARE_SENT');"
-        params = (txn_id, datetime.now())
+        """
+        Logs the coordinator's initiation of the 2PC protocol (Phase 1).
+        Buffered, not awaited: log_global_commit() checks it was flushed before
+        recording the decision.
+        """
+        row = self._log_row(txn_id, 'PREPARE_SENT')
         
         try:
-            cursor = self.db_conn.cursor()
-            cursor.execute(sql, params)
-            self.db_conn.commit() 
-            cursor.close()
-            print(f"Log: Coordinator on Node {self.node_id} sent PREPARE for {txn_id} (LOG SAVED).")
+            self.log_writer.append(row, wait=False, track=True)
+            print(f"Log: Coordinator on Node {self.node_id} sent PREPARE for {txn_id} (LOG QUEUED).")
         except Exception as e:
             print(f"FATAL LOGGING ERROR (PREPARE) for {txn_id}: {e}")
             raise e # Re-raise to ensure transaction failure is handled
 
     def log_ready_status(self, txn_id, op_type, key, new_data):
-        """Logs the participant's readiness to commit (Phase 1 response), including REDO image."""
-        sql = """
-        INSERT INTO transaction_logs 
-        (transaction_id, log_timestamp, operation_type, record_key, new_value, status)
-        VALUES (%s, %s, %s, %s, %s, 'READY_COMMIT');
         """
-        params = (
-            txn_id,
-            datetime.now(),
-            op_type,
-            key,
-            json.dumps(new_data)
-        )
+        Logs the participant's readiness to commit (Phase 1 response), including REDO image.
+        Buffered, not awaited: log_global_commit() checks it was flushed before
+        recording the decision.
+        """
+        row = self._log_row(txn_id, 'READY_COMMIT', op_type, key, new_data)
         
         try:
-            cursor = self.db_conn.cursor()
-            cursor.execute(sql, params)
-            self.db_conn.commit() 
-            cursor.close()
-            print(f"Log: Participant on Node {self.node_id} is READY for {txn_id} (LOG SAVED).")
+            self.log_writer.append(row, wait=False, track=True)
+            print(f"Log: Participant on Node {self.node_id} is READY for {txn_id} (LOG QUEUED).")
         except Exception as e:
             print(f"FATAL LOGGING ERROR (READY) for {txn_id}: {e}")
             raise e
 
     def log_global_commit(self, txn_id, commit=True):
-        """Logs the coordinator's final, irrevocable decision (Phase 2)."""
-        status = 'GLOBAL_COMMIT' if commit else 'GLOBAL_ABORT'
-        sql = "INSERT INTO transaction_logs (transaction_id, log_timestamp, status) VALUES (%s, %s, %s);"
-        params = (txn_id, datetime.now(), status)
+        """
+        Logs the coordinator's final, irrevocable decision (Phase 2).
+        Blocks until the group commit holding the record is durable.
+
+        The transaction's PREPARE_SENT/READY_COMMIT records are waited for first.
+        If one of them was lost, a commit is logged as GLOBAL_ABORT and fails:
+        recovery must never replay the surviving READY images of a transaction
+        the coordinator then rolls back.
+        """
+        row = self._log_row(txn_id, 'GLOBAL_COMMIT' if commit else 'GLOBAL_ABORT')
+        earlier_record_lost = self.log_writer.txn_failed(row[0])
+        if commit and earlier_record_lost:
+            row = self._log_row(txn_id, 'GLOBAL_ABORT')
+        status = row[-1]
         
         try:
-            cursor = self.db_conn.cursor()
-            cursor.execute(sql, params)
-            self.db_conn.commit() 
-            cursor.close()
-            print(f"Log: Coordinator on Node {self.node_id} recorded {status} for {txn_id} (IRREVOCABLE).")
-            return {'success': True}
+            self.log_writer.append(row)
         except Exception as e:
-            print(f"FATAL LOGGING ERROR (GLOBAL_COMMIT/ABORT) for {txn_id}: {e}")
+            print(f"FATAL LOGGING ERROR ({status}) for {txn_id}: {e}")
             return {'success': False, 'error': str(e)}
+        if commit and earlier_record_lost:
+            error = "an earlier PREPARE/READY record of this transaction was not logged"
+            print(f"FATAL LOGGING ERROR (GLOBAL_COMMIT) for {txn_id}: {error}; recorded GLOBAL_ABORT instead.")
+            return {'success': False, 'error': error}
+        print(f"Log: Coordinator on Node {self.node_id} recorded {status} for {txn_id} (IRREVOCABLE).")
+        return {'success': True}
 
-    # NOTE: The original log_local_commit is now redundant and should be removed. 
-    # The replication-related methods can stay as they track the commit outcome.
-            
-    def _simulate_fetch_missed_logs(self, last_time):
+    # --- Step 4: Log Compaction and Archival ---
+
+    # Rows that are still work to do; they stay in the hot table until resolved
+    UNRESOLVED_STATUSES = ('REPLICATION_PENDING', 'REPLICATION_FAILED')
+
+    def acknowledged_log_id(self):
         """
-        Placeholder: In a real distributed system, this would be a network call
-        to the Central Node (Node 1) or other active Fabric Nodes (Node 2/3).
-        
-        For simulation, you will likely query the log table of the active node(s).
+        Highest log_id of this node's log that every node (this one included) has
+        shipped past, i.e. the lowest recovery checkpoint any node holds for us.
+        Checkpoints never pass an undecided transaction, so everything up to it is
+        decided. None if some node can't be asked or has never caught up from us.
         """
-        # For simplicity in the example, we'll return a sample missed log entry
-        if self.node_id in [2, 3]:
-            # Simulate a missed log that was committed on Node 1 while Node 2/3 was down
-            return [{
-                'transaction_id': str(uuid.uuid4()),
-                'operation_type': 'UPDATE',
-                'record_key': 'A101',
-                'new_value': json.dumps({"column": "value_after_recovery"}),
-                'status': 'LOCAL_COMMIT',
-                'log_timestamp': datetime.now()
-            }]
-        return []
-    
-    def _apply_redo_to_main_db(self, log_entry):
+        horizon = None
+        for node_key in DB_CONFIG:
+            conn = get_db_connection(node_key)
+            if not conn:
+                return None
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT last_log_id FROM recovery_checkpoints WHERE peer_node = %s", (self.node_key,))
+                row = cursor.fetchone()
+                cursor.close()
+            except Exception as e:
+                print(f"Log compaction: cannot read {node_key}'s checkpoint: {e}")
+                return None
+            finally:
+                conn.close()
+            if not row:
+                return None
+            horizon = int(row[0]) if horizon is None else min(horizon, int(row[0]))
+        return horizon
+
+    def compact_log(self):
         """
-        Applies the 'After Image' (new_value) from a log entry to the main 
-        database of the local node (REDO operation).
-        
-        Args:
-            log_entry (dict): A single row fetched from the transaction_logs table.
+        Moves every acknowledged record of this node's transaction_logs into
+        gzip-compressed JSON-lines segment files under LOG_ARCHIVE_DIR and deletes
+        it from the table, so the hot table only holds the unacknowledged tail
+        (plus transactions with unresolved replication rows, which follow once
+        resolved).
+
+        A segment is fsynced and renamed into place before its rows are deleted
+        by log_id. If a run stops in between, the next run finds the newest
+        segment's rows still in the table and only finishes the delete.
+
+        Returns:
+            dict: archived record and segment counts.
         """
-        op_type = log_entry['operation_type']
-        key = log_entry['record_key']
-        
-        # Load the JSON data that represents the state AFTER the change
-        # Note: new_value is stored as a JSON string in the log table
-        new_data = json.loads(log_entry['new_value']) 
+        with self.exclusive('transaction_logs_compaction') as acquired:
+            if not acquired:
+                print(f"Log compaction on Node {self.node_id}: another process is compacting, skipped.")
+                return {"archived": 0, "segments": 0}
+            return self._compact_log()
+
+    def _compact_log(self):
+        stats = {"archived": 0, "segments": 0, "markers_pruned": 0}
+        conn = get_db_connection(self.node_key)
+        if conn:
+            try:
+                applied_transactions.ensure_table(conn, self.node_key)
+                stats["markers_pruned"] = applied_transactions.prune(conn, self.applied_retention_hours)
+            except Exception as e:
+                print(f"Log compaction on Node {self.node_id}: could not prune applied_transactions: {e}")
+            finally:
+                conn.close()
 
-        cursor = self.db_conn.cursor()
+        horizon = self.acknowledged_log_id()
+        if not horizon:
+            print(f"Log compaction on Node {self.node_id}: nothing acknowledged by every node yet.")
+            return stats
 
+        conn = get_db_connection(self.node_key)
+        if not conn:
+            return stats
         try:
-            if op_type == 'INSERT':
-                # --- REDO INSERT ---
-                columns = ['titleId', 'ordering', 'title', 'region', 'language', 'types', 'attributes', 'isOriginalTitle']
-                placeholders = ', '.join(['%s'] * len(columns))
-                column_names = ', '.join(columns)
-
-                # Ensure params are ordered according to the 'columns' list
-                params = tuple(new_data.get(col) for col in columns)
-
-                query = f"""
-                    INSERT INTO movies 
-                    ({column_names}) 
-                    VALUES ({placeholders})
-                    ON DUPLICATE KEY UPDATE title=VALUES(title) 
-                    -- ^ Ensures idempotent operation: if the row already exists (e.g., due to crash), it updates instead of failing.
-                """
-                cursor.execute(query, params)
-
-            elif op_type == 'UPDATE':
-                # --- REDO UPDATE ---
-                # Dynamically build SET clause for all updated fields
-                set_clauses = [f"{col} = %s" for col in new_data.keys() if col != 'titleId']
-                
-                # Parameters: values for SET clause, followed by the WHERE clause value (key)
-                params = tuple(new_data[col] for col in new_data.keys() if col != 'titleId') + (key,)
-                
-                query = f"UPDATE movies SET {', '.join(set_clauses)} WHERE titleId = %s"
-                
-                cursor.execute(query, params)
-
-            elif op_type == 'DELETE':
-                # --- REDO DELETE ---
-                query = "DELETE FROM movies WHERE titleId = %s"
-                cursor.execute(query, (key,))
-
-            self.db_conn.commit()
-            print(f"REDO Success: {op_type} for record {key} applied to main DB.")
-            return True
-            
+            os.makedirs(self.archive_dir, exist_ok=True)
+            segments = self._segments()
+            if segments:
+                self._delete_log_ids(conn, self._read_segment_ids(segments[-1][1]))
+            next_seq = segments[-1][0] + 1 if segments else 1
+
+            placeholders = ', '.join(['%s'] * len(self.UNRESOLVED_STATUSES))
+            while True:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(
+                    "SELECT log_id, transaction_id, log_timestamp, operation_type, record_key, new_value, "
+                    "replication_target, status FROM transaction_logs "
+                    f"WHERE log_id <= %s AND status NOT IN ({placeholders}) "
+                    # The replication worker still needs the images of transactions it hasn't shipped
+                    f"AND transaction_id NOT IN (SELECT transaction_id FROM transaction_logs "
+                    f"WHERE status IN ({placeholders})) ORDER BY log_id LIMIT %s",
+                    (horizon,) + self.UNRESOLVED_STATUSES + self.UNRESOLVED_STATUSES + (self.archive_segment_records,))
+                rows = cursor.fetchall()
+                cursor.close()
+                conn.commit()
+                if not rows:
+                    break
+
+                self._write_segment(next_seq, rows)
+                self._delete_log_ids(conn, [row['log_id'] for row in rows])
+                next_seq += 1
+                stats["archived"] += len(rows)
+                stats["segments"] += 1
+                if len(rows) < self.archive_segment_records:
+                    break
+
+            print(f"Log compaction on Node {self.node_id}: archived {stats['archived']} records in "
+                  f"{stats['segments']} segment(s) up to log_id {horizon}.")
+            return stats
         except Exception as e:
-            self.db_conn.rollback()
-            print(f"REDO FAILURE: {op_type} for record {key} failed: {e}")
-            return False
+            print(f"Log compaction on Node {self.node_id} failed: {e}")
+            return stats
         finally:
-            cursor.close()
+            conn.close()
+
+    def start_log_compaction(self, interval):
+        """Runs compact_log() every `interval` seconds in the background."""
+        if interval <= 0 or self._compaction_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact_log()
+                except Exception as e:
+                    print(f"Log compaction pass failed on Node {self.node_id}: {e}")
+
+        self._compaction_thread = threading.Thread(target=run, name='log-compaction', daemon=True)
+        self._compaction_thread.start()
+
+    def _segments(self):
+        """[(sequence number, path), ...] of this node's archive segments, oldest first."""
+        prefix = f"transaction_logs-{self.node_key}-"
+        segments = []
+        for name in os.listdir(self.archive_dir):
+            if name.startswith(prefix) and name.endswith('.jsonl.gz'):
+                segments.append((int(name[len(prefix):].split('-')[0]), os.path.join(self.archive_dir, name)))
+        return sorted(segments)
+
+    def _write_segment(self, seq, rows):
+        name = f"transaction_logs-{self.node_key}-{seq:06d}-{rows[0]['log_id']:012d}-{rows[-1]['log_id']:012d}.jsonl.gz"
+        path = os.path.join(self.archive_dir, name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+                for row in rows:
+                    record = dict(row, transaction_id=txn_id_from_bin(row['transaction_id']))
+                    if isinstance(record['log_timestamp'], datetime):
+                        record['log_timestamp'] = record['log_timestamp'].isoformat()
+                    if isinstance(record['new_value'], (bytes, bytearray)):
+                        record['new_value'] = record['new_value'].decode('utf-8')
+                    out.write((json.dumps(record) + '\n').encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_segment_ids(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            return [json.loads(line)['log_id'] for line in segment]
+
+    @staticmethod
+    def _delete_log_ids(conn, log_ids, chunk=1000):
+        cursor = conn.cursor()
+        for i in range(0, len(log_ids), chunk):
+            ids = log_ids[i:i + chunk]
+            cursor.execute(f"DELETE FROM transaction_logs WHERE log_id IN ({', '.join(['%s'] * len(ids))})", ids)
+            conn.commit()
+        cursor.close()
+
+    # NOTE: The original log_local_commit is now redundant and should be removed. 
+    # The replication-related methods can stay as they track the commit outcome.
+            
 # --- Example Usage and Simulation ---
 
 def simulate_failure_recovery(log_manager_central, log_manager_fabric):
@@ -257,7 +936,6 @@ def simulate_failure_recovery(log_manager_central, log_manager_fabric):
     log_manager_fabric.update_replication_status(txn1_id, 1, success=False)
     
     print("\n--- Simulating Node 1 (Central Node) Crash ---")
-    last_commit_time_N1 = datetime.now()
     
     # A successful transaction occurs on Node 2 while Node 1 is down
     txn2_id = str(uuid.uuid4())
@@ -266,12 +944,15 @@ def simulate_failure_recovery(log_manager_central, log_manager_fabric):
 
     # 3. Simulate **Case #2** (Central Node Recovers and missed transactions)
     print(f"\n--- Simulating Central Node (Node 1) Recovering ---")
-    log_manager_central.recover_missed_writes(last_commit_time_N1)
-    # The recovery logic here would look at the logs of N2 and N3 to find txn2_id and re-apply it.
+    # Node 1 ships N2's log from its checkpoint and re-applies txn2_id.
+    log_manager_central.recover_missed_writes(peers=['node2'])
 
-# Initialize the log managers (assuming they connect to their respective DBs)
-log_manager_N1 = DistributedLogManager(node_id=1, db_connection=get_db_connection('node1'))
-log_manager_N2 = DistributedLogManager(node_id=2, db_connection=get_db_connection('node2'))
+if __name__ == '__main__':
+    # Initialize the log managers (assuming they connect to their respective DBs)
+    log_manager_N1 = DistributedLogManager(node_id=1)
+    log_manager_N2 = DistributedLogManager(node_id=2)
+    log_manager_N1.initialize_log_table()
+    log_manager_N2.initialize_log_table()
 
-# Run the simulation
-simulate_failure_recovery(log_manager_N1, log_manager_N2)
\ No newline at end of file
+    # Run the simulation
+    simulate_failure_recovery(log_manager_N1, log_manager_N2)
@@ -0,0 +1,142 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds (seconds) shared by every latency histogram; one more bucket catches the rest
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. observe() is one bisect and three additions under a private lock."""
+    __slots__ = ('counts', 'count', 'total', 'maximum', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+
+    def _quantile(self, counts, count, q):
+        """Estimated from the buckets (linear within the bucket the quantile falls in)."""
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.maximum
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.maximum
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total, maximum = list(self.counts), self.count, self.total, self.maximum
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {
+            "count": count,
+            "sum_s": round(total, 6),
+            "mean_ms": round(total / count * 1000, 3) if count else 0,
+            "p50_ms": round(self._quantile(counts, count, 0.50) * 1000, 3) if count else 0,
+            "p95_ms": round(self._quantile(counts, count, 0.95) * 1000, 3) if count else 0,
+            "p99_ms": round(self._quantile(counts, count, 0.99) * 1000, 3) if count else 0,
+            "max_ms": round(maximum * 1000, 3),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms, counters and gauges, each identified by a name and
+    a few labels (route, node, phase, ...). Everything lives in memory; /metrics
+    reads it as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge_add(self, name, delta, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    # --- Export ---
+
+    @staticmethod
+    def _group(items, render):
+        grouped = {}
+        for (name, labels), value in sorted(items, key=lambda item: item[0]):
+            grouped.setdefault(name, []).append(dict(labels=dict(labels), **render(value)))
+        return grouped
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+        return {
+            "histograms": self._group(histograms, lambda histogram: histogram.snapshot()),
+            "counters": self._group(counters, lambda value: {"value": value}),
+            "gauges": self._group(gauges, lambda value: {"value": value}),
+        }
+
+    def render_prometheus(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+        lines = []
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for (name, _), _ in items}):
+                lines.append(f"# TYPE {name} {kind}")
+                lines += [f"{name}{labels_text(labels)} {value}" for (n, labels), value in items if n == name]
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (n, labels), histogram in histograms:
+                if n != name:
+                    continue
+                snap = histogram.snapshot()
+                for bound, cumulative in snap['buckets'].items():
+                    lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{labels_text(labels)} {snap['sum_s']}")
+                lines.append(f"{name}_count{labels_text(labels)} {snap['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db_helpers import get_db_connection, MOVIE_COLUMNS
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor():
+    """Worker pool for replay batches, created on first use."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('REDO_WORKERS', 4)),
+                    thread_name_prefix='redo')
+    return _EXECUTOR
+
+
+class _KeyState:
+    """The net effect of a run of log entries on one titleId."""
+    __slots__ = ('delete', 'update', 'rows')
+
+    def __init__(self):
+        self.delete = False   # every existing row of the titleId goes first
+        self.update = {}      # fields then set on the rows that already existed
+        self.rows = {}        # ordering -> full after-image, written last
+
+
+def collapse(entries):
+    """
+    Folds REDO entries (in commit order) into one _KeyState per record_key, so
+    a key written many times is applied once with its final after-image.
+    """
+    states = {}
+    for entry in entries:
+        op_type = entry['operation_type']
+        state = states.setdefault(entry['record_key'], _KeyState())
+        image = entry['new_value']
+        if isinstance(image, str):
+            image = json.loads(image)
+        image = image or {}
+
+        if op_type == 'INSERT':
+            state.rows[image.get('ordering')] = {col: image.get(col) for col in MOVIE_COLUMNS}
+        elif op_type == 'UPDATE':
+            fields = {col: image[col] for col in MOVIE_COLUMNS if col in image and col != 'titleId'}
+            rows = {}
+            for row in state.rows.values():
+                row.update(fields)
+                rows[row['ordering']] = row
+            state.rows = rows
+            # After a DELETE there are no pre-existing rows left for the UPDATE to reach
+            if not state.delete:
+                state.update.update(fields)
+        elif op_type == 'DELETE':
+            state.delete = True
+            state.update = {}
+            state.rows = {}
+    return states
+
+
+class RedoReplayEngine:
+    """
+    Applies REDO entries to one node in batches.
+
+    Entries are first collapsed per record_key. The remaining keys are split
+    into batches of batch_size keys and each batch is ONE transaction: one
+    multi-key DELETE, the UPDATEs grouped by the columns they set, and one
+    multi-row upsert of the final after-images. Every key occurs in exactly one
+    batch, so batches never touch the same rows and run in parallel
+    (REDO_WORKERS threads, one pooled connection each).
+
+    Every statement writes absolute values, so replaying the same entries
+    again, e.g. after a crash halfway through, leaves the same final state.
+    """
+
+    UPSERT_SQL = """
+        INSERT INTO movies
+        (titleId, ordering, title, region, language, types, attributes, isOriginalTitle)
+        VALUES """
+    ROW_PLACEHOLDER = "(%s, %s, %s, %s, %s, %s, %s, %s)"
+    UPSERT_UPDATE = " ON DUPLICATE KEY UPDATE " + ", ".join(
+        f"{col} = VALUES({col})" for col in MOVIE_COLUMNS if col != 'titleId')
+
+    def __init__(self, node_key, batch_size=500):
+        self.node_key = node_key
+        self.batch_size = batch_size
+
+    def apply(self, entries):
+        """
+        Replays entries (in commit order) on the node.
+
+        Returns:
+            dict: entries / keys / batches counts, 'failed' (keys that could not be
+            applied and were skipped) and 'success' (False if the node was lost,
+            in which case the caller must not move its checkpoint).
+        """
+        states = collapse(entries)
+        keys = list(states)
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+        stats = {"success": True, "entries": len(entries), "keys": len(keys), "batches": len(batches), "failed": 0}
+
+        futures = [_get_executor().submit(self._apply_batch, {key: states[key] for key in batch})
+                   for batch in batches]
+        for future in futures:
+            try:
+                failed = future.result()
+            except Exception as e:
+                print(f"REDO FAILURE on {self.node_key}: {e}")
+                stats["success"] = False
+                continue
+            stats["failed"] += failed
+        return stats
+
+    def _apply_batch(self, states):
+        """One batch in one transaction. A batch that fails is retried key by key to isolate bad entries."""
+        conn = get_db_connection(self.node_key)
+        if not conn:
+            raise ConnectionError(f"No connection available for {self.node_key}")
+        healthy = False
+        try:
+            try:
+                self._write(conn, states)
+                conn.commit()
+                healthy = True
+                return 0
+            except Exception as e:
+                conn.rollback()
+                if len(states) == 1:
+                    print(f"REDO FAILURE: record {next(iter(states))} failed: {e}")
+                    healthy = True
+                    return 1
+                print(f"REDO batch of {len(states)} keys failed ({e}); retrying key by key.")
+
+            failed = 0
+            for key, state in states.items():
+                try:
+                    self._write(conn, {key: state})
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"REDO FAILURE: record {key} failed: {e}")
+                    failed += 1
+            healthy = True
+            return failed
+        finally:
+            # A rollback that raised means the connection itself is gone; don't pool it
+            if healthy:
+                conn.close()
+            else:
+                conn.discard()
+
+    def _write(self, conn, states):
+        cursor = conn.cursor()
+        try:
+            deleted = [key for key, state in states.items() if state.delete]
+            if deleted:
+                cursor.execute(
+                    f"DELETE FROM movies WHERE titleId IN ({', '.join(['%s'] * len(deleted))})", deleted)
+
+            updates = {}
+            for key, state in states.items():
+                if state.update:
+                    columns = tuple(sorted(state.update))
+                    updates.setdefault(columns, []).append(tuple(state.update[col] for col in columns) + (key,))
+            for columns, rows in updates.items():
+                set_clause = ', '.join(f"{col} = %s" for col in columns)
+                cursor.executemany(f"UPDATE movies SET {set_clause} WHERE titleId = %s", rows)
+
+            images = [row for state in states.values() for row in state.rows.values()]
+            if images:
+                cursor.execute(
+                    self.UPSERT_SQL + ", ".join([self.ROW_PLACEHOLDER] * len(images)) + self.UPSERT_UPDATE,
+                    [row[col] for row in images for col in MOVIE_COLUMNS])
+        finally:
+            cursor.close()
@@ -0,0 +1,305 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import applied_transactions
+from db_helpers import get_db_connection
+from log_manager import redo_entries, entry_belongs_on, txn_id_from_bin, txn_id_to_bin
+from redo_replay import RedoReplayEngine
+
+OPEN_STATUSES = ('REPLICATION_PENDING', 'REPLICATION_FAILED')
+
+
+class _TargetState:
+    """Retry bookkeeping for one replication target."""
+
+    def __init__(self):
+        self.failures = 0
+        self.next_attempt = 0.0     # time.monotonic() before which the target is left alone
+        self.shipped = 0
+        self.last_error = None
+        self.last_success = None
+
+
+class ReplicationWorker:
+    """
+    Retries replication rows of this node's log in the background.
+
+    Every interval seconds, for each target node with REPLICATION_FAILED rows
+    (or REPLICATION_PENDING rows older than pending_grace, i.e. attempts nobody
+    finished), the worker ships the backlog oldest first, batch_size rows at a
+    time. A batch is replayed on the target from the transactions' LOCAL_COMMIT
+    (or, for 2PC transactions, READY_COMMIT) images with the RedoReplayEngine,
+    then all of its rows are marked REPLICATION_SUCCESS at once. A key some
+    later committed transaction on this log also wrote is shipped with its
+    latest state instead (see _latest()), and the shipped transactions are
+    recorded in the target's applied_transactions.
+
+    A target that fails is retried with exponential backoff (backoff_base *
+    2^(failures-1), capped at backoff_max, with jitter) so a down node costs one
+    attempt per backoff period rather than one per row. Replay is idempotent, so
+    a crash between shipping and marking only ships the batch again.
+    """
+
+    def __init__(self, log_manager, interval=5, batch_size=500, backoff_base=2, backoff_max=300,
+                 pending_grace=30):
+        self.log_manager = log_manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pending_grace = pending_grace
+        self._targets = {}          # target node id -> _TargetState
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- Worker loop ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='replication-worker', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Replication worker pass failed: {e}")
+            time.sleep(self.interval)
+
+    def drain(self):
+        """One pass: ships the backlog of every target that is due (skipped while another process on the node drains)."""
+        with self.log_manager.exclusive('transaction_logs_replication') as acquired:
+            if acquired:
+                self._drain()
+
+    def _drain(self):
+        conn = get_db_connection(self.log_manager.node_key)
+        if not conn:
+            return
+        try:
+            for target in self._backlogged_targets(conn):
+                state = self._state(target)
+                if time.monotonic() < state.next_attempt:
+                    continue
+                while self._ship_batch(conn, target, state) == self.batch_size:
+                    pass
+        finally:
+            conn.close()
+
+    def _state(self, target):
+        with self._lock:
+            return self._targets.setdefault(target, _TargetState())
+
+    def _open_rows_filter(self):
+        """WHERE clause (and params) for rows that are the worker's to retry."""
+        return ("(status = 'REPLICATION_FAILED' OR (status = 'REPLICATION_PENDING' AND log_timestamp < %s))",
+                [datetime.now() - timedelta(seconds=self.pending_grace)])
+
+    def _backlogged_targets(self, conn):
+        where, params = self._open_rows_filter()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT DISTINCT replication_target FROM transaction_logs WHERE {where}", params)
+        targets = [row[0] for row in cursor.fetchall() if row[0] is not None]
+        cursor.close()
+        conn.commit()
+        return sorted(targets)
+
+    # --- Shipping ---
+
+    def _ship_batch(self, conn, target, state):
+        """Ships the oldest batch_size open rows for target. Returns the number of rows shipped."""
+        where, params = self._open_rows_filter()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT log_id, transaction_id FROM transaction_logs WHERE replication_target = %s AND {where} "
+            f"ORDER BY log_id LIMIT %s", [target] + params + [self.batch_size])
+        rows = cursor.fetchall()
+        if not rows:
+            cursor.close()
+            conn.commit()
+            return 0
+
+        log_ids = [row[0] for row in rows]
+        txn_ids = list({row[1] for row in rows})
+        placeholders = ', '.join(['%s'] * len(txn_ids))
+        cursor.execute(
+            "SELECT log_id, transaction_id, operation_type, record_key, new_value, status FROM transaction_logs "
+            f"WHERE transaction_id IN ({placeholders}) AND status IN ('LOCAL_COMMIT', 'READY_COMMIT') "
+            "ORDER BY log_id", txn_ids)
+        images = cursor.fetchall()
+        cursor.close()
+        conn.commit()
+
+        target_key = f'node{target}'
+        entries = [entry for record in self._images(images) for entry in redo_entries(record)
+                   if entry['record_key'] and entry_belongs_on(target_key, entry)]
+        target_conn = get_db_connection(target_key)
+        if not target_conn:
+            self._mark(conn, log_ids, 'REPLICATION_FAILED')
+            self._record_failure(target, state, f"{target_key} unreachable")
+            return 0
+        try:
+            if entries:
+                entries = self._latest(conn, target_conn, target_key, images, entries)
+            result = self._engine(target_key).apply(entries) if entries else {"success": True, "failed": 0}
+            if result['success']:
+                # After the writes: a crash in between only ships the same latest images again
+                applied_transactions.ensure_table(target_conn, target_key)
+                applied_transactions.mark_applied(target_conn, [bytes(txn_id) for txn_id in txn_ids])
+                target_conn.commit()
+        except Exception as e:
+            print(f"Replication to {target_key} interrupted: {e}")
+            result = {"success": False}
+        finally:
+            target_conn.close()
+        if not result['success']:
+            self._mark(conn, log_ids, 'REPLICATION_FAILED')
+            self._record_failure(target, state, f"{target_key} unreachable")
+            return 0
+
+        self._mark(conn, log_ids, 'REPLICATION_SUCCESS')
+        with self._lock:
+            state.failures = 0
+            state.next_attempt = 0.0
+            state.shipped += len(log_ids)
+            state.last_success = datetime.now()
+            state.last_error = None
+        print(f"Replication: shipped {len(log_ids)} row(s) ({len(entries)} write(s)) to {target_key}"
+              + (f", {result['failed']} could not be applied." if result['failed'] else "."))
+        return len(log_ids)
+
+    def _latest(self, conn, target_conn, target_key, images, entries):
+        """
+        The entries to ship for a batch: the batch's images of each key followed
+        by every later committed write to that key on this log, so a retried row
+        never puts an older image over a newer one the target already has (as a
+        2PC participant or from an earlier batch). Keys whose every write the
+        target has already applied are left out.
+        """
+        keys = sorted({entry['record_key'] for entry in entries})
+        batch_txns = {bytes(row[1]) for row in images}
+        placeholders = ', '.join(['%s'] * len(keys))
+        cursor = conn.cursor()
+        # BATCH records hold their keys in new_value, so all of them are read
+        cursor.execute(
+            "SELECT log_id, transaction_id, operation_type, record_key, new_value, status FROM transaction_logs "
+            "WHERE log_id > %s AND status IN ('LOCAL_COMMIT', 'READY_COMMIT') "
+            f"AND (record_key IN ({placeholders}) OR operation_type = 'BATCH') ORDER BY log_id",
+            [images[0][0]] + keys)
+        later = [row for row in cursor.fetchall() if bytes(row[1]) not in batch_txns]
+        ready_txns = list({bytes(row[1]) for row in later if row[5] == 'READY_COMMIT'})
+        committed = set()
+        for i in range(0, len(ready_txns), 1000):
+            part = ready_txns[i:i + 1000]
+            cursor.execute(
+                "SELECT DISTINCT transaction_id FROM transaction_logs "
+                f"WHERE status = 'GLOBAL_COMMIT' AND transaction_id IN ({', '.join(['%s'] * len(part))})", part)
+            committed.update(bytes(row[0]) for row in cursor.fetchall())
+        cursor.close()
+        conn.commit()
+        later = [row for row in later if row[5] == 'LOCAL_COMMIT' or bytes(row[1]) in committed]
+
+        wanted = set(keys)
+        entries = [entry for record in self._images(sorted(images + later, key=lambda row: row[0]))
+                   for entry in redo_entries(record)
+                   if entry['record_key'] in wanted and entry_belongs_on(target_key, entry)]
+        applied_transactions.ensure_table(target_conn, target_key)
+        done = applied_transactions.applied_among(
+            target_conn, {txn_id_to_bin(entry['transaction_id']) for entry in entries})
+        fresh = {entry['record_key'] for entry in entries if txn_id_to_bin(entry['transaction_id']) not in done}
+        return [entry for entry in entries if entry['record_key'] in fresh]
+
+    @staticmethod
+    def _images(rows):
+        """
+        The records to replay per transaction (rows as selected by _ship_batch),
+        in log order: its LOCAL_COMMIT
+        records, or for a 2PC transaction its richest READY_COMMIT (Central's,
+        which covers every participant's operations).
+        """
+        local, ready, order = {}, {}, []
+        for _, txn_id, op_type, record_key, new_value, status in rows:
+            if isinstance(new_value, (bytes, bytearray)):
+                new_value = new_value.decode('utf-8')
+            record = {'transaction_id': txn_id_from_bin(txn_id), 'operation_type': op_type,
+                      'record_key': record_key, 'new_value': new_value}
+            if txn_id not in local and txn_id not in ready:
+                order.append(txn_id)
+            if status == 'LOCAL_COMMIT':
+                local.setdefault(txn_id, []).append(record)
+            elif txn_id not in ready or len(redo_entries(record)) > len(redo_entries(ready[txn_id])):
+                ready[txn_id] = record
+        return [record for txn_id in order for record in local.get(txn_id) or [ready[txn_id]]]
+
+    def _engine(self, target_key):
+        with self._lock:
+            if target_key not in self._engines:
+                self._engines[target_key] = RedoReplayEngine(target_key, batch_size=self.batch_size)
+            return self._engines[target_key]
+
+    @staticmethod
+    def _mark(conn, log_ids, status):
+        placeholders = ', '.join(['%s'] * len(log_ids))
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE transaction_logs SET status = %s WHERE log_id IN ({placeholders}) "
+            f"AND status IN ('REPLICATION_PENDING', 'REPLICATION_FAILED')", [status] + log_ids)
+        conn.commit()
+        cursor.close()
+
+    def _record_failure(self, target, state, error):
+        with self._lock:
+            state.failures += 1
+            delay = min(self.backoff_base * 2 ** (state.failures - 1), self.backoff_max)
+            delay *= random.uniform(0.8, 1.2)
+            state.next_attempt = time.monotonic() + delay
+            state.last_error = error
+        print(f"Replication to node{target} failed ({error}); retrying in {delay:.1f}s "
+              f"(attempt {state.failures}).")
+
+    # --- Observability ---
+
+    def stats(self):
+        """
+        Per target: queue_depth (open replication rows), lag_seconds (age of the
+        oldest one), shipped rows, consecutive failures and time to the next retry.
+        """
+        backlog = {}
+        conn = get_db_connection(self.log_manager.node_key)
+        if conn:
+            try:
+                placeholders = ', '.join(['%s'] * len(OPEN_STATUSES))
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT replication_target, COUNT(*), MIN(log_timestamp) FROM transaction_logs "
+                    f"WHERE status IN ({placeholders}) GROUP BY replication_target", OPEN_STATUSES)
+                backlog = {row[0]: (row[1], row[2]) for row in cursor.fetchall() if row[0] is not None}
+                cursor.close()
+                conn.commit()
+            except Exception as e:
+                print(f"Replication stats unavailable: {e}")
+            finally:
+                conn.close()
+
+        now = datetime.now()
+        report = {}
+        with self._lock:
+            targets = sorted(set(backlog) | set(self._targets))
+            for target in targets:
+                depth, oldest = backlog.get(target, (0, None))
+                state = self._targets.get(target, _TargetState())
+                report[f'node{target}'] = {
+                    "queue_depth": depth,
+                    "lag_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+                    "shipped": state.shipped,
+                    "failures": state.failures,
+                    "next_retry_in": round(max(state.next_attempt - time.monotonic(), 0), 1),
+                    "last_success": state.last_success.strftime('%Y-%m-%d %H:%M:%S') if state.last_success else None,
+                    "last_error": state.last_error,
+                }
+        return report
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
+
+from db_helpers import get_db_connection
+
+# Columns the reports group by
+REPORT_DIMENSIONS = ('region', 'types')
+
+
+STORE_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS report_aggregates (
+        node_key VARCHAR(10) NOT NULL,
+        region VARCHAR(50) NOT NULL,
+        types VARCHAR(50) NOT NULL,
+        row_count BIGINT NOT NULL,
+        PRIMARY KEY (node_key, region, types)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS report_aggregate_builds (
+        node_key VARCHAR(10) PRIMARY KEY,
+        built_at DATETIME NOT NULL
+    )
+    """,
+)
+
+
+class ReportAggregates:
+    """
+    Per-node movie counts by region and by types, so the report routes are a
+    lookup over the groups instead of a GROUP BY over movies.
+
+    The counts live in report_aggregates on the node this server runs on
+    (store_key), shared by every worker process there:
+    - Recounts: one GROUP BY region, types scan per node (rebuild), run by ONE
+      process per server node at a time (under lock(), e.g. the log manager's
+      exclusive()), once the stored counts are rebuild_interval old.
+    - Deltas: every 2PC transaction this server coordinates measures how it
+      moves the counts inside the participant's own transaction (tracked): the
+      rows of every updated/deleted titleId are read with a locking SELECT
+      before the write and read again after it, and INSERTed rows are counted
+      from their after-image. Once that participant has committed, the delta
+      is added to the shared counts with one atomic increment.
+    Each process reloads the shared counts every refresh_interval seconds and
+    applies its own deltas to its copy right away.
+
+    Staleness: a write through this server's 2PC shows in every worker's
+    reports within refresh_interval. Writes the deltas don't see (coordinated
+    by another server, REDO recovery, replication retries), and a delta that
+    races a recount (counted twice or lost), are repaired by the next recount,
+    so counts are at most rebuild_interval (+ refresh_interval) behind.
+    NULL regions/types are counted under ''.
+    """
+
+    def __init__(self, node_keys, store_key, lock, rebuild_interval=900, refresh_interval=5):
+        self.node_keys = tuple(node_keys)
+        self.store_key = store_key
+        self.lock = lock
+        self.rebuild_interval = rebuild_interval
+        self.refresh_interval = refresh_interval
+        self._counts = {}             # node_key -> {dimension: Counter} (only once built)
+        self._built_at = {}
+        self._store_ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- Lookups ---
+
+    def counts(self, node_key, dimension):
+        """[(value, count), ...] largest first, or None while the node has not been built."""
+        with self._lock:
+            node_counts = self._counts.get(node_key)
+            if node_counts is None:
+                return None
+            return node_counts[dimension].most_common()
+
+    def built_at(self, node_key):
+        return self._built_at.get(node_key)
+
+    # --- Deltas from 2PC ---
+
+    def tracked(self, node_key, prepare_task, changes):
+        """
+        Prepare hook: wraps a participant's prepare task so it also measures how
+        its writes move the per-group counts on node_key.
+        """
+        locked_keys = sorted({key for op_type, key, _ in changes if op_type != 'INSERT' and key})
+        inserted = [new_value for op_type, key, new_value in changes
+                    if op_type == 'INSERT' and key not in locked_keys]
+
+        def task(conn):
+            try:
+                # The write locks these rows anyway; locking them first makes the before-image exact
+                before = self._group_rows(conn, locked_keys, lock=True)
+            except Exception as e:
+                conn.close()
+                return {"success": False, "error": f"Report delta capture failed: {e}", "rows_affected": 0}
+
+            res = prepare_task(conn=conn)
+            if not res['success']:
+                return res
+
+            try:
+                after = self._group_rows(conn, locked_keys)
+            except Exception as e:
+                res['connection'].close()
+                return {"success": False, "error": f"Report delta capture failed: {e}", "rows_affected": 0}
+
+            delta = Counter(after)
+            delta.subtract(before)
+            for row in inserted:
+                delta[(row.get('region') or '', row.get('types') or '')] += 1
+            res['on_commit'] = partial(self.apply, node_key, delta)
+            return res
+
+        return task
+
+    @staticmethod
+    def _group_rows(conn, title_ids, lock=False):
+        if not title_ids:
+            return Counter()
+        placeholders = ', '.join(['%s'] * len(title_ids))
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT region, types FROM movies WHERE titleId IN ({placeholders})" + (" FOR UPDATE" if lock else ""),
+            tuple(title_ids))
+        rows = cursor.fetchall()
+        cursor.close()
+        return Counter((region or '', types or '') for region, types in rows)
+
+    def apply(self, node_key, delta):
+        """Adds a committed {(region, types): change} delta to node_key's shared counts (and this process's copy)."""
+        delta = {group: change for group, change in delta.items() if change}
+        if not delta:
+            return
+        with self._lock:
+            node_counts = self._counts.get(node_key)
+            if node_counts is not None:
+                self._apply_locked(node_counts, delta)
+
+        conn = get_db_connection(self.store_key)
+        if not conn:
+            print(f"Report aggregates: {self.store_key} unreachable, delta left to the next recount.")
+            return
+        try:
+            self._ensure_store(conn)
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO report_aggregates (node_key, region, types, row_count) VALUES "
+                + ", ".join(["(%s, %s, %s, %s)"] * len(delta))
+                + " ON DUPLICATE KEY UPDATE row_count = row_count + VALUES(row_count)",
+                [value for (region, types), change in delta.items() for value in (node_key, region, types, change)])
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _apply_locked(node_counts, delta):
+        for (region, types), change in delta.items():
+            if not change:
+                continue
+            for dimension, value in zip(REPORT_DIMENSIONS, (region, types)):
+                counter = node_counts[dimension]
+                counter[value] += change
+                if counter[value] <= 0:
+                    del counter[value]
+
+    # --- Maintenance ---
+
+    def _ensure_store(self, conn):
+        if self._store_ready:
+            return
+        cursor = conn.cursor()
+        for ddl in STORE_DDL:
+            cursor.execute(ddl)
+        cursor.close()
+        conn.commit()
+        self._store_ready = True
+
+    def rebuild(self, node_key):
+        """Recounts one node with a single GROUP BY scan and replaces its shared counts."""
+        conn = get_db_connection(node_key)
+        if not conn:
+            return False
+        store = get_db_connection(self.store_key)
+        if not store:
+            conn.close()
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT region, types, COUNT(*) FROM movies GROUP BY region, types")
+            groups = Counter()
+            for region, types, count in cursor.fetchall():
+                groups[(region or '', types or '')] += count
+            cursor.close()
+            conn.commit()
+
+            self._ensure_store(store)
+            cursor = store.cursor()
+            cursor.execute("DELETE FROM report_aggregates WHERE node_key = %s", (node_key,))
+            if groups:
+                cursor.execute(
+                    "INSERT INTO report_aggregates (node_key, region, types, row_count) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s)"] * len(groups)),
+                    [value for (region, types), count in groups.items() for value in (node_key, region, types, count)])
+            cursor.execute(
+                "INSERT INTO report_aggregate_builds (node_key, built_at) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE built_at = VALUES(built_at)", (node_key, datetime.now()))
+            cursor.close()
+            store.commit()
+            print(f"Report aggregates: counted {sum(groups.values())} rows on {node_key}.")
+            return True
+        except Exception as e:
+            print(f"Report aggregates rebuild failed for {node_key}: {e}")
+            return False
+        finally:
+            conn.close()
+            store.close()
+
+    def refresh(self):
+        """Recounts the nodes whose shared counts are due (unless another process is), then reloads them."""
+        if self._due():
+            with self.lock('report_aggregates_rebuild') as acquired:
+                # Another process may have recounted them while we waited for the lock
+                for node_key in (self._due() if acquired else []):
+                    self.rebuild(node_key)
+        self.reload()
+
+    def _due(self):
+        built = self._load_builds()
+        if built is None:
+            return []
+        horizon = datetime.now() - timedelta(seconds=self.rebuild_interval)
+        return [node_key for node_key in self.node_keys if built.get(node_key) is None or built[node_key] < horizon]
+
+    def _load_builds(self):
+        conn = get_db_connection(self.store_key)
+        if not conn:
+            return None
+        try:
+            self._ensure_store(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT node_key, built_at FROM report_aggregate_builds")
+            built = dict(cursor.fetchall())
+            cursor.close()
+            conn.commit()
+            return built
+        finally:
+            conn.close()
+
+    def reload(self):
+        """Replaces this process's copy with the shared counts of every node recounted so far."""
+        conn = get_db_connection(self.store_key)
+        if not conn:
+            return False
+        try:
+            self._ensure_store(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT node_key, built_at FROM report_aggregate_builds")
+            built = dict(cursor.fetchall())
+            cursor.execute("SELECT node_key, region, types, row_count FROM report_aggregates WHERE row_count > 0")
+            counts = {node_key: {dimension: Counter() for dimension in REPORT_DIMENSIONS} for node_key in built}
+            for node_key, region, types, count in cursor.fetchall():
+                if node_key in counts:
+                    self._apply_locked(counts[node_key], {(region, types): count})
+            cursor.close()
+            conn.commit()
+        except Exception as e:
+            print(f"Report aggregates reload failed: {e}")
+            return False
+        finally:
+            conn.close()
+        with self._lock:
+            self._counts = counts
+            self._built_at = {node_key: built_at.timestamp() for node_key, built_at in built.items()}
+        return True
+
+    def start(self):
+        """Keeps the shared counts recounted and this process's copy reloaded in the background."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='report-aggregates', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Report aggregates refresh failed: {e}")
+            time.sleep(self.refresh_interval)
+
+    def stats(self):
+        return {
+            key: {
+                "ready": key in self._counts,
+                "groups": {dim: len(self._counts[key][dim]) for dim in REPORT_DIMENSIONS} if key in self._counts else {},
+                "built_at": self._built_at.get(key),
+            }
+            for key in self.node_keys
+        }
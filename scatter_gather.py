@@ -0,0 +1,63 @@
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor():
+    """Worker pool for fan-out reads, separate from the 2PC pool so reads never queue behind writes."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('SCATTER_MAX_WORKERS', 16)),
+                    thread_name_prefix='scatter')
+    return _EXECUTOR
+
+
+def run_on_nodes(node_keys, fn, timeout=None):
+    """
+    Calls fn(node_key) for every node at the same time and waits at most
+    `timeout` seconds for all of them.
+
+    Returns:
+        dict: node_key -> fn's result, or None for nodes that raised or did not
+        answer in time.
+    """
+    timeout = float(os.environ.get('SCATTER_TIMEOUT', 10)) if timeout is None else timeout
+    futures = {_get_executor().submit(fn, node_key): node_key for node_key in node_keys}
+    done, _ = wait(futures, timeout=timeout)
+
+    results = {}
+    for future, node_key in futures.items():
+        results[node_key] = None
+        if future in done:
+            try:
+                results[node_key] = future.result()
+            except Exception as e:
+                print(f"Scatter-gather: {node_key} failed: {e}")
+        else:
+            print(f"Scatter-gather: {node_key} did not answer within {timeout}s")
+    return results
+
+
+def merge_sorted_rows(row_lists, sort_key, skip=0, take=None):
+    """
+    Merges per-node row lists that are each sorted by sort_key, drops duplicate
+    keys (a row present on two nodes is returned once), then applies the global
+    window [skip, skip + take).
+    """
+    merged = []
+    last_key = object()
+    for row in heapq.merge(*row_lists, key=sort_key):
+        key = sort_key(row)
+        if key == last_key:
+            continue
+        last_key = key
+        merged.append(row)
+        if take is not None and len(merged) >= skip + take:
+            break
+    return merged[skip:]
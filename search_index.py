@@ -0,0 +1,162 @@
+"""
+Substring / prefix search for /movies backed by MySQL FULLTEXT indexes with
+the built-in ngram parser.
+
+Tokenizer
+---------
+The ngram parser splits a value into every run of N consecutive characters
+(N = the server's ngram_token_size, 2 by default), lower-cased by the column
+collation. Runs containing whitespace are skipped, so "Star Wars" is indexed
+as st, ta, ar, wa, ar, rs. A substring search for "wars" becomes the
+BOOLEAN MODE phrase "wars" = wa ar rs in sequence, which the index resolves
+without reading every row. tokenize() mirrors this so the rules are testable
+from Python. Stopwords are disabled while the index is built so that no
+n-gram is ever dropped.
+
+Because the n-gram match can only over-approximate a substring match, every
+MATCH is paired with the original LIKE, which re-checks just the candidate
+rows. Terms the index cannot answer exactly (any word shorter than N, or a
+term containing a double quote) use the plain LIKE.
+
+Prefix searches ("starts with") use LIKE 'term%', which the titleId primary
+key and the idx_movies_title_prefix B-tree index serve as a range scan.
+
+Freshness
+---------
+InnoDB maintains FULLTEXT indexes transactionally: rows written by the 2PC
+participants become searchable when the participant commits, with no extra
+work in the write path.
+
+Creating the indexes rebuilds the movies table, so it is a maintenance step
+rather than something the app does on its own:
+
+    python3 search_index.py create      # on every node
+"""
+import os
+import sys
+import threading
+import time
+
+from db_helpers import get_db_connection, DB_CONFIG
+from scatter_gather import run_on_nodes
+
+NGRAM_TOKEN_SIZE = int(os.environ.get('SEARCH_NGRAM_TOKEN_SIZE', 2))
+
+# column -> (FULLTEXT index name, prefix B-tree index name or None)
+SEARCH_INDEXES = {
+    'title': ('ft_movies_title', 'idx_movies_title_prefix'),
+    'titleId': ('ft_movies_titleid', None),   # prefix searches already use the primary key
+}
+
+
+def tokenize(text, n=NGRAM_TOKEN_SIZE):
+    """The n-grams the ngram parser produces for text (whitespace-free runs only)."""
+    grams = []
+    for word in text.lower().split():
+        grams.extend(word[i:i + n] for i in range(len(word) - n + 1))
+    return grams
+
+
+def _indexable(term, n=NGRAM_TOKEN_SIZE):
+    words = term.split()
+    return bool(words) and '"' not in term and all(len(word) >= n for word in words)
+
+
+class SearchIndex:
+    """
+    Knows which nodes have the FULLTEXT indexes and turns /movies filters into
+    index-backed SQL. Index availability is looked up from information_schema
+    once per node and refreshed every refresh_interval seconds.
+
+    The same WHERE clause is sent to Central and to the fragments (fallback,
+    scatter-gather), so MATCH is only used for a column indexed on every node.
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._available = {}   # node_key -> (set of column names, checked_at)
+        self._lock = threading.Lock()
+
+    def available_columns(self, node_key):
+        with self._lock:
+            entry = self._available.get(node_key)
+        if entry is not None and time.monotonic() - entry[1] < self.refresh_interval:
+            return entry[0]
+
+        columns = set()
+        conn = get_db_connection(node_key)
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'movies' AND INDEX_TYPE = 'FULLTEXT'")
+                names = {row[0] for row in cursor.fetchall()}
+                cursor.close()
+                columns = {col for col, (ft_name, _) in SEARCH_INDEXES.items() if ft_name in names}
+            except Exception as e:
+                print(f"Search index lookup failed on {node_key}: {e}")
+            finally:
+                conn.close()
+        with self._lock:
+            self._available[node_key] = (columns, time.monotonic())
+        return columns
+
+    def cluster_columns(self):
+        """Columns whose FULLTEXT index exists on every node."""
+        per_node = run_on_nodes(list(DB_CONFIG), self.available_columns)
+        columns = set(SEARCH_INDEXES)
+        for node_columns in per_node.values():
+            columns &= node_columns or set()
+        return columns
+
+    def condition(self, column, term, mode='contains'):
+        """
+        SQL condition and params for one search filter.
+
+        mode: 'contains' (substring) or 'prefix' (starts with).
+        """
+        if mode == 'prefix':
+            return f" AND {column} LIKE %s", [f"{term}%"]
+        if column in SEARCH_INDEXES and _indexable(term) and column in self.cluster_columns():
+            return (f" AND MATCH({column}) AGAINST (%s IN BOOLEAN MODE) AND {column} LIKE %s",
+                    [f'"{term}"', f"%{term}%"])
+        return f" AND {column} LIKE %s", [f"%{term}%"]
+
+
+def create_search_indexes(node_key):
+    """Adds the ngram FULLTEXT and prefix indexes to movies on one node (skips existing ones)."""
+    conn = get_db_connection(node_key)
+    if not conn:
+        print(f"Cannot create search indexes: {node_key} unreachable.")
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'movies'")
+        existing = {row[0] for row in cursor.fetchall()}
+        # Keep every n-gram: with stopwords on, grams like "an" would silently vanish
+        cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+        for column, (ft_name, prefix_name) in SEARCH_INDEXES.items():
+            if ft_name not in existing:
+                print(f"{node_key}: creating FULLTEXT index {ft_name} on movies({column})...")
+                cursor.execute(f"ALTER TABLE movies ADD FULLTEXT INDEX {ft_name} ({column}) WITH PARSER ngram")
+            if prefix_name and prefix_name not in existing:
+                print(f"{node_key}: creating index {prefix_name} on movies({column}(32))...")
+                cursor.execute(f"ALTER TABLE movies ADD INDEX {prefix_name} ({column}(32))")
+        cursor.close()
+        return True
+    except Exception as e:
+        print(f"Creating search indexes on {node_key} failed: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'create':
+        print("usage: python3 search_index.py create [node1 node2 node3]")
+        sys.exit(1)
+    for key in sys.argv[2:] or list(DB_CONFIG):
+        create_search_indexes(key)
@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class _Step:
+    __slots__ = ('name', 'fn', 'state', 'attempts', 'error', 'seconds')
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.state = 'pending'      # pending -> running -> done (or back to pending after an error)
+        self.attempts = 0
+        self.error = None
+        self.seconds = None
+
+
+class StartupSequence:
+    """
+    The node's blocking startup work (connecting to the local node, log table
+    setup, recovery, ...) run in order on a background thread, so importing the
+    app does no I/O and a dead node can't hold up boot.
+
+    A step that raises is retried every retry_interval seconds; the steps after
+    it wait. The node is ready once every step is done.
+    """
+
+    def __init__(self, retry_interval=5):
+        self.retry_interval = retry_interval
+        self._steps = []
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = None
+
+    def add(self, name, fn):
+        self._steps.append(_Step(name, fn))
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='startup', daemon=True)
+        self._thread.start()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until ready (or timeout seconds); returns whether it is."""
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        for step in self._steps:
+            while True:
+                step.state = 'running'
+                step.attempts += 1
+                started = time.monotonic()
+                try:
+                    step.fn()
+                except Exception as e:
+                    step.state, step.error = 'pending', str(e)
+                    print(f"Startup: {step.name} failed (attempt {step.attempts}): {e}. "
+                          f"Retrying in {self.retry_interval}s.")
+                    time.sleep(self.retry_interval)
+                    continue
+                step.state, step.error = 'done', None
+                step.seconds = time.monotonic() - started
+                break
+        print(f"Startup complete in {time.monotonic() - self._started:.2f}s.")
+        self._ready.set()
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "steps": [
+                {"name": step.name, "state": step.state, "attempts": step.attempts, "error": step.error,
+                 "seconds": round(step.seconds, 3) if step.seconds is not None else None}
+                for step in self._steps
+            ],
+        }
@@ -1,6 +1,8 @@
-let currentOffset = 0;
 let currentLimit = 100;
 let totalRows = 0;
+let loadedRows = 0;
+// Keyset cursor returned by /movies; null means "start from the first page"
+let nextAfter = null;
 let currentFilters = {
     titleId: '',
     title: '',
@@ -8,7 +10,7 @@ let currentFilters = {
 };
 
 async function loadNodeData(nodeNumber) {
-    currentOffset = 0; // Reset offset when loading new node
+    nextAfter = null; // Reset cursor when loading new node
     
     // Clear the table and wait for user input
     const tableBody = document.getElementById('table-body');
@@ -27,14 +29,18 @@ async function fetchMovies() {
         // Build query parameters
         const activeNode = currentNode || 1;
 
+        const firstPage = nextAfter === null;
         const params = new URLSearchParams({
-            offset: currentOffset,
+            paging: 'keyset',
             limit: currentLimit,
             titleId: currentFilters.titleId,
             title: currentFilters.title,
             region: currentFilters.region,
             node: `node${activeNode}`
         });
+        if (!firstPage) {
+            params.set('after', nextAfter);
+        }
 
         // Fetch movies from backend
         const response = await fetch(`/movies?${params}`);
@@ -42,19 +48,24 @@ async function fetchMovies() {
         
         console.log('Loaded data:', result);
         
-        // Update total rows count
-        totalRows = result.total;
+        // Update total rows count (the backend only counts on the first page)
+        if (firstPage) {
+            loadedRows = 0;
+            totalRows = result.total;
+        }
+        loadedRows += result.data ? result.data.length : 0;
+        nextAfter = result.next_after;
         updateRowCount();
         
         // Clear or append to table
         const tableBody = document.getElementById('table-body');
-        if (currentOffset === 0) {
+        if (firstPage) {
             tableBody.innerHTML = '';
         }
         
         // Check if data is empty
         if (!result.data || result.data.length === 0) {
-            if (currentOffset === 0) {
+            if (firstPage) {
                 tableBody.innerHTML = '<tr><td colspan="9" style="text-align: center;">No data available</td></tr>';
             }
             // Hide load more button if no more data
@@ -63,7 +74,7 @@ async function fetchMovies() {
         }
         
         // Show load more button if there's more data
-        if (currentOffset + result.data.length < totalRows) {
+        if (nextAfter) {
             document.getElementById('load-more-btn').style.display = 'block';
         } else {
             document.getElementById('load-more-btn').style.display = 'none';
@@ -97,13 +108,12 @@ async function fetchMovies() {
 }
 
 function updateRowCount() {
-    const currentRows = Math.min(currentOffset + currentLimit, totalRows);
-    document.getElementById('current-rows').textContent = currentRows;
+    document.getElementById('current-rows').textContent = loadedRows;
     document.getElementById('total-rows').textContent = totalRows;
 }
 
 function loadMoreRows() {
-    currentOffset += currentLimit;
+    // nextAfter already points past the last row shown
     fetchMovies();
 }
 
@@ -116,8 +126,8 @@ function applyFilters() {
     // TODO: Backend needs to implement filter handling in /movies endpoint
     console.log('Applying filters:', currentFilters);
     
-    // Reset offset and fetch
-    currentOffset = 0;
+    // Reset cursor and fetch
+    nextAfter = null;
     fetchMovies();
 }
 
@@ -135,7 +145,7 @@ function clearFilters() {
     };
     
     // Reset and fetch
-    currentOffset = 0;
+    nextAfter = null;
     fetchMovies();
 }
 
@@ -202,7 +212,7 @@ async function submitInsert() {
         
         // Refresh Data
         closeInsertModal();
-        currentOffset = 0;
+        nextAfter = null;
         fetchMovies();
 
     } catch (error) {
@@ -260,7 +270,7 @@ async function submitUpdate() {
         
         // Refresh Data
         closeEditModal();
-        currentOffset = 0;
+        nextAfter = null;
         fetchMovies();
 
     } catch (error) {
@@ -287,7 +297,7 @@ async function deleteRow(titleId) {
         alert(`Delete Status:\n${result.logs.join('\n')}`);
         
         // Refresh Data
-        currentOffset = 0;
+        nextAfter = null;
         fetchMovies();
 
     } catch (error) {
@@ -297,23 +307,27 @@ async function deleteRow(titleId) {
 }
 
 async function simulateConcurrency() {
-    // TODO: Implement concurrency simulation in backend
-    console.log('Simulate concurrency clicked');
-    
+    const activeNode = currentNode || 1;
+
     try {
+        // A short mixed read/write run against the node being viewed
         const response = await fetch('/simulate-concurrency', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({})
+            body: JSON.stringify({ duration: 5, readers: 4, writers: 4, node: `node${activeNode}` })
         });
 
         const result = await response.json();
-        
+
+        if (!response.ok) {
+            alert(`Concurrency Simulation:\n${result.error}`);
+            return;
+        }
         alert(`Concurrency Simulation:\n${result.message}`);
-        
+
     } catch (error) {
         console.error("Concurrency simulation failed:", error);
-        alert("Concurrency simulation feature coming soon!");
+        alert("Concurrency simulation failed. Check console for details.");
     }
 }
 
@@ -0,0 +1,101 @@
+"""
+Fixtures for running the write path, log shipping and REDO offline: every
+test gets fresh local_cluster nodes (SQLite stand-ins for node1-3, see
+local_cluster.py) and fresh connection pools pointing at them.
+"""
+import os
+import sys
+import uuid
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_helpers
+import local_cluster
+from coordinator import TwoPhaseCoordinator, prepare_write
+from db_helpers import MOVIE_COLUMNS
+from log_manager import DistributedLogManager, txn_id_to_bin
+
+INSERT_SQL = f"INSERT INTO movies ({', '.join(MOVIE_COLUMNS)}) VALUES ({', '.join(['%s'] * len(MOVIE_COLUMNS))})"
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    for pool in db_helpers._POOLS.values():
+        pool.close_all()
+    db_helpers._POOLS.clear()
+    local_cluster.install(str(tmp_path / 'nodes'))
+    local_cluster.reset()
+    return local_cluster
+
+
+@pytest.fixture
+def log_manager(cluster):
+    """node1's log manager (the coordinator log)."""
+    manager = DistributedLogManager(1)
+    manager.initialize_log_table()
+    return manager
+
+
+@pytest.fixture
+def coordinator(log_manager):
+    return TwoPhaseCoordinator(log_manager, prepare_timeout=1, commit_timeout=5)
+
+
+def movie(title_id, region='US', ordering=1, title='Test Movie'):
+    return {'titleId': title_id, 'ordering': ordering, 'title': title, 'region': region, 'language': 'en',
+            'types': 'original', 'attributes': '', 'isOriginalTitle': 1}
+
+
+def insert_tasks(row, participants):
+    """prepare_write tasks inserting row on each participant, as /insert builds them."""
+    params = tuple(row[col] for col in MOVIE_COLUMNS)
+    return {p_key: partial(prepare_write, p_key, INSERT_SQL, params) for p_key in participants}
+
+
+def new_txn_id():
+    return str(uuid.uuid4())
+
+
+def put_row(node_key, row):
+    """Writes row straight to node_key, outside any 2PC."""
+    conn = db_helpers.get_db_connection(node_key)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(INSERT_SQL, tuple(row[col] for col in MOVIE_COLUMNS))
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def rows(node_key, title_id):
+    """The node's committed rows of title_id, as {column: value} dicts."""
+    conn = db_helpers.get_db_connection(node_key)
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"SELECT {', '.join(MOVIE_COLUMNS)} FROM movies WHERE titleId = %s ORDER BY ordering",
+                       (title_id,))
+        found = cursor.fetchall()
+        cursor.close()
+        conn.commit()
+        return found
+    finally:
+        conn.close()
+
+
+def log_statuses(node_key, txn_id):
+    """Statuses of txn_id's records in node_key's transaction_logs, in log order."""
+    conn = db_helpers.get_db_connection(node_key)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT status FROM transaction_logs WHERE transaction_id = %s ORDER BY log_id",
+                       (txn_id_to_bin(txn_id),))
+        statuses = [status for status, in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+        return statuses
+    finally:
+        conn.close()
@@ -0,0 +1,150 @@
+import time
+
+from conftest import insert_tasks, log_statuses, movie, new_txn_id, put_row, rows
+from db_helpers import get_db_connection, get_pool
+from log_manager import txn_id_to_bin
+
+
+def slow(task, seconds):
+    """A prepare task that answers `seconds` late."""
+    def run(conn):
+        time.sleep(seconds)
+        return task(conn=conn)
+    return run
+
+
+def checked_out(node_key, log_manager):
+    """(in use, pinned) connections of node_key's pool, besides the one the log writer keeps pinned."""
+    stats = get_pool(node_key).stats()
+    writer = 1 if node_key == log_manager.node_key and log_manager.log_writer._conn is not None else 0
+    return stats['in_use'] - writer, stats['pinned'] - writer
+
+
+def test_all_yes_commits_everywhere(coordinator):
+    row = movie('tt9100001', region='US')
+    txn_id = new_txn_id()
+
+    assert coordinator.run(txn_id, insert_tasks(row, {'node1', 'node2'}), ('INSERT', row['titleId'], row), []) is True
+    assert rows('node1', row['titleId']) == [row] and rows('node2', row['titleId']) == [row]
+    assert log_statuses('node1', txn_id) == ['PREPARE_SENT', 'READY_COMMIT', 'READY_COMMIT', 'GLOBAL_COMMIT']
+
+
+def test_no_vote_aborts_and_rolls_back_the_yes_voters(coordinator):
+    row = movie('tt9100002', region='US')
+    put_row('node2', dict(row, title='Already there'))
+    txn_id = new_txn_id()
+
+    logs = []
+    decision = coordinator.run(txn_id, insert_tasks(row, {'node1', 'node2'}), ('INSERT', row['titleId'], row), logs)
+
+    assert decision is False
+    assert any(line.startswith('node2: Failed to Prepare') for line in logs)
+    assert rows('node1', row['titleId']) == []
+    assert rows('node2', row['titleId']) == [dict(row, title='Already there')]
+    assert log_statuses('node1', txn_id)[-1] == 'GLOBAL_ABORT'
+    assert checked_out('node1', coordinator.log_manager) == (0, 0)
+    assert checked_out('node2', coordinator.log_manager) == (0, 0)
+
+
+def test_open_circuit_votes_no_without_a_connection(coordinator):
+    breaker = get_pool('node3').breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ConnectionError("down"))
+    row = movie('tt9100003', region='FR')
+
+    logs = []
+    decision = coordinator.run(new_txn_id(), insert_tasks(row, {'node1', 'node3'}), ('INSERT', row['titleId'], row), logs)
+
+    assert decision is False
+    assert "node3: Failed to Prepare: Node unreachable (circuit open). ABORTING." in logs
+    assert rows('node1', row['titleId']) == []
+
+
+def test_vote_timeout_aborts_and_the_late_voter_is_rolled_back(coordinator):
+    row = movie('tt9100004', region='US')
+    tasks = insert_tasks(row, {'node1', 'node2'})
+    tasks['node2'] = slow(tasks['node2'], coordinator.prepare_timeout + 1)
+    txn_id = new_txn_id()
+
+    logs = []
+    started = time.monotonic()
+    decision = coordinator.run(txn_id, tasks, ('INSERT', row['titleId'], row), logs)
+
+    assert decision is False
+    assert time.monotonic() - started < coordinator.prepare_timeout + 1
+    assert f"node2: Failed to Prepare: no vote within {coordinator.prepare_timeout}s. ABORTING." in logs
+    assert log_statuses('node1', txn_id)[-1] == 'GLOBAL_ABORT'
+
+    # node2 prepares after the abort: its write is rolled back and its connection returned
+    deadline = time.monotonic() + 5
+    while checked_out('node2', coordinator.log_manager) != (0, 0) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert checked_out('node2', coordinator.log_manager) == (0, 0)
+    assert rows('node1', row['titleId']) == [] and rows('node2', row['titleId']) == []
+
+
+def replication_results(node_key, txn_id, timeout=5):
+    """(status, target) of txn_id's REPLICATION_* records, polled until one shows up (they are not awaited)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = get_db_connection(node_key)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, replication_target FROM transaction_logs "
+                           "WHERE transaction_id = %s AND status LIKE 'REPLICATION%' ORDER BY log_id",
+                           (txn_id_to_bin(txn_id),))
+            found = [tuple(record) for record in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+        if found or time.monotonic() > deadline:
+            return found
+        time.sleep(0.05)
+
+
+def test_quorum_commits_without_a_straggler_and_logs_its_late_commit(coordinator):
+    row = movie('tt9200001', region='US')
+    tasks = insert_tasks(row, {'node1', 'node2', 'node3'})
+    tasks['node3'] = slow(tasks['node3'], 0.8)
+    txn_id = new_txn_id()
+
+    logs = []
+    started = time.monotonic()
+    decision = coordinator.run(txn_id, tasks, ('INSERT', row['titleId'], row), logs, consistency='QUORUM')
+
+    assert decision is True
+    assert time.monotonic() - started < 0.8
+    assert "node3: Not waited for (QUORUM) - commits when it answers." in logs
+    assert replication_results('node1', txn_id) == [('REPLICATION_SUCCESS', 3)]
+    assert rows('node3', row['titleId']) == [row]
+
+
+def test_quorum_outvoted_participant_that_fails_again_is_logged_for_replication(coordinator):
+    row = movie('tt9200002', region='FR')
+    put_row('node2', dict(row, title='Already there'))
+    txn_id = new_txn_id()
+
+    logs = []
+    decision = coordinator.run(txn_id, insert_tasks(row, {'node1', 'node2', 'node3'}),
+                               ('INSERT', row['titleId'], row), logs, consistency='QUORUM')
+
+    assert decision is True
+    assert any(line.startswith('node2: Failed to Prepare') and 'Quorum still reachable' in line for line in logs)
+    assert replication_results('node1', txn_id) == [('REPLICATION_FAILED', 2)]
+    assert rows('node1', row['titleId']) == [row] and rows('node3', row['titleId']) == [row]
+
+
+def test_async_applies_the_other_participants_in_the_background(coordinator):
+    row = movie('tt9200003', region='US')
+    txn_id = new_txn_id()
+
+    logs = []
+    decision = coordinator.run(txn_id, insert_tasks(row, {'node1', 'node2', 'node3'}),
+                               ('INSERT', row['titleId'], row), logs, consistency='ASYNC', synchronous={'node1', 'node2'})
+
+    assert decision is True
+    assert "node3: Deferred (ASYNC) - applied in the background." in logs
+    assert log_statuses('node1', txn_id).count('READY_COMMIT') == 2
+    assert replication_results('node1', txn_id) == [('REPLICATION_SUCCESS', 3)]
+    assert rows('node3', row['titleId']) == [row]
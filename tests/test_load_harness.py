@@ -0,0 +1,18 @@
+import pytest
+
+from db_helpers import DB_CONFIG
+from load_harness import DRAIN_TIMEOUT, LoadHarness
+
+
+def test_isolation_levels_are_deduplicated_and_share_the_duration_limit():
+    harness = LoadHarness(None, None, DB_CONFIG, max_duration=20)
+    cfg = harness.configure({"duration": 60, "isolation_levels": ["serializable", "SERIALIZABLE", "READ COMMITTED"]})
+
+    assert cfg['isolation_levels'] == ['SERIALIZABLE', 'READ COMMITTED']
+    assert len(cfg['isolation_levels']) * (cfg['duration'] + DRAIN_TIMEOUT) <= 20
+
+
+def test_too_many_levels_for_the_limit_are_refused():
+    harness = LoadHarness(None, None, DB_CONFIG, max_duration=5)
+    with pytest.raises(ValueError):
+        harness.configure({"isolation_levels": ["READ UNCOMMITTED", "READ COMMITTED", "REPEATABLE READ"]})
@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import insert_tasks, log_statuses, movie, new_txn_id, rows
+
+
+def fail_flushes_with(writer, status):
+    """Makes every group commit holding a record with `status` fail, as if the node dropped the connection."""
+    flush = writer._flush
+
+    def failing_flush(batch):
+        if any(ticket.row[-1] == status for ticket in batch):
+            factory, writer.connection_factory = writer.connection_factory, lambda: None
+            writer._conn = None
+            try:
+                return flush(batch)
+            finally:
+                writer.connection_factory = factory
+        return flush(batch)
+
+    writer._flush = failing_flush
+
+
+def test_lost_prepare_record_logs_abort_and_is_never_replayed(coordinator, log_manager):
+    fail_flushes_with(log_manager.log_writer, 'PREPARE_SENT')
+    row = movie('tt9000001', region='US')
+    txn_id = new_txn_id()
+
+    logs = []
+    decision = coordinator.run(txn_id, insert_tasks(row, {'node1', 'node2'}), ('INSERT', row['titleId'], row), logs)
+
+    assert decision is False
+    assert "CRITICAL: Global Log Failure. FORCING ABORT." in logs
+    assert rows('node1', row['titleId']) == [] and rows('node2', row['titleId']) == []
+    statuses = log_statuses('node1', txn_id)
+    assert 'GLOBAL_COMMIT' not in statuses and statuses[-1] == 'GLOBAL_ABORT'
+
+    results = log_manager.recover_missed_writes()
+    assert results['node1']['committed'] == 0
+    assert rows('node1', row['titleId']) == []
+
+
+def test_lost_ready_record_logs_abort(coordinator, log_manager):
+    fail_flushes_with(log_manager.log_writer, 'READY_COMMIT')
+    row = movie('tt9000002', region='FR')
+    txn_id = new_txn_id()
+
+    decision = coordinator.run(txn_id, insert_tasks(row, {'node1', 'node3'}), ('INSERT', row['titleId'], row), [])
+
+    assert decision is False
+    assert 'GLOBAL_COMMIT' not in log_statuses('node1', txn_id)
+    log_manager.recover_missed_writes()
+    assert rows('node1', row['titleId']) == [] and rows('node3', row['titleId']) == []
+
+
+def test_decision_forgets_the_transactions_records(coordinator, log_manager):
+    row = movie('tt9000003')
+    decision = coordinator.run(new_txn_id(), insert_tasks(row, {'node1', 'node2'}), ('INSERT', row['titleId'], row), [])
+    log_manager.log_replication_result(new_txn_id(), 2)
+
+    assert decision is True
+    assert log_manager.log_writer._tracked == {}
+
+
+class _LockCursor:
+    """Answers GET_LOCK with `result` and records every other statement."""
+
+    def __init__(self, result):
+        self.result = result
+        self.statements = []
+        self._row = None
+
+    def execute(self, query, params=()):
+        self._row = (self.result,) if 'GET_LOCK' in query else None
+        self.statements.append(query)
+
+    def fetchone(self):
+        return self._row
+
+
+@pytest.mark.parametrize('lock_result', [0, None])
+def test_migration_does_not_run_without_its_lock(log_manager, lock_result):
+    cursor = _LockCursor(lock_result)
+    with pytest.raises(RuntimeError):
+        log_manager._migrate_log_table(None, cursor)
+    assert cursor.statements == ["SELECT GET_LOCK('transaction_logs_migration', 300)"]
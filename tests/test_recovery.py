@@ -0,0 +1,107 @@
+import time
+import uuid
+
+import pytest
+
+import applied_transactions
+from conftest import movie, new_txn_id, put_row, rows
+from db_helpers import get_db_connection
+from log_manager import DistributedLogManager
+
+
+@pytest.fixture
+def peers(cluster):
+    """Log managers of node2 and node3, whose logs node1 catches up from."""
+    managers = {}
+    for node_id in (2, 3):
+        manager = DistributedLogManager(node_id)
+        manager.initialize_log_table()
+        managers[f'node{node_id}'] = manager
+    return managers
+
+
+def committed(manager, op_type, row, txn_id=None):
+    """Logs a committed 2PC transaction writing row on manager's node; returns its id."""
+    txn_id = txn_id or new_txn_id()
+    manager.log_prepare_start(txn_id)
+    manager.log_ready_status(txn_id, op_type, row['titleId'], row)
+    assert manager.log_global_commit(txn_id)['success']
+    time.sleep(0.01)    # distinct decision timestamps
+    return txn_id
+
+
+def put_row_title(node_key, title_id, title):
+    """Renames title_id straight on node_key, as a later write would."""
+    conn = get_db_connection(node_key)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE movies SET title = %s WHERE titleId = %s", (title, title_id))
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_peers_are_replayed_in_decision_order(log_manager, peers):
+    row = movie('tt9300001')
+    put_row('node1', row)
+    # Decided on node3 first, then on node2: replaying node2's log before node3's would end on 'First'
+    committed(peers['node3'], 'UPDATE', dict(row, title='First'))
+    committed(peers['node2'], 'UPDATE', dict(row, title='Second'))
+    log_manager.recovery_page_size = 1
+
+    results = log_manager.catch_up(['node2', 'node3'])
+
+    assert results['node2']['applied'] == 1 and results['node3']['applied'] == 1
+    assert rows('node1', row['titleId'])[0]['title'] == 'Second'
+
+
+def test_insert_update_delete_across_peers(log_manager, peers):
+    row = movie('tt9300002', region='FR')
+    committed(peers['node3'], 'INSERT', row)
+    committed(peers['node2'], 'UPDATE', dict(row, title='Renamed'))
+    kept = movie('tt9300003', region='JP')
+    committed(peers['node2'], 'INSERT', kept)
+    committed(peers['node3'], 'DELETE', {'titleId': row['titleId']})
+
+    log_manager.catch_up(['node2', 'node3'])
+
+    assert rows('node1', row['titleId']) == []
+    assert rows('node1', kept['titleId']) == [kept]
+
+
+def test_already_applied_and_aborted_transactions_are_skipped(log_manager, peers):
+    row = movie('tt9300004')
+    put_row('node1', dict(row, title='Newer'))
+    stale = committed(peers['node2'], 'UPDATE', dict(row, title='Stale'))
+    conn = get_db_connection('node1')
+    try:
+        applied_transactions.ensure_table(conn, 'node1')
+        applied_transactions.mark_applied(conn, [uuid.UUID(stale).bytes])
+        conn.commit()
+    finally:
+        conn.close()
+    aborted = new_txn_id()
+    peers['node3'].log_prepare_start(aborted)
+    peers['node3'].log_ready_status(aborted, 'UPDATE', row['titleId'], dict(row, title='Aborted'))
+    peers['node3'].log_global_commit(aborted, commit=False)
+
+    results = log_manager.catch_up(['node2', 'node3'])
+
+    assert results['node2']['already_applied'] == 1 and results['node2']['applied'] == 0
+    assert results['node3']['committed'] == 0
+    assert rows('node1', row['titleId'])[0]['title'] == 'Newer'
+
+
+def test_a_transaction_is_replayed_once(log_manager, peers):
+    row = movie('tt9300005')
+    put_row('node1', row)
+    committed(peers['node2'], 'UPDATE', dict(row, title='Replayed'))
+
+    first = log_manager.catch_up(['node2'])
+    put_row_title('node1', row['titleId'], 'Written since')
+    second = log_manager.catch_up(['node2'])
+
+    assert first['node2']['applied'] == 1
+    assert second['node2']['already_applied'] == 1 and second['node2']['applied'] == 0
+    assert rows('node1', row['titleId'])[0]['title'] == 'Written since'
+
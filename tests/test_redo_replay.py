@@ -0,0 +1,79 @@
+from conftest import movie, put_row, rows
+from redo_replay import RedoReplayEngine, collapse
+
+KEY = 'tt9400001'
+
+
+def entry(op_type, image=None, key=KEY):
+    return {'operation_type': op_type, 'record_key': key, 'new_value': image}
+
+
+def test_insert_update_delete_collapses_to_a_delete():
+    state = collapse([
+        entry('INSERT', movie(KEY)),
+        entry('UPDATE', {'title': 'Renamed'}),
+        entry('DELETE'),
+    ])[KEY]
+
+    assert state.delete is True and state.update == {} and state.rows == {}
+
+
+def test_insert_then_update_writes_the_updated_row_and_updates_existing_ones():
+    state = collapse([
+        entry('INSERT', movie(KEY, ordering=2)),
+        entry('UPDATE', '{"title": "Renamed"}'),
+    ])[KEY]
+
+    assert state.delete is False
+    assert state.update == {'title': 'Renamed'}
+    assert state.rows == {2: dict(movie(KEY, ordering=2), title='Renamed')}
+
+
+def test_delete_then_insert_update_keeps_only_the_new_row():
+    state = collapse([
+        entry('UPDATE', {'title': 'Lost'}),
+        entry('DELETE'),
+        entry('INSERT', movie(KEY)),
+        entry('UPDATE', {'title': 'Renamed', 'ordering': 3}),
+    ])[KEY]
+
+    # The UPDATE after the DELETE has no older rows to reach: only the re-inserted row, re-keyed by its new ordering
+    assert state.delete is True and state.update == {}
+    assert state.rows == {3: dict(movie(KEY), title='Renamed', ordering=3)}
+
+
+def test_keys_collapse_independently():
+    states = collapse([
+        entry('INSERT', movie(KEY)),
+        entry('DELETE', key='tt9400002'),
+        entry('UPDATE', {'title': 'Renamed'}),
+    ])
+
+    assert states[KEY].rows[1]['title'] == 'Renamed' and states[KEY].delete is False
+    assert states['tt9400002'].delete is True
+
+
+def test_apply_matches_replaying_every_entry_in_order(cluster):
+    existing = movie('tt9400003', ordering=1, title='Old')
+    put_row('node1', existing)
+    put_row('node1', movie('tt9400004'))
+    entries = [
+        entry('UPDATE', {'title': 'Renamed'}, key='tt9400003'),
+        entry('INSERT', movie('tt9400003', ordering=2, title='Second'), key='tt9400003'),
+        entry('UPDATE', {'types': 'dvd'}, key='tt9400003'),
+        entry('INSERT', movie('tt9400005', region='FR'), key='tt9400005'),
+        entry('UPDATE', {'title': 'Gone soon'}, key='tt9400004'),
+        entry('DELETE', key='tt9400004'),
+        entry('INSERT', movie('tt9400004', ordering=7, title='Back'), key='tt9400004'),
+    ]
+
+    engine = RedoReplayEngine('node1', batch_size=2)
+    result = engine.apply(entries)
+    # Replaying the same entries again (e.g. after a crash before the checkpoint moved) changes nothing
+    engine.apply(entries)
+
+    assert result['success'] and result['failed'] == 0 and result['keys'] == 3 and result['batches'] == 2
+    assert rows('node1', 'tt9400003') == [dict(existing, title='Renamed', types='dvd'),
+                                          dict(movie('tt9400003', ordering=2, title='Second'), types='dvd')]
+    assert rows('node1', 'tt9400004') == [movie('tt9400004', ordering=7, title='Back')]
+    assert rows('node1', 'tt9400005') == [movie('tt9400005', region='FR')]
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import deque
+
+
+class TransactionTrace:
+    """
+    Timed spans of one 2PC transaction: one per phase and participant
+    (checkout, prepare, ready_log, global_log, commit), with offsets from the
+    start of the transaction. Spans may be added from any thread.
+    """
+
+    def __init__(self, txn_id):
+        self.txn_id = txn_id
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.total = None
+        self.decision = None
+        self.action = None
+        self.consistency = None
+        self.logs = None
+        self.spans = []
+
+    def add(self, phase, node_key, started, ended, error=None):
+        """started / ended are time.monotonic() values."""
+        span = {"phase": phase, "node": node_key,
+                "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round((ended - started) * 1000, 3)}
+        if error is not None:
+            span["error"] = str(error)
+        self.spans.append(span)
+
+    def finish(self, decision):
+        self.total = time.monotonic() - self.started
+        self.decision = decision
+
+    def to_dict(self, with_logs=False):
+        trace = {
+            "txn_id": self.txn_id,
+            "action": self.action,
+            "consistency": self.consistency,
+            "decision": None if self.decision is None else ("COMMITTED" if self.decision else "ABORTED"),
+            "started_at": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            "total_ms": round(self.total * 1000, 3) if self.total is not None else None,
+            "spans": sorted(self.spans, key=lambda span: span['start_ms']),
+        }
+        if with_logs:
+            trace["logs"] = self.logs
+        return trace
+
+
+class SlowTransactionLog:
+    """The last `capacity` transactions that took at least threshold_ms, newest first."""
+
+    def __init__(self, threshold_ms=1000, capacity=100):
+        self.threshold_ms = threshold_ms
+        self._traces = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def offer(self, trace):
+        """Trace listener: keeps the trace if it was slow."""
+        if trace.total is None or trace.total * 1000 < self.threshold_ms:
+            return
+        with self._lock:
+            self._traces.append(trace)
+
+    def recent(self, limit=None, min_ms=None):
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        if min_ms is not None:
+            traces = [trace for trace in traces if trace.total * 1000 >= min_ms]
+        return [trace.to_dict(with_logs=True) for trace in traces[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return {"threshold_ms": self.threshold_ms, "captured": len(self._traces), "capacity": self._traces.maxlen}